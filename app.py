@@ -2,25 +2,36 @@
 from flask import Flask, jsonify,render_template
 from flask_cors import CORS
 
-from controllers.chunk_controller import chunk_bp
-from controllers.document_controller import document_bp
-from controllers.search_controller import search_bp
 from utils.config import config
 import logging
 
-# 配置日志
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s %(levelname)s [%(filename)s:%(lineno)d] %(message)s',
-    handlers=[
-        logging.FileHandler('app.log'),
-        logging.StreamHandler()
-    ]
-)
 logger = logging.getLogger(__name__)
 
 
+def _configure_logging():
+    """配置日志"""
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s %(levelname)s [%(filename)s:%(lineno)d] %(message)s',
+        handlers=[
+            logging.FileHandler('app.log'),
+            logging.StreamHandler()
+        ]
+    )
+
+
 def create_app():
+    # 控制器和各客户端在这里导入（导入时初始化ES、MySQL、MinIO等单例）：
+    # 文档解析子进程会以 __mp_main__ 导入本模块，模块顶层不能有这些副作用
+    _configure_logging()
+    from controllers.chunk_controller import chunk_bp
+    from controllers.document_controller import document_bp, document_service
+    from controllers.index_controller import index_bp
+    from controllers.job_controller import job_bp
+    from controllers.search_controller import search_bp
+    from core.elasticsearch_client import es_client
+    from core.kb_index import kb_index_manager
+
     app = Flask(__name__)
     CORS(app)  # 启用CORS
 
@@ -61,6 +72,8 @@ def create_app():
     app.register_blueprint(document_bp, url_prefix='/api/documents')
     app.register_blueprint(chunk_bp, url_prefix='/api/chunks')
     app.register_blueprint(search_bp, url_prefix='/api/search')
+    app.register_blueprint(job_bp, url_prefix='/api/jobs')
+    app.register_blueprint(index_bp, url_prefix='/api/indices')
 
     # 健康检查路由
     @app.route('/api/health', methods=['GET'])
@@ -77,6 +90,16 @@ def create_app():
         logger.error(f"服务器内部错误: {error}")
         return jsonify({"error": "服务器内部错误，请稍后再试"}), 500
 
+    # 注册存储脚本和检索模板，检索时按id引用
+    es_client.register_stored_scripts()
+
+    # 安装知识库索引模板，索引按模板自动获得mapping和settings
+    if not kb_index_manager.install_templates():
+        logger.warning("知识库索引模板安装失败，新建索引时仍会显式指定mapping")
+
+    # 清理上次未完成删除的文档，之后定时清理
+    document_service.start_tombstone_purger()
+
     logger.info(f"应用启动: {config.get('app.host')}:{config.get('app.port')}")
 
 
@@ -1,5 +1,7 @@
 from .document_controller import *
 from .chunk_controller import *
 from .search_controller import *
+from .job_controller import *
+from .index_controller import *
 
-__all__ = ["document_controller", "chunk_controller", "search_controller"]
\ No newline at end of file
+__all__ = ["document_controller", "chunk_controller", "search_controller", "job_controller", "index_controller"]
\ No newline at end of file
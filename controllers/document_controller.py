@@ -26,11 +26,12 @@ def upload_document():
         if file.filename == '':
             return jsonify({"error": "文件名不能为空"}), 400
 
-        # 读取文件数据
-        # file_data = file.stream.read()
+        # 后台任务队列已满时直接拒绝，避免文件落盘后无法处理
+        if not document_service.can_accept_job():
+            return jsonify({"error": "系统繁忙，请稍后重试"}), 503
 
-        # 调用服务创建文档
-        document_id = document_service.create_document(
+        # 调用服务创建文档，文档解析、向量化、索引在后台任务中完成
+        result = document_service.create_document(
             document_name=file.filename,
             kb_id=kb_id,
             file=file,
@@ -38,12 +39,21 @@ def upload_document():
             created_by=created_by
         )
 
-        if document_id:
+        # 预检查之后队列仍可能被其他请求占满，任务未能提交时文档已标记失败
+        if result and result.get('rejected'):
+            return jsonify({
+                "error": "系统繁忙，请稍后重试",
+                "document_id": result['document_id'],
+                "job_id": result['job_id']
+            }), 503
+
+        if result:
             return jsonify({
                 "success": True,
-                "document_id": document_id,
-                "message": "文档上传成功"
-            }), 201
+                "document_id": result['document_id'],
+                "job_id": result['job_id'],
+                "message": "文档上传成功，正在后台处理"
+            }), 202
         else:
             return jsonify({"error": "文档上传失败"}), 500
 
@@ -117,6 +127,82 @@ def modify_status():
         return jsonify({"error": str(e)}), 500
 
 
+@document_bp.route('/batch_delete', methods=['POST'])
+def batch_delete_documents():
+    """批量删除文档（标记删除后立即返回，后台清理分块和文件）"""
+    try:
+        data = request.get_json()
+        document_ids = data.get('document_ids') or []
+        if not document_ids:
+            return jsonify({"error": "文档ID列表不能为空"}), 400
+
+        result = document_service.batch_delete_documents(document_ids)
+        return jsonify({
+            "success": not result['failed'],
+            **result
+        }), 200
+
+    except Exception as e:
+        logger.error(f"批量删除文档异常: {e}")
+        return jsonify({"error": str(e)}), 500
+
+
+@document_bp.route('/kb/<kb_id>', methods=['DELETE'])
+def drop_knowledge_base(kb_id):
+    """删除整个知识库（索引、文档、分块、文件）"""
+    try:
+        success = document_service.drop_knowledge_base(kb_id)
+        if success:
+            return jsonify({
+                "success": True,
+                "message": "知识库删除成功"
+            }), 200
+        else:
+            return jsonify({"error": "知识库删除失败"}), 500
+
+    except Exception as e:
+        logger.error(f"删除知识库异常: {e}")
+        return jsonify({"error": str(e)}), 500
+
+
+@document_bp.route('/batch_modify_status', methods=['POST'])
+def batch_modify_status():
+    """批量修改文档状态【启用\禁用】"""
+    try:
+        data = request.get_json()
+        document_ids = data.get('document_ids') or []
+        document_status = data.get('document_status')
+
+        if not document_ids:
+            return jsonify({"error": "文档ID列表不能为空"}), 400
+        if document_status not in [0, 1]:
+            return jsonify({"error": "状态类型不对，只能是1或0"}), 400
+
+        result = document_service.batch_modify_status(document_ids, document_status)
+        return jsonify({
+            "success": not result['failed'],
+            **result
+        }), 200
+
+    except Exception as e:
+        logger.error(f"批量修改文档状态异常: {e}")
+        return jsonify({"error": str(e)}), 500
+
+
+@document_bp.route('/status_tasks/<task_id>', methods=['GET'])
+def get_status_task(task_id):
+    """查询异步修改文档状态任务的进度"""
+    try:
+        task = document_service.get_status_task(task_id)
+        if task:
+            return jsonify(task), 200
+        else:
+            return jsonify({"error": "任务不存在"}), 404
+
+    except Exception as e:
+        logger.error(f"查询状态任务异常: {e}")
+        return jsonify({"error": str(e)}), 500
+
 
 #
 # @document_bp.route('/<document_id>', methods=['GET'])
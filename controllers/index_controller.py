@@ -0,0 +1,121 @@
+import logging
+
+from flask import Blueprint, request, jsonify
+
+from core.elasticsearch_client import VECTOR_INDEX_TYPES
+from core.kb_index import kb_index_manager
+from services.index_benchmark_service import IndexBenchmarkService
+from services.kb_index_service import KbIndexService
+
+logger = logging.getLogger(__name__)
+index_bp = Blueprint('index', __name__)
+
+index_benchmark_service = IndexBenchmarkService()
+kb_index_service = KbIndexService()
+
+
+@index_bp.route('/benchmark', methods=['POST'])
+def start_benchmark():
+    """提交向量索引参数对比任务：按不同参数重建知识库索引，对比内存占用、召回率和检索耗时"""
+    try:
+        request_json_data = request.get_json()
+
+        kb_id = request_json_data.get('kb_id')
+        options = request_json_data.get('options') or []
+        sample_size = int(request_json_data.get('sample_size', 100))
+        top_k = int(request_json_data.get('top_k', 10))
+        num_candidates = request_json_data.get('num_candidates')
+        keep_indices = request_json_data.get('keep_indices') in (True, 'true', 'on', '1', 1)
+
+        if not kb_id:
+            return jsonify({"error": "知识库ID不能为空"}), 400
+
+        if not isinstance(options, list) or not options:
+            return jsonify({"error": "options必须是非空列表"}), 400
+
+        for option in options:
+            if not isinstance(option, dict) or option.get('type') not in VECTOR_INDEX_TYPES:
+                return jsonify({"error": f"不支持的向量索引参数: {option}"}), 400
+
+        benchmark_id = index_benchmark_service.start_benchmark(
+            kb_id=kb_id,
+            options=options,
+            sample_size=sample_size,
+            top_k=top_k,
+            num_candidates=int(num_candidates) if num_candidates else None,
+            keep_indices=keep_indices
+        )
+        if not benchmark_id:
+            return jsonify({"error": "后台任务繁忙，请稍后重试"}), 503
+
+        return jsonify({"success": True, "benchmark_id": benchmark_id}), 202
+
+    except Exception as e:
+        logger.error(f"提交向量索引对比任务异常: {e}")
+        return jsonify({"error": str(e)}), 500
+
+
+@index_bp.route('/benchmark/<benchmark_id>', methods=['GET'])
+def get_benchmark(benchmark_id):
+    """获取向量索引参数对比结果"""
+    try:
+        benchmark = index_benchmark_service.get_benchmark(benchmark_id)
+        if benchmark:
+            return jsonify(benchmark), 200
+        else:
+            return jsonify({"error": "对比任务不存在"}), 404
+
+    except Exception as e:
+        logger.error(f"获取向量索引对比结果异常: {e}")
+        return jsonify({"error": str(e)}), 500
+
+
+@index_bp.route('/<kb_id>', methods=['GET'])
+def get_index_info(kb_id):
+    """获取知识库索引信息：别名、当前版本、所有版本"""
+    try:
+        return jsonify(kb_index_service.get_index_info(kb_id)), 200
+
+    except Exception as e:
+        logger.error(f"获取知识库索引信息异常: {e}")
+        return jsonify({"error": str(e)}), 500
+
+
+@index_bp.route('/<kb_id>/reindex', methods=['POST'])
+def start_reindex(kb_id):
+    """重建知识库索引：后台构建新版本索引，完成后原子切换别名并删除旧版本"""
+    try:
+        request_json_data = request.get_json(silent=True) or {}
+        vector_options = request_json_data.get('vector_options')
+
+        if vector_options is not None and (not isinstance(vector_options, dict)
+                                           or vector_options.get('type') not in VECTOR_INDEX_TYPES):
+            return jsonify({"error": f"不支持的向量索引参数: {vector_options}"}), 400
+
+        if not kb_index_manager.supports_versioning:
+            return jsonify({"error": f"{kb_index_manager.layout}布局不支持按知识库重建索引"}), 400
+
+        task_id = kb_index_service.start_reindex(kb_id, vector_options)
+        if not task_id:
+            return jsonify({"error": "该知识库正在重建索引或后台任务繁忙，请稍后重试"}), 503
+
+        return jsonify({"success": True, "task_id": task_id}), 202
+
+    except Exception as e:
+        logger.error(f"提交重建索引任务异常: {e}")
+        return jsonify({"error": str(e)}), 500
+
+
+@index_bp.route('/reindex_tasks/<task_id>', methods=['GET'])
+def get_reindex_task(task_id):
+    """获取重建索引任务状态"""
+    try:
+        task = kb_index_service.get_reindex_task(task_id)
+        if task:
+            return jsonify(task), 200
+        else:
+            return jsonify({"error": "任务不存在"}), 404
+
+    except Exception as e:
+        logger.error(f"获取重建索引任务异常: {e}")
+        return jsonify({"error": str(e)}), 500
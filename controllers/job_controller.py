@@ -0,0 +1,50 @@
+import logging
+
+from flask import Blueprint, request, jsonify
+
+from services.ingest_job_service import IngestJobService
+
+logger = logging.getLogger(__name__)
+job_bp = Blueprint('job', __name__)
+
+ingest_job_service = IngestJobService()
+
+
+@job_bp.route('/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """获取入库任务状态及各阶段进度"""
+    try:
+        job = ingest_job_service.get_job(job_id)
+        if job:
+            return jsonify(job), 200
+        else:
+            return jsonify({"error": "任务不存在"}), 404
+
+    except Exception as e:
+        logger.error(f"获取任务异常: {e}")
+        return jsonify({"error": str(e)}), 500
+
+
+@job_bp.route('page', methods=['GET'])
+def list_jobs():
+    """获取入库任务列表"""
+    try:
+        kb_id = request.args.get('kb_id')
+        document_id = request.args.get('document_id')
+        job_status = request.args.get('job_status')
+        page = int(request.args.get('page', 1))
+        per_page = int(request.args.get('per_page', 10))
+
+        result = ingest_job_service.list_jobs(
+            kb_id=kb_id,
+            document_id=document_id,
+            job_status=int(job_status) if job_status not in (None, '') else None,
+            page=page,
+            per_page=per_page
+        )
+
+        return jsonify(result), 200
+
+    except Exception as e:
+        logger.error(f"获取任务列表异常: {e}")
+        return jsonify({"error": str(e)}), 500
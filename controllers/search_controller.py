@@ -2,13 +2,119 @@ import logging
 
 from flask import Blueprint, request, jsonify
 
-from services.search_service import SearchService, SearchType
+from core.elasticsearch_client import es_client
+from services.search_service import SearchService, SearchType, MERGE_SCORE, MERGE_RRF
 
 logger = logging.getLogger(__name__)
 search_bp = Blueprint('search', __name__)
 search_service = SearchService()
 
 
+def _parse_kb_ids(request_json_data: dict):
+    """
+    解析知识库参数：kb_ids（列表，跨知识库检索）优先于 kb_id
+    返回 (知识库ID或知识库ID列表, 错误信息)
+    """
+    kb_ids = request_json_data.get('kb_ids')
+    if kb_ids is None:
+        kb_id = request_json_data.get('kb_id')
+        return (kb_id, None) if kb_id and isinstance(kb_id, str) else (None, "知识库ID不能为空")
+
+    if not isinstance(kb_ids, list) or not kb_ids or not all(kb_id and isinstance(kb_id, str) for kb_id in kb_ids):
+        return None, "kb_ids必须是非空的知识库ID列表"
+    if len(kb_ids) > search_service.federated_max_kbs:
+        return None, f"单次最多检索{search_service.federated_max_kbs}个知识库"
+    return kb_ids, None
+
+
+def _parse_number(request_json_data: dict, name: str, converter, default=None):
+    """读取数值参数，未传或为空时返回default，格式错误时抛出ValueError"""
+    value = request_json_data.get(name)
+    if value is None or value == '':
+        return default
+    try:
+        return converter(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"{name}必须是数字")
+
+
+def _parse_search_params(request_json_data: dict):
+    """解析并校验检索参数，返回 (search 的参数, 错误信息)"""
+    kb_id, error = _parse_kb_ids(request_json_data)
+    if error:
+        return None, error
+    query = request_json_data.get('query', '')
+    search_type = request_json_data.get('search_type', 'hybrid')
+    try:
+        top_k = _parse_number(request_json_data, 'top_k', int, 3)
+        min_score = _parse_number(request_json_data, 'min_score', float, 0.5)
+        text_weight = _parse_number(request_json_data, 'text_weight', float, 0.3)
+        vector_weight = _parse_number(request_json_data, 'vector_weight', float, 0.7)
+        # RRF混合检索参数，为空时使用配置
+        text_window_size = _parse_number(request_json_data, 'text_window_size', int) or None
+        vector_window_size = _parse_number(request_json_data, 'vector_window_size', int) or None
+        rrf_rank_constant = _parse_number(request_json_data, 'rrf_rank_constant', int) or None
+        # 两阶段混合检索参数：参与向量重打分的BM25结果数，为空时使用配置
+        rescore_window_size = _parse_number(request_json_data, 'rescore_window_size', int) or None
+    except ValueError as e:
+        return None, str(e)
+    use_score_relevance = request_json_data.get('use_score') in ('on', True)
+    # 向量检索模式 knn/exact，为空时使用配置
+    vector_mode = request_json_data.get('vector_mode')
+    # 检索范围过滤：文档ID列表、分块创建时间范围；默认只检索启用的分块
+    document_ids = request_json_data.get('document_ids') or None
+    created_from = request_json_data.get('created_from') or None
+    created_to = request_json_data.get('created_to') or None
+    include_disabled = request_json_data.get('include_disabled') in (True, 'true', 'on', '1', 1)
+    # 跨知识库检索的结果合并方式：score（按得分）/ rrf（按各知识库内排名融合）
+    merge = request_json_data.get('merge') or MERGE_SCORE
+
+    if not query or not isinstance(query, str):
+        return None, "搜索内容不能为空"
+
+    if not 0 < top_k <= es_client.knn_max_num_candidates:
+        return None, f"top_k必须在1到{es_client.knn_max_num_candidates}之间"
+
+    if vector_mode and vector_mode not in ('knn', 'exact'):
+        return None, f"不支持的向量检索模式: {vector_mode}"
+
+    if document_ids is not None and not isinstance(document_ids, list):
+        return None, "document_ids必须是列表"
+
+    if merge not in (MERGE_SCORE, MERGE_RRF):
+        return None, f"不支持的合并方式: {merge}"
+
+    if rescore_window_size and not 0 < rescore_window_size <= es_client.max_rescore_window:
+        return None, f"rescore_window_size必须在1到{es_client.max_rescore_window}之间"
+
+    # 转换搜索类型
+    try:
+        search_type_enum = SearchType(str(search_type).lower())
+    except ValueError:
+        return None, f"不支持的搜索类型: {search_type}"
+
+    return {
+        'kb_id': kb_id,
+        'query': query,
+        'search_type': search_type_enum,
+        'top_k': top_k,
+        'min_score': min_score,
+        'use_score_relevance': use_score_relevance,
+        'text_weight': text_weight,
+        'vector_weight': vector_weight,
+        'vector_mode': vector_mode,
+        'text_window_size': text_window_size,
+        'vector_window_size': vector_window_size,
+        'rrf_rank_constant': rrf_rank_constant,
+        'document_ids': document_ids,
+        'created_from': created_from,
+        'created_to': created_to,
+        'include_disabled': include_disabled,
+        'rescore_window_size': rescore_window_size,
+        'merge': merge
+    }, None
+
+
 @search_bp.route('', methods=['POST'])
 def search():
     """搜索接口"""
@@ -16,42 +122,16 @@ def search():
 
         request_json_data = request.get_json()
 
-        kb_id = request_json_data.get('kb_id')
-        query = request_json_data.get('query', '')
-        search_type = request_json_data.get('search_type', 'hybrid')
-        top_k = int(request_json_data.get('top_k', 3))
-        min_score = float(request_json_data.get('min_score', 0.5))
-        text_weight = float(request_json_data.get('text_weight', 0.3))
-        vector_weight = float(request_json_data.get('vector_weight', 0.7))
-        use_score_relevance = 'on' == request_json_data.get('use_score')
-
-        if not kb_id:
-            return jsonify({"error": "知识库ID不能为空"}), 400
-
-        if not query:
-            return jsonify({"error": "搜索内容不能为空"}), 400
-
-        # 转换搜索类型
-        try:
-            search_type_enum = SearchType(search_type.lower())
-        except ValueError:
-            return jsonify({"error": f"不支持的搜索类型: {search_type}"}), 400
+        params, error = _parse_search_params(request_json_data)
+        if error:
+            return jsonify({"error": error}), 400
 
         # 执行搜索
-        results = search_service.search(
-            kb_id=kb_id,
-            query=query,
-            search_type=search_type_enum,
-            top_k=top_k,
-            min_score=min_score,
-            use_score_relevance = use_score_relevance,
-            text_weight=text_weight,
-            vector_weight=vector_weight
-        )
+        results = search_service.search(**params)
 
         return jsonify({
-            "kb_id": kb_id,
-            "query": query,
+            "kb_id": params['kb_id'],
+            "query": params['query'],
             "results": results,
             "total": len(results)
         }), 200
@@ -60,6 +140,59 @@ def search():
         logger.error(f"搜索接口异常: {e}")
         return jsonify({"error": str(e)}), 500
 
+
+@search_bp.route('/batch', methods=['POST'])
+def search_batch():
+    """
+    批量搜索接口
+    queries 中每一项的参数与 /api/search 相同，未指定的参数使用请求顶层的同名参数（如共用的 kb_id、search_type）
+    """
+    try:
+        request_json_data = request.get_json()
+        queries = request_json_data.get('queries')
+
+        if not queries or not isinstance(queries, list):
+            return jsonify({"error": "queries必须是非空列表"}), 400
+
+        if len(queries) > search_service.batch_max_queries:
+            return jsonify({"error": f"单次最多{search_service.batch_max_queries}个查询"}), 400
+
+        shared = {key: value for key, value in request_json_data.items() if key != 'queries'}
+        requests = []
+        for position, item in enumerate(queries):
+            if not isinstance(item, dict):
+                return jsonify({"error": f"第{position + 1}个查询格式错误"}), 400
+            item_shared = shared
+            # 查询自己指定了知识库时，不使用顶层的 kb_id / kb_ids
+            if 'kb_id' in item or 'kb_ids' in item:
+                item_shared = {key: value for key, value in shared.items() if key not in ('kb_id', 'kb_ids')}
+            params, error = _parse_search_params({**item_shared, **item})
+            if error:
+                return jsonify({"error": f"第{position + 1}个查询: {error}"}), 400
+            requests.append(params)
+
+        # 每个查询按知识库和检索路数展开为多个子检索，限制展开后的总数
+        search_count = sum(search_service.count_searches(params) for params in requests)
+        if search_count > search_service.batch_max_searches:
+            return jsonify({"error": f"展开后的子检索数{search_count}超过上限{search_service.batch_max_searches}"}), 400
+
+        outputs = search_service.search_batch(requests)
+
+        return jsonify({
+            "results": [{
+                "kb_id": params['kb_id'],
+                "query": params['query'],
+                "results": output['results'],
+                "total": len(output['results']),
+                "error": output['error']
+            } for params, output in zip(requests, outputs)],
+            "total": len(outputs)
+        }), 200
+
+    except Exception as e:
+        logger.error(f"批量搜索接口异常: {e}")
+        return jsonify({"error": str(e)}), 500
+
 @search_bp.route('chat', methods=['POST'])
 def chat():
     """聊天接口"""
@@ -67,10 +200,11 @@ def chat():
 
         request_json_data = request.get_json()
 
-        kb_id = request_json_data.get('kb_id')
+        # kb_ids 为列表时跨知识库检索
+        kb_id, error = _parse_kb_ids(request_json_data)
         query = request_json_data.get('query', '')
-        if not kb_id:
-            return jsonify({"error": "知识库ID不能为空"}), 400
+        if error:
+            return jsonify({"error": error}), 400
 
         if not query:
             return jsonify({"error": "搜索内容不能为空"}), 400
@@ -119,3 +253,48 @@ def get_similar_chunks():
         logger.error(f"获取相似分块异常: {e}")
         return jsonify({"error": str(e)}), 500
 
+
+@search_bp.route('/similar/batch', methods=['POST'])
+def get_similar_chunks_batch():
+    """批量获取相似分块"""
+    try:
+        request_json_data = request.get_json()
+        kb_id = request_json_data.get('kb_id')
+        chunk_ids = request_json_data.get('chunk_ids')
+        top_k = int(request_json_data.get('top_k', 5))
+
+        if not kb_id:
+            return jsonify({"error": "知识库ID不能为空"}), 400
+
+        if not chunk_ids or not isinstance(chunk_ids, list):
+            return jsonify({"error": "chunk_ids必须是非空列表"}), 400
+
+        if len(chunk_ids) > search_service.batch_max_queries:
+            return jsonify({"error": f"单次最多{search_service.batch_max_queries}个分块"}), 400
+
+        results = search_service.get_similar_chunks_batch(
+            chunk_ids=chunk_ids,
+            kb_id=kb_id,
+            top_k=top_k
+        )
+
+        return jsonify({
+            "kb_id": kb_id,
+            "results": results,
+            "total": len(results)
+        }), 200
+
+    except Exception as e:
+        logger.error(f"批量获取相似分块异常: {e}")
+        return jsonify({"error": str(e)}), 500
+
+
+@search_bp.route('/cache_stats', methods=['GET'])
+def get_cache_stats():
+    """获取检索相关缓存的命中统计"""
+    try:
+        return jsonify(search_service.get_cache_stats()), 200
+
+    except Exception as e:
+        logger.error(f"获取缓存统计异常: {e}")
+        return jsonify({"error": str(e)}), 500
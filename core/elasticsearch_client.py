@@ -1,12 +1,31 @@
-from elasticsearch import Elasticsearch
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from elasticsearch import Elasticsearch, helpers
 from elasticsearch.exceptions import NotFoundError, RequestError
 from typing import Dict, List, Any, Optional
 import logging
+import math
+import threading
+import time
+from core.es_scripts import (PAINLESS_SCRIPTS, SEARCH_TEMPLATES, SCRIPT_TEXT_SCORE, SCRIPT_VECTOR_SCORE,
+                             SCRIPT_HYBRID_SCORE, TEMPLATE_TEXT_SEARCH, TEMPLATE_HYBRID_SEARCH,
+                             TEMPLATE_EXACT_VECTOR_SEARCH, TEMPLATE_KNN_SEARCH, TEMPLATE_MATCH_SEARCH,
+                             TEMPLATE_HYBRID_RESCORE_SEARCH)
 from utils.config import config
 import json
 
 logger = logging.getLogger(__name__)
 
+# 检索响应只保留需要的字段，减少响应体积和JSON解析开销
+SEARCH_FILTER_PATH = ["took", "hits.total", "hits.hits._id", "hits.hits._index",
+                      "hits.hits._score", "hits.hits._source"]
+MSEARCH_FILTER_PATH = ["responses.took", "responses.status", "responses.error", "responses.hits.total",
+                       "responses.hits.hits._id", "responses.hits.hits._index",
+                       "responses.hits.hits._score", "responses.hits.hits._source"]
+
+# dense_vector 支持的 index_options.type
+VECTOR_INDEX_TYPES = ('hnsw', 'int8_hnsw', 'int4_hnsw', 'bbq_hnsw', 'flat', 'int8_flat', 'int4_flat', 'bbq_flat')
+
 
 class ElasticsearchClient:
     """Elasticsearch客户端封装"""
@@ -14,15 +33,66 @@ class ElasticsearchClient:
     def __init__(self):
         self.client: Elasticsearch  = None
         self.text_max_value = 1.0
+        self.vector_mode = 'knn'
+        self.knn_num_candidates_factor = 10
+        self.knn_max_num_candidates = 10000
+        self.rrf_rank_constant = 60
+        self.rrf_window_size = 50
+        self.rescore_window_size = 100
+        self.max_rescore_window = 10000
+        self.exclude_vector_from_source = False
+        self.vector_dims = 1024
+        self.vector_index_options: Dict[str, Any] = {}
+        self.index_settings: Dict[str, Any] = {}
+        self.stored_scripts_enabled = True
+        self._stored_scripts_ready = False
+        self.bulk_chunk_size = 500
+        self.bulk_max_chunk_bytes = 10 * 1024 * 1024
+        self.bulk_max_retries = 3
+        self.bulk_initial_backoff = 2
+        self.bulk_max_backoff = 60
+        self.bulk_thread_count = 1
+        self.bulk_load_enabled = True
+        self.bulk_load_force_merge = False
+        self.bulk_load_max_num_segments = 1
+        self.bulk_load_min_file_size = 10 * 1024 * 1024
+        # 批量导入模式：索引名 -> {"count": 进行中的导入数, "original": 导入前的settings}
+        self._bulk_load_states: Dict[str, Dict[str, Any]] = {}
+        # 全局锁只保护引用计数；修改/恢复settings的网络请求持有各索引自己的锁，不阻塞其他索引的导入
+        self._bulk_load_lock = threading.Lock()
+        self._bulk_load_index_locks: Dict[str, threading.Lock] = {}
         self._initialize_client()
         self._initialize_other_param()
 
     def _initialize_client(self):
         """初始化ES客户端"""
         es_config = config.get_section('elasticsearch')
+        self.exclude_vector_from_source = es_config.get('exclude_vector_from_source', False)
+        # 新建索引的向量维度与向量索引参数
+        self.vector_dims = config.get('embedding.dimensions', 1024)
+        self.vector_index_options = es_config.get('vector_index') or {}
+        self.index_settings = es_config.get('index_settings') or {}
+        # 检索使用存储脚本和存储检索模板（启动时注册）
+        self.stored_scripts_enabled = es_config.get('stored_scripts', True)
+        # 批量写入：每个请求的文档数和字节数上限、429重试、并发数
+        bulk_config = es_config.get('bulk') or {}
+        self.bulk_chunk_size = bulk_config.get('chunk_size', 500)
+        self.bulk_max_chunk_bytes = bulk_config.get('max_chunk_bytes', 10 * 1024 * 1024)
+        self.bulk_max_retries = bulk_config.get('max_retries', 3)
+        self.bulk_initial_backoff = bulk_config.get('initial_backoff', 2)
+        self.bulk_max_backoff = bulk_config.get('max_backoff', 60)
+        self.bulk_thread_count = bulk_config.get('thread_count', 1)
+        # 批量导入模式
+        bulk_load_config = es_config.get('bulk_load') or {}
+        self.bulk_load_enabled = bulk_load_config.get('enabled', True)
+        self.bulk_load_force_merge = bulk_load_config.get('force_merge', False)
+        self.bulk_load_max_num_segments = bulk_load_config.get('max_num_segments', 1)
+        self.bulk_load_min_file_size = bulk_load_config.get('min_file_size', 10 * 1024 * 1024)
 
         self.client = Elasticsearch(
             hosts=es_config.get('hosts', ['http://localhost:9200']),
+            # 请求体gzip压缩，bulk写入向量时可显著减少传输量
+            http_compress=es_config.get('http_compress', True),
             # basic_auth=(es_config.get('username'), es_config.get('password')),
             # timeout=es_config.get('timeout', 30),
             # max_retries=es_config.get('max_retries', 3),
@@ -36,51 +106,112 @@ class ElasticsearchClient:
     def _initialize_other_param(self):
         es_other_config = config.get_section('retrieval')
         self.text_max_value = es_other_config.get('text_max_value')
+        # 向量检索模式：knn（近似，HNSW）/ exact（script_score 暴力计算）
+        self.vector_mode = es_other_config.get('vector_mode', 'knn')
+        # knn 候选数 = max(size * factor, 100)，不超过上限
+        self.knn_num_candidates_factor = es_other_config.get('knn_num_candidates_factor', 10)
+        self.knn_max_num_candidates = es_other_config.get('knn_max_num_candidates', 10000)
+        # RRF混合检索：排名常数k、每路检索的默认窗口大小
+        self.rrf_rank_constant = es_other_config.get('rrf_rank_constant', 60)
+        self.rrf_window_size = es_other_config.get('rrf_window_size', 50)
+        # 两阶段混合检索：BM25前N个结果参与向量重打分的默认窗口大小
+        self.rescore_window_size = es_other_config.get('rescore_window_size', 100)
+        # rescore窗口上限，与索引的 index.max_rescore_window 一致（ES默认10000），超出时ES拒绝请求
+        self.max_rescore_window = es_other_config.get('max_rescore_window', 10000)
 
-    def create_index(self, index_name: str, mapping: Dict[str, Any] = None,
-                     settings: Dict[str, Any] = None) -> bool:
-        """创建索引"""
-        try:
-            body = {}
-            if mapping:
-                body['mappings'] = mapping
-            if settings:
-                body['settings'] = settings
+    def build_default_mapping(self, vector_options: Dict[str, Any] = None) -> Dict[str, Any]:
+        """
+        知识库索引默认mapping
+        向量维度取 embedding.dimensions，向量索引参数取 elasticsearch.vector_index，vector_options 可覆盖
+        """
+        vector_options = {**self.vector_index_options, **(vector_options or {})}
+        chunk_embedding = {
+            "type": "dense_vector",
+            "dims": self.vector_dims,
+            "index": True,
+            "similarity": "cosine"
+        }
+        index_options = self._build_vector_index_options(vector_options)
+        if index_options:
+            chunk_embedding["index_options"] = index_options
 
-            # 默认mapping
-            if not mapping:
-                body['mappings'] = {
+        mapping = {
+            "properties": {
+                "kb_name": {"type": "text", "analyzer": "ik_max_word"},
+                "kb_id": {"type": "keyword"},
+                "id": {"type": "keyword"},
+                "chunk_content": {
+                    "type": "text",
+                    "analyzer": "ik_max_word",
+                    "search_analyzer": "ik_max_word"
+                },
+                "chunk_embedding": chunk_embedding,
+                "document_id": {"type": "keyword"},
+                "created_time": {"type": "date"},
+                "document_name": {
+                    "type": "text",
+                    "fields": {
+                        "keyword": {"type": "keyword", "ignore_above": 512}
+                    }
+                },
+                "metadata": {
                     "properties": {
-                        "kb_name": {"type": "text", "analyzer": "ik_max_word"},
-                        "kb_id": {"type": "keyword"},
-                        "id": {"type": "keyword"},
-                        "chunk_content": {
-                            "type": "text",
-                            "analyzer": "ik_max_word",
-                            "search_analyzer": "ik_max_word"
-                        },
-                        "chunk_embedding": {
-                            "type": "dense_vector",
-                            "dims": 1024,
-                            "index": True,
-                            "similarity": "cosine"
-                        },
-                        "document_id": {"type": "keyword"},
-                        "document_name": {
-                            "type": "text",
-                            "fields": {
-                                "keyword": {"type": "keyword", "ignore_above": 512}
-                            }
-                        },
-                        "metadata": {
-                            "properties": {
-                                "enabled": {"type": "boolean"},
-                                "chunk_status": {"type": "keyword"},
-                                "document_id": {"type": "keyword"}
-                            }
-                        }
+                        "enabled": {"type": "boolean"},
+                        "chunk_status": {"type": "keyword"},
+                        "document_id": {"type": "keyword"}
                     }
                 }
+            }
+        }
+
+        # 可选：_source中不存储向量，节省磁盘；但分块的局部更新（update）会基于_source重建文档，向量会丢失
+        if self.exclude_vector_from_source:
+            mapping['_source'] = {"excludes": ["chunk_embedding"]}
+        return mapping
+
+    def _build_vector_index_options(self, vector_options: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """构建dense_vector的index_options，type为空时使用ES默认值"""
+        index_type = vector_options.get('type')
+        if not index_type:
+            return None
+        if index_type not in VECTOR_INDEX_TYPES:
+            raise ValueError(f"不支持的向量索引类型: {index_type}")
+
+        index_options = {"type": index_type}
+        if index_type.endswith('hnsw'):
+            for key in ('m', 'ef_construction'):
+                if vector_options.get(key):
+                    index_options[key] = int(vector_options[key])
+        if index_type in ('int8_hnsw', 'int4_hnsw', 'int8_flat', 'int4_flat') \
+                and vector_options.get('confidence_interval') is not None:
+            index_options['confidence_interval'] = float(vector_options['confidence_interval'])
+        return index_options
+
+    def build_default_settings(self, store_preload: List[str] = None) -> Dict[str, Any]:
+        """
+        知识库索引默认settings
+        store_preload 为预加载到页缓存的文件扩展名（如 vex/veq/veb），为空时取配置 elasticsearch.index_settings
+        """
+        settings = {key: value for key, value in self.index_settings.items()
+                    if key != 'store_preload' and value is not None}
+        store_preload = store_preload if store_preload is not None else self.index_settings.get('store_preload')
+        if store_preload:
+            settings['index.store.preload'] = list(store_preload)
+        return settings
+
+    def create_index(self, index_name: str, mapping: Dict[str, Any] = None,
+                     settings: Dict[str, Any] = None, vector_options: Dict[str, Any] = None,
+                     aliases: Dict[str, Dict[str, Any]] = None) -> bool:
+        """创建索引，未指定mapping/settings时使用默认值；aliases 为创建时同时添加的别名"""
+        try:
+            body = {
+                'mappings': mapping or self.build_default_mapping(vector_options)
+            }
+            settings = settings if settings is not None else self.build_default_settings()
+            if settings:
+                body['settings'] = settings
+            if aliases:
+                body['aliases'] = aliases
 
             self.client.indices.create(index=index_name, body=body)
             logger.info(f"索引创建成功: {index_name}")
@@ -117,6 +248,72 @@ class ElasticsearchClient:
             logger.error(f"检查索引存在性失败: {e}")
             return False
 
+    def put_component_template(self, name: str, template: Dict[str, Any]) -> bool:
+        """创建或更新组件模板"""
+        try:
+            self.client.cluster.put_component_template(name=name, template=template)
+            logger.info(f"组件模板已更新: {name}")
+            return True
+        except Exception as e:
+            logger.error(f"组件模板更新失败: {name}, {e}")
+            return False
+
+    def put_index_template(self, name: str, index_patterns: List[str], composed_of: List[str],
+                           template: Dict[str, Any] = None, priority: int = 100) -> bool:
+        """创建或更新可组合索引模板，匹配的索引（包括写入时自动创建的索引）使用模板的mapping和settings"""
+        try:
+            self.client.indices.put_index_template(
+                name=name,
+                index_patterns=index_patterns,
+                composed_of=composed_of,
+                template=template,
+                priority=priority
+            )
+            logger.info(f"索引模板已更新: {name}, {index_patterns}")
+            return True
+        except Exception as e:
+            logger.error(f"索引模板更新失败: {name}, {e}")
+            return False
+
+    def is_alias(self, name: str) -> bool:
+        """名称是否为别名"""
+        try:
+            return bool(self.client.indices.exists_alias(name=name))
+        except Exception as e:
+            logger.error(f"检查别名失败: {e}")
+            return False
+
+    def get_alias_indices(self, alias: str) -> List[str]:
+        """获取别名指向的实际索引，别名不存在返回空列表"""
+        try:
+            return list(self.client.indices.get_alias(name=alias).body.keys())
+        except NotFoundError:
+            return []
+        except Exception as e:
+            logger.error(f"获取别名失败: {alias}, {e}")
+            return []
+
+    def list_indices(self, pattern: str) -> List[str]:
+        """按通配符列出实际索引名"""
+        try:
+            response = self.client.cat.indices(index=pattern, format='json', h='index', expand_wildcards='open')
+            return [item['index'] for item in response.body]
+        except NotFoundError:
+            return []
+        except Exception as e:
+            logger.error(f"列出索引失败: {pattern}, {e}")
+            return []
+
+    def update_aliases(self, actions: List[Dict[str, Any]]) -> bool:
+        """原子执行一组别名操作（add / remove / remove_index）"""
+        try:
+            self.client.indices.update_aliases(actions=actions)
+            logger.info(f"别名更新成功: {actions}")
+            return True
+        except Exception as e:
+            logger.error(f"别名更新失败: {actions}, {e}")
+            return False
+
     def add_document(self, index_name: str, doc_id: str, document: Dict[str, Any]) -> bool:
         """添加文档"""
         try:
@@ -139,6 +336,20 @@ class ElasticsearchClient:
             logger.error(f"获取文档失败: {e}")
             return None
 
+    def get_documents(self, index_name: str, doc_ids: List[str],
+                      fields: List[str] = None) -> Dict[str, Dict[str, Any]]:
+        """批量获取文档（mget），返回 {文档id: _source}，不存在的文档不返回"""
+        if not doc_ids:
+            return {}
+        try:
+            response = self.client.mget(index=index_name, ids=doc_ids, source_includes=fields)
+            return {doc['_id']: doc.get('_source', {}) for doc in response.body['docs'] if doc.get('found')}
+        except NotFoundError:
+            return {}
+        except Exception as e:
+            logger.error(f"批量获取文档失败: {index_name}, {e}")
+            return {}
+
     def update_document(self, index_name: str, doc_id: str, document: Dict[str, Any]) -> bool:
         """更新文档"""
         try:
@@ -166,18 +377,379 @@ class ElasticsearchClient:
             logger.error(f"文档删除失败: {e}")
             return False
 
+    def update_by_query(self, index_name: str, query: Dict[str, Any], script: Dict[str, Any],
+                        wait_for_completion: bool = True, max_conflict_retries: int = 3) -> Optional[Dict[str, Any]]:
+        """
+        按查询批量更新文档
+        wait_for_completion=True 时返回更新结果（updated、failures等），否则返回 {"task": 任务id}；
+        同步执行时版本冲突（文档被并发写入）的更新按整个查询重试（脚本幂等），重试后仍有冲突时计入failures
+        """
+        try:
+            for attempt in range(max_conflict_retries + 1):
+                response = self.client.update_by_query(
+                    index=index_name,
+                    query=query,
+                    script=script,
+                    conflicts='proceed',
+                    refresh=True,
+                    slices='auto',
+                    wait_for_completion=wait_for_completion
+                ).body
+                logger.info(f"按查询更新已提交: {index_name}, wait_for_completion={wait_for_completion}")
+
+                version_conflicts = response.get('version_conflicts', 0)
+                if not wait_for_completion or not version_conflicts or response.get('failures'):
+                    return response
+                if attempt < max_conflict_retries:
+                    logger.warning(f"按查询更新存在版本冲突，重试({attempt + 1}/{max_conflict_retries}): "
+                                   f"{index_name}, 冲突{version_conflicts}个")
+                    time.sleep(0.5 * (attempt + 1))
+
+            logger.error(f"按查询更新重试后仍有版本冲突: {index_name}, 冲突{version_conflicts}个")
+            response['failures'] = [{"cause": {"type": "version_conflict",
+                                               "reason": f"{version_conflicts}个文档版本冲突"}}]
+            return response
+        except NotFoundError:
+            logger.warning(f"索引不存在: {index_name}")
+            return {"updated": 0, "failures": []}
+        except Exception as e:
+            logger.error(f"按查询更新失败: {e}")
+            return None
+
+    def delete_by_query(self, index_name: str, query: Dict[str, Any],
+                        wait_for_completion: bool = True) -> Optional[Dict[str, Any]]:
+        """
+        按查询批量删除文档
+        wait_for_completion=True 时返回删除结果（deleted、failures等），否则返回 {"task": 任务id}
+        """
+        try:
+            response = self.client.delete_by_query(
+                index=index_name,
+                query=query,
+                conflicts='proceed',
+                refresh=True,
+                slices='auto',
+                wait_for_completion=wait_for_completion
+            )
+            logger.info(f"按查询删除已提交: {index_name}, wait_for_completion={wait_for_completion}")
+            return response.body
+        except NotFoundError:
+            logger.warning(f"索引不存在: {index_name}")
+            return {"deleted": 0, "failures": []}
+        except Exception as e:
+            logger.error(f"按查询删除失败: {e}")
+            return None
+
+    def get_task(self, task_id: str) -> Optional[Dict[str, Any]]:
+        """获取ES后台任务状态"""
+        try:
+            return self.client.tasks.get(task_id=task_id).body
+        except NotFoundError:
+            logger.warning(f"任务不存在: {task_id}")
+            return None
+        except Exception as e:
+            logger.error(f"获取任务状态失败: {e}")
+            return None
+
+    @contextmanager
+    def bulk_load(self, index_name: str, force_merge: bool = None):
+        """
+        批量导入模式：导入期间关闭刷新（refresh_interval=-1）并去掉副本，结束后恢复原settings、刷新，可选段合并
+        同一索引上并发的导入按引用计数处理，最后一个导入结束时才恢复settings（仅限当前进程内）
+        """
+        if not self.bulk_load_enabled:
+            yield
+            return
+
+        self._enter_bulk_load(index_name)
+        try:
+            yield
+        finally:
+            self._exit_bulk_load(index_name, self.bulk_load_force_merge if force_merge is None else force_merge)
+
+    def _bulk_load_index_lock(self, index_name: str) -> threading.Lock:
+        """索引的批量导入锁：串行化同一索引进入/退出批量导入模式时的settings修改"""
+        with self._bulk_load_lock:
+            return self._bulk_load_index_locks.setdefault(index_name, threading.Lock())
+
+    def _enter_bulk_load(self, index_name: str):
+        """进入批量导入模式"""
+        with self._bulk_load_index_lock(index_name):
+            with self._bulk_load_lock:
+                state = self._bulk_load_states.get(index_name)
+                if state is not None:
+                    state['count'] += 1
+                    return
+
+            original = None
+            try:
+                index_settings = self.client.indices.get_settings(
+                    index=index_name,
+                    name=['index.refresh_interval', 'index.number_of_replicas'],
+                    flat_settings=True
+                ).body
+                # 传入的可能是别名，取实际索引的settings
+                current = next(iter(index_settings.values()), {}).get('settings', {})
+                # 未显式设置的项恢复时置为None，即恢复为ES默认值
+                original = {
+                    'index.refresh_interval': current.get('index.refresh_interval'),
+                    'index.number_of_replicas': current.get('index.number_of_replicas')
+                }
+                self.client.indices.put_settings(index=index_name, settings={
+                    'index.refresh_interval': '-1',
+                    'index.number_of_replicas': 0
+                })
+                logger.info(f"进入批量导入模式: {index_name}")
+            except Exception as e:
+                # settings修改失败不影响导入，只是没有加速效果
+                logger.warning(f"进入批量导入模式失败: {index_name}, {e}")
+
+            with self._bulk_load_lock:
+                self._bulk_load_states[index_name] = {'count': 1, 'original': original}
+
+    def _exit_bulk_load(self, index_name: str, force_merge: bool):
+        """退出批量导入模式，最后一个导入结束时恢复settings"""
+        with self._bulk_load_index_lock(index_name):
+            with self._bulk_load_lock:
+                state = self._bulk_load_states[index_name]
+                state['count'] -= 1
+                if state['count'] > 0:
+                    return
+                del self._bulk_load_states[index_name]
+
+            if state['original'] is not None:
+                try:
+                    self.client.indices.put_settings(index=index_name, settings=state['original'])
+                    logger.info(f"退出批量导入模式，已恢复settings: {index_name}")
+                except Exception as e:
+                    logger.error(f"恢复索引settings失败: {index_name}, {state['original']}, {e}")
+            self.refresh_index(index_name)
+
+        if force_merge:
+            try:
+                # 段合并耗时较长，后台执行
+                self.client.indices.forcemerge(index=index_name,
+                                               max_num_segments=self.bulk_load_max_num_segments,
+                                               wait_for_completion=False)
+                logger.info(f"段合并已提交: {index_name}")
+            except Exception as e:
+                logger.warning(f"段合并提交失败: {index_name}, {e}")
+
+    def reindex(self, source_index: str, dest_index: str,
+                wait_for_completion: bool = True) -> Optional[Dict[str, Any]]:
+        """
+        将源索引的文档复制到目标索引（目标索引使用自身的mapping重新构建）
+        wait_for_completion=True 时返回复制结果（created、failures等），否则返回 {"task": 任务id}
+        """
+        try:
+            response = self.client.reindex(
+                source={"index": source_index},
+                dest={"index": dest_index},
+                refresh=True,
+                slices='auto',
+                wait_for_completion=wait_for_completion
+            )
+            logger.info(f"重建索引已提交: {source_index} -> {dest_index}, wait_for_completion={wait_for_completion}")
+            return response.body
+        except Exception as e:
+            logger.error(f"重建索引失败: {e}")
+            return None
+
+    def refresh_index(self, index_name: str) -> bool:
+        """刷新索引，使写入的文档可被检索"""
+        try:
+            self.client.indices.refresh(index=index_name)
+            return True
+        except Exception as e:
+            logger.error(f"刷新索引失败: {e}")
+            return False
+
+    def get_index_stats(self, index_name: str) -> Optional[Dict[str, Any]]:
+        """
+        获取索引的文档数、存储大小和按文件类型统计的段文件大小
+        向量相关文件：vec（原始向量）、veq（int8/int4量化向量）、veb（bbq量化向量）、vex（HNSW图）
+        """
+        try:
+            response = self.client.indices.stats(
+                index=index_name,
+                metric=['docs', 'store', 'segments'],
+                include_segment_file_sizes=True
+            ).body
+            total = response['_all']['primaries']
+            file_sizes = total.get('segments', {}).get('file_sizes', {})
+            return {
+                'docs_count': total.get('docs', {}).get('count', 0),
+                'store_size_in_bytes': total.get('store', {}).get('size_in_bytes', 0),
+                'segments_count': total.get('segments', {}).get('count', 0),
+                'file_sizes_in_bytes': {ext: item.get('size_in_bytes', 0) for ext, item in file_sizes.items()}
+            }
+        except Exception as e:
+            logger.error(f"获取索引统计失败: {e}")
+            return None
+
+    def sample_vectors(self, index_name: str, size: int, seed: int = 42) -> List[Dict[str, Any]]:
+        """随机抽取文档的向量（需要向量存储在_source中），返回 [{"id": ..., "vector": [...]}]"""
+        try:
+            response = self.client.search(
+                index=index_name,
+                query={
+                    "function_score": {
+                        "query": {"exists": {"field": "chunk_embedding"}},
+                        "random_score": {"seed": seed, "field": "_seq_no"}
+                    }
+                },
+                size=size,
+                source=["chunk_embedding"]
+            ).body
+            return [{'id': hit['_id'], 'vector': hit['_source']['chunk_embedding']}
+                    for hit in response['hits']['hits'] if hit.get('_source', {}).get('chunk_embedding')]
+        except Exception as e:
+            logger.error(f"抽样向量失败: {e}")
+            return []
+
+    def iter_document_ids(self, index_name: str, batch_size: int = 1000):
+        """按批遍历索引中所有文档的id（scroll，不返回_source），每次返回一批id"""
+        batch = []
+        for hit in helpers.scan(self.client, index=index_name, query={"query": {"match_all": {}}},
+                                size=batch_size, _source=False):
+            batch.append(hit['_id'])
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
     # -------------------------- 公共方法封装 --------------------------
-    def _execute_search(self, index_name: str, search_body: Dict[str, Any],
+    def _source_filter(self, fields: List[str] = None) -> Dict[str, Any]:
+        """检索结果的_source过滤，向量字段始终不返回"""
+        source_filter = {"excludes": ["chunk_embedding"]}
+        if fields is not None:
+            source_filter["includes"] = fields
+        return source_filter
+
+    def register_stored_scripts(self) -> bool:
+        """
+        注册存储脚本（Painless打分/更新脚本）和存储检索模板（启动时调用）
+        注册成功后检索按模板id引用，请求中不再携带脚本源码；失败时回退为内联请求体
+        """
+        if not self.stored_scripts_enabled:
+            return False
+        try:
+            for script_id, (context, source) in PAINLESS_SCRIPTS.items():
+                self.client.put_script(id=script_id, context=context,
+                                       script={"lang": "painless", "source": source})
+            for template_id, source in SEARCH_TEMPLATES.items():
+                self.client.put_script(id=template_id, script={"lang": "mustache", "source": source})
+            self._stored_scripts_ready = True
+            logger.info(f"存储脚本和检索模板注册成功: {len(PAINLESS_SCRIPTS)}个脚本, {len(SEARCH_TEMPLATES)}个模板")
+            return True
+        except Exception as e:
+            self._stored_scripts_ready = False
+            logger.error(f"存储脚本注册失败，检索使用内联脚本: {e}")
+            return False
+
+    def script(self, script_id: str, params: Dict[str, Any]) -> Dict[str, Any]:
+        """按id引用存储脚本，未注册时使用内联源码"""
+        if self._stored_scripts_ready:
+            return {"id": script_id, "params": params}
+        return {"source": PAINLESS_SCRIPTS[script_id][1], "lang": "painless", "params": params}
+
+    def _build_inline_body(self, template_id: str, params: Dict[str, Any]) -> Dict[str, Any]:
+        """存储模板不可用时，按模板参数构建等价的内联请求体"""
+        body = {"size": params["size"], "_source": params["source"]}
+        if template_id == TEMPLATE_KNN_SEARCH:
+            knn = {
+                "field": "chunk_embedding",
+                "query_vector": params["query_vector"],
+                "k": params["k"],
+                "num_candidates": params["num_candidates"],
+                "filter": {"bool": {"filter": params["filters"]}}
+            }
+            if params["has_similarity"]:
+                knn["similarity"] = params["similarity"]
+            body["knn"] = knn
+            return body
+
+        match = {"match": {"chunk_content": {"query": params.get("query_text")}}}
+        if template_id == TEMPLATE_MATCH_SEARCH:
+            body["query"] = {"bool": {"must": match, "filter": params["filters"]}}
+            return body
+
+        if template_id == TEMPLATE_HYBRID_RESCORE_SEARCH:
+            body["query"] = {
+                "function_score": {
+                    "query": {"bool": {"should": [match], "minimum_should_match": 1, "filter": params["filters"]}},
+                    "functions": [{"script_score": {"script": self.script(
+                        SCRIPT_TEXT_SCORE, {"text_max_value": params["text_max_value"]})}}],
+                    "boost_mode": "replace"
+                }
+            }
+            body["rescore"] = {
+                "window_size": params["window_size"],
+                "query": {
+                    "rescore_query": {
+                        "script_score": {
+                            "query": {"match_all": {}},
+                            "script": self.script(SCRIPT_VECTOR_SCORE, {"query_vector": params["query_vector"]})
+                        }
+                    },
+                    "query_weight": params["text_weight"],
+                    "rescore_query_weight": params["vector_weight"],
+                    "score_mode": "total"
+                }
+            }
+            return body
+
+        if template_id == TEMPLATE_TEXT_SEARCH:
+            query = {"bool": {"should": [match], "minimum_should_match": 1, "filter": params["filters"]}}
+            script = self.script(SCRIPT_TEXT_SCORE, {"text_max_value": params["text_max_value"]})
+        elif template_id == TEMPLATE_HYBRID_SEARCH:
+            query = {"bool": {"should": [match], "minimum_should_match": 1, "filter": params["filters"]}}
+            script = self.script(SCRIPT_HYBRID_SCORE, {
+                "query_vector": params["query_vector"],
+                "text_weight": params["text_weight"],
+                "vector_weight": params["vector_weight"],
+                "text_max_value": params["text_max_value"]
+            })
+        elif template_id == TEMPLATE_EXACT_VECTOR_SEARCH:
+            query = {"bool": {"must": {"match_all": {}}, "filter": params["filters"]}}
+            script = self.script(SCRIPT_VECTOR_SCORE, {"query_vector": params["query_vector"]})
+        else:
+            raise ValueError(f"未知的检索模板: {template_id}")
+
+        body["query"] = {
+            "function_score": {
+                "query": query,
+                "functions": [{"script_score": {"script": script}}],
+                "min_score": params["min_score"],
+                "boost_mode": "replace"
+            }
+        }
+        return body
+
+    def _execute_search(self, index_name: str, template_id: str, params: Dict[str, Any],
                         min_relevance_score: float) -> Dict[str, Any]:
         """
         执行搜索的通用方法，封装了搜索执行、结果过滤和异常处理
+        存储模板已注册时按模板id检索，否则使用内联请求体
         """
         try:
             # 执行搜索
-            response = self.client.search(
-                index=index_name,
-                body=search_body
-            )
+            if self._stored_scripts_ready:
+                response = self.client.search_template(
+                    index=index_name,
+                    id=template_id,
+                    params=params,
+                    filter_path=SEARCH_FILTER_PATH
+                ).body
+            else:
+                response = self.client.search(
+                    index=index_name,
+                    body=self._build_inline_body(template_id, params),
+                    filter_path=SEARCH_FILTER_PATH
+                ).body
+
+            logger.debug(f"检索耗时: {index_name}, took={response.get('took')}ms")
 
             # 过滤低相关结果
             return self._filter_results(response, min_relevance_score)
@@ -186,13 +758,34 @@ class ElasticsearchClient:
             # 统一异常处理
             return self._handle_exception(e, index_name)
 
+    def _execute_msearch(self, requests: List[tuple[str, str, Dict[str, Any]]]) -> List[Dict[str, Any]]:
+        """一次请求执行多个检索，requests 为 [(索引, 模板id, 参数)]，按顺序返回各自的响应（失败的响应含error）"""
+        if self._stored_scripts_ready:
+            search_templates = []
+            for index_name, template_id, params in requests:
+                search_templates.extend([{"index": index_name}, {"id": template_id, "params": params}])
+            return self.client.msearch_template(
+                search_templates=search_templates,
+                filter_path=MSEARCH_FILTER_PATH
+            ).body['responses']
+
+        searches = []
+        for index_name, template_id, params in requests:
+            searches.extend([{"index": index_name}, self._build_inline_body(template_id, params)])
+        return self.client.msearch(
+            searches=searches,
+            filter_path=MSEARCH_FILTER_PATH
+        ).body['responses']
+
     def _filter_results(self, response: Dict[str, Any], min_score: float) -> Dict[str, Any]:
         """过滤低于最小相关度分数的结果"""
-        filtered_hits = [hit for hit in response["hits"]["hits"]
-                         if hit["_score"] >= min_score]
+        # filter_path 会去掉空数组，没有命中时 hits.hits 不存在
+        hits = response.setdefault("hits", {})
+        filtered_hits = [hit for hit in hits.get("hits", [])
+                         if hit["_score"] is not None and hit["_score"] >= min_score]
 
-        response["hits"]["hits"] = filtered_hits
-        response["hits"]["total"]["value"] = len(filtered_hits)
+        hits["hits"] = filtered_hits
+        hits["total"] = {"value": len(filtered_hits)}
         return response
 
     def _handle_exception(self, e: Exception, index_name: str) -> Dict[str, Any]:
@@ -220,155 +813,364 @@ class ElasticsearchClient:
             vector_weight /= total
         return text_weight, vector_weight
 
+    def build_filters(self, enabled_only: bool = True, document_ids: List[str] = None,
+                      created_from: str = None, created_to: str = None) -> List[Dict[str, Any]]:
+        """
+        构建检索过滤条件（filter上下文，不参与打分，可被ES缓存）
+        enabled_only: 只检索启用的文档下的启用分块
+        document_ids: 限定文档范围
+        created_from / created_to: 分块创建时间范围（含边界），ISO格式日期或时间
+        """
+        filters = []
+        if enabled_only:
+            filters.append({"term": {"metadata.enabled": True}})
+            filters.append({"term": {"metadata.chunk_status": "1"}})
+        if document_ids:
+            filters.append({"terms": {"document_id": list(document_ids)}})
+        if created_from or created_to:
+            created_range = {}
+            if created_from:
+                created_range["gte"] = created_from
+            if created_to:
+                created_range["lte"] = created_to
+            filters.append({"range": {"created_time": created_range}})
+        return filters
+
     def vector_search(self, index_name: str, vector: List[float],
-                      size: int = 10, min_score: float = 0.1, fields: List[str] = None) -> Dict[str, Any]:
-        """优化的纯向量检索方法"""
-        search_body = {
-            "query": {
-                "function_score": {
-                    "query": {"match_all": {}},
-                    "functions": [
-                        {
-                            "script_score": {
-                                "script": {
-                                    "source": """
-                                        double vectorScore = (cosineSimilarity(params.query_vector, 'chunk_embedding') + 1.0) / 2.0;
-                                        return vectorScore;
-                                    """,
-                                    "params": {"query_vector": vector}
-                                }
-                            }
-                        }
-                    ],
-                    "min_score": min_score,
-                    "boost_mode": "replace"
-                }
-            },
+                      size: int = 10, min_score: float = 0.1, fields: List[str] = None,
+                      mode: str = None, num_candidates: int = None,
+                      filters: List[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        纯向量检索
+        mode=knn 使用HNSW近似检索（默认），mode=exact 使用script_score逐文档计算余弦相似度；
+        两种模式的得分都是 (cosine + 1) / 2，可直接对比
+        filters 为 build_filters 构建的过滤条件，knn模式下在HNSW遍历时过滤，保证返回k个符合条件的结果
+        """
+        return self.run_search(self.vector_search_spec(index_name, vector, size, min_score, fields,
+                                                       mode, num_candidates, filters))
+
+    def vector_search_spec(self, index_name: str, vector: List[float],
+                           size: int = 10, min_score: float = 0.1, fields: List[str] = None,
+                           mode: str = None, num_candidates: int = None,
+                           filters: List[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """构建纯向量检索"""
+        mode = mode or self.vector_mode
+        if mode == 'exact':
+            # 精确向量检索（script_score 暴力计算）
+            request = (TEMPLATE_EXACT_VECTOR_SEARCH, {
+                "query_vector": vector,
+                "min_score": min_score,
+                "filters": filters or [],
+                "size": size,
+                "source": self._source_filter(fields)
+            })
+        else:
+            request = self._knn_request(vector, size, min_score, fields, num_candidates, filters)
+        return self._search_spec(index_name, [request], min_score)
+
+    def _knn_request(self, vector: List[float], size: int, min_score: float = None,
+                     fields: List[str] = None, num_candidates: int = None,
+                     filters: List[Dict[str, Any]] = None) -> tuple[str, Dict[str, Any]]:
+        """构建knn检索请求（模板id, 参数）；k 不能大于 num_candidates，两者都不超过 knn_max_num_candidates"""
+        size = min(size, self.knn_max_num_candidates)
+        if not num_candidates:
+            num_candidates = max(size * self.knn_num_candidates_factor, 100)
+        num_candidates = min(max(num_candidates, size), self.knn_max_num_candidates)
+
+        return TEMPLATE_KNN_SEARCH, {
+            "query_vector": vector,
+            "k": size,
+            "num_candidates": num_candidates,
+            # similarity 为原始余弦值阈值，与得分 (cosine + 1) / 2 换算
+            "has_similarity": min_score is not None,
+            "similarity": min_score * 2.0 - 1.0 if min_score is not None else None,
+            "filters": filters or [],
             "size": size,
-            "_source": fields if fields is not None else ["*"]
+            "source": self._source_filter(fields)
         }
-        return self._execute_search(index_name, search_body, min_score)
-
 
     def text_search(self, index_name: str, query_text: str,
-                    size: int = 10, min_score: float = 0.1, fields: List[str] = None) -> Dict[str, Any]:
+                    size: int = 10, min_score: float = 0.1, fields: List[str] = None,
+                    filters: List[Dict[str, Any]] = None) -> Dict[str, Any]:
         """优化的纯文本检索方法"""
-        search_body = {
-            "query": {
-                "function_score": {
-                    "query": {
-                        "bool": {
-                            "should": [
-                                {"match": {"chunk_content": {"query": query_text}}},
-                            ],
-                            "minimum_should_match": 1
-                        }
-                    },
-                    "functions": [
-                        {
-                            "script_score": {
-                                "script": {
-                                    "source": """
-                                        double textScore = _score;
-                                        textScore = Math.min(textScore, params.text_max_value);
-                                        textScore = textScore / params.text_max_value;
-                                        return textScore;
-                                    """,
-                                    "params": {"text_max_value": self.text_max_value}
-                                }
-                            }
-                        }
-                    ],
-                    "min_score": min_score,
-                    "boost_mode": "replace"
-                }
-            },
+        return self.run_search(self.text_search_spec(index_name, query_text, size, min_score, fields, filters))
+
+    def text_search_spec(self, index_name: str, query_text: str,
+                         size: int = 10, min_score: float = 0.1, fields: List[str] = None,
+                         filters: List[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """构建纯文本检索"""
+        params = {
+            "query_text": query_text,
+            "text_max_value": self.text_max_value,
+            "min_score": min_score,
+            "filters": filters or [],
             "size": size,
-            "_source": fields if fields is not None else ["*"]
+            "source": self._source_filter(fields)
         }
-
-        return self._execute_search(index_name, search_body, min_score)
+        return self._search_spec(index_name, [(TEMPLATE_TEXT_SEARCH, params)], min_score)
 
     def hybrid_search(self, index_name: str, query_text: str, vector: List[float],
                       text_weight: float = 0.5, vector_weight: float = 0.5,
-                      size: int = 10, min_score: float = 0.1 ) -> Dict[str, Any]:
+                      size: int = 10, min_score: float = 0.1, fields: List[str] = None,
+                      filters: List[Dict[str, Any]] = None) -> Dict[str, Any]:
 
         """优化的混合检索方法"""
+        return self.run_search(self.hybrid_search_spec(index_name, query_text, vector, text_weight, vector_weight,
+                                                       size, min_score, fields, filters))
+
+    def hybrid_search_spec(self, index_name: str, query_text: str, vector: List[float],
+                           text_weight: float = 0.5, vector_weight: float = 0.5,
+                           size: int = 10, min_score: float = 0.1, fields: List[str] = None,
+                           filters: List[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """构建加权混合检索"""
         # 归一化权重
         text_weight, vector_weight = self._normalize_weights(text_weight, vector_weight)
 
-        search_body = {
-            "query": {
-                "function_score": {
-                    "query": {
-                        "bool": {
-                            "should": [
-                                {"match": {"chunk_content": {"query": query_text}}},
-                            ],
-                            "minimum_should_match": 1
-                        }
-                    },
-                    "functions": [
-                        {
-                            "script_score": {
-                                "script": {
-                                    "source": """
-                                                // 文本分数归一化
-                                                double textScore = _score;
-                                                textScore = Math.min(textScore, params.text_max_value);
-                                                textScore = textScore / params.text_max_value;
-
-                                                // 向量分数计算
-                                                double vectorScore = (cosineSimilarity(params.query_vector, 'chunk_embedding') + 1.0) / 2.0;
-                                                vectorScore = Math.max(vectorScore, 0.0);
-
-                                                // 应用权重计算最终得分
-                                                return (textScore * params.text_weight) + (vectorScore * params.vector_weight);
-                                            """,
-                                    "params": {
-                                        "query_vector": vector,
-                                        "text_weight": text_weight,
-                                        "vector_weight": vector_weight,
-                                        "text_max_value": self.text_max_value
-                                    }
-                                }
-                            }
-                        }
-                    ],
-                    "min_score": min_score,
-                    "boost_mode": "replace"
-                }
-            },
+        params = {
+            "query_text": query_text,
+            "query_vector": vector,
+            "text_weight": text_weight,
+            "vector_weight": vector_weight,
+            "text_max_value": self.text_max_value,
+            "min_score": min_score,
+            "filters": filters or [],
+            "size": size,
+            "source": self._source_filter(fields)
+        }
+        return self._search_spec(index_name, [(TEMPLATE_HYBRID_SEARCH, params)], min_score)
+
+    def hybrid_rescore_search(self, index_name: str, query_text: str, vector: List[float],
+                              text_weight: float = 0.5, vector_weight: float = 0.5,
+                              size: int = 10, window_size: int = None, min_score: float = 0.1,
+                              fields: List[str] = None, filters: List[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        两阶段混合检索：BM25取前 window_size 个结果，只对这些结果计算向量分数（ES rescore）
+        得分口径与 hybrid_search 相同，但向量计算量不随命中文档数增长，延迟有上界
+        """
+        return self.run_search(self.hybrid_rescore_search_spec(index_name, query_text, vector, text_weight,
+                                                               vector_weight, size, window_size, min_score,
+                                                               fields, filters))
+
+    def hybrid_rescore_search_spec(self, index_name: str, query_text: str, vector: List[float],
+                                   text_weight: float = 0.5, vector_weight: float = 0.5,
+                                   size: int = 10, window_size: int = None, min_score: float = 0.1,
+                                   fields: List[str] = None,
+                                   filters: List[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """构建两阶段混合检索"""
+        text_weight, vector_weight = self._normalize_weights(text_weight, vector_weight)
+        window_size = min(max(window_size or self.rescore_window_size, size), self.max_rescore_window)
+
+        params = {
+            "query_text": query_text,
+            "query_vector": vector,
+            "text_weight": text_weight,
+            "vector_weight": vector_weight,
+            "text_max_value": self.text_max_value,
+            "window_size": window_size,
+            "filters": filters or [],
+            "size": size,
+            "source": self._source_filter(fields)
+        }
+        # rescore后的得分才是最终得分，min_score在返回后过滤
+        return self._search_spec(index_name, [(TEMPLATE_HYBRID_RESCORE_SEARCH, params)], min_score)
+
+    def hybrid_rrf_search(self, index_name: str, query_text: str, vector: List[float],
+                          size: int = 10, text_window_size: int = None, vector_window_size: int = None,
+                          rank_constant: int = None, min_score: float = None,
+                          fields: List[str] = None, filters: List[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        RRF混合检索：BM25和knn两路独立检索（一次_msearch请求），按倒数排名融合
+        融合得分 = Σ 1 / (rank_constant + 排名)，与各路原始得分的量纲无关，无需 text_max_value 归一化
+        """
+        return self.run_search(self.hybrid_rrf_search_spec(index_name, query_text, vector, size, text_window_size,
+                                                           vector_window_size, rank_constant, min_score,
+                                                           fields, filters))
+
+    def hybrid_rrf_search_spec(self, index_name: str, query_text: str, vector: List[float],
+                               size: int = 10, text_window_size: int = None, vector_window_size: int = None,
+                               rank_constant: int = None, min_score: float = None,
+                               fields: List[str] = None, filters: List[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """构建RRF混合检索（min_score 只作为knn路的相似度阈值）"""
+        text_window_size = text_window_size or self.rrf_window_size
+        vector_window_size = vector_window_size or self.rrf_window_size
+
+        text_request = (TEMPLATE_MATCH_SEARCH, {
+            "query_text": query_text,
+            "filters": filters or [],
+            "size": text_window_size,
+            "source": self._source_filter(fields)
+        })
+        vector_request = self._knn_request(vector, vector_window_size, min_score, fields, filters=filters)
+        return self._search_spec(index_name, [text_request, vector_request], None,
+                                 rank_constant=rank_constant or self.rrf_rank_constant, size=size)
+
+    def _search_spec(self, index_name: str, requests: List[tuple[str, Dict[str, Any]]],
+                     min_score: Optional[float], rank_constant: int = None, size: int = None) -> Dict[str, Any]:
+        """
+        检索描述，由 *_search_spec 构建，交给 run_search / multi_search 执行
+        requests: [(模板id, 参数)]；rank_constant 不为空时多路结果按RRF融合后取前 size 个，否则按 min_score 过滤
+        """
+        return {
+            "index": index_name,
+            "requests": requests,
+            "min_score": min_score,
+            "rank_constant": rank_constant,
             "size": size
         }
 
-        return self._execute_search(index_name, search_body, min_score)
+    def run_search(self, spec: Dict[str, Any]) -> Dict[str, Any]:
+        """执行一个检索"""
+        index_name = spec["index"]
+        if spec["rank_constant"] is None:
+            template_id, params = spec["requests"][0]
+            return self._execute_search(index_name, template_id, params, spec["min_score"])
 
-    def bulk_index(self, index_name: str, documents: List[Dict[str, Any]]) -> bool:
-        """批量索引文档"""
         try:
-            actions = []
-            for doc in documents:
-                action = {
-                    "_index": index_name,
-                    "_id": doc.get('id'),
-                    "_source": doc
-                }
-                actions.append(action)
+            responses = self._execute_msearch([(index_name, template_id, params)
+                                               for template_id, params in spec["requests"]])
+        except Exception as e:
+            return self._handle_exception(e, index_name)
+        return self._fuse_responses(spec, responses)
+
+    def multi_search(self, specs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        一次_msearch请求执行多个检索（可以是不同索引、不同检索类型），结果顺序与specs一致
+        单个检索失败时对应结果含error，不影响其他检索
+        """
+        if not specs:
+            return []
 
-            response = self.client.bulk(operations=actions)
+        requests = [(spec["index"], template_id, params)
+                    for spec in specs for template_id, params in spec["requests"]]
+        try:
+            responses = self._execute_msearch(requests)
+        except Exception as e:
+            return [self._handle_exception(e, spec["index"]) for spec in specs]
 
-            # 检查是否有错误
-            if response.get('errors'):
-                logger.error(f"批量索引部分失败: {response}")
-                return False
+        results = []
+        offset = 0
+        for spec in specs:
+            spec_responses = responses[offset:offset + len(spec["requests"])]
+            offset += len(spec["requests"])
+            if spec["rank_constant"] is not None:
+                results.append(self._fuse_responses(spec, spec_responses))
+            elif 'error' in spec_responses[0]:
+                results.append(self._handle_exception(ValueError(json.dumps(spec_responses[0]['error'])),
+                                                      spec["index"]))
+            else:
+                results.append(self._filter_results(spec_responses[0], spec["min_score"]))
+        return results
 
-            logger.info(f"批量索引成功: {len(documents)}个文档")
-            return True
+    def _fuse_responses(self, spec: Dict[str, Any], responses: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """多路检索结果按RRF融合，失败的一路按无结果处理；全部失败时按检索失败返回（含error）"""
+        legs = []
+        for position, response in enumerate(responses, start=1):
+            if 'error' in response:
+                logger.error(f"RRF第{position}路检索失败: {spec['index']}, {response['error']}")
+                legs.append([])
+            else:
+                legs.append(response.get('hits', {}).get('hits', []))
+
+        if all('error' in response for response in responses):
+            return self._handle_exception(ValueError(json.dumps(responses[0]['error'])), spec["index"])
+
+        hits = self._rrf_fuse(legs, spec["rank_constant"])[:spec["size"]]
+        return {"hits": {"hits": hits, "total": {"value": len(hits)}}}
+
+    def _rrf_fuse(self, result_lists: List[List[Dict[str, Any]]], rank_constant: int) -> List[Dict[str, Any]]:
+        """倒数排名融合，按融合得分降序返回"""
+        fused: Dict[str, Dict[str, Any]] = {}
+        for hits in result_lists:
+            for rank, hit in enumerate(hits, start=1):
+                entry = fused.get(hit['_id'])
+                if entry is None:
+                    entry = {**hit, "_score": 0.0}
+                    fused[hit['_id']] = entry
+                entry["_score"] += 1.0 / (rank_constant + rank)
+        return sorted(fused.values(), key=lambda h: h["_score"], reverse=True)
+
+    def bulk_index(self, index_name: str, documents: List[Dict[str, Any]]) -> bool:
+        """批量索引文档，全部成功返回True"""
+        results = self.bulk_index_documents(index_name, documents)
+        return all(result['ok'] for result in results)
+
+    def bulk_index_documents(self, index_name: str, documents: List[Dict[str, Any]],
+                             chunk_size: int = None) -> List[Dict[str, Any]]:
+        """
+        批量索引文档，返回每个文档的索引结果（顺序与documents一致）
+        每个bulk请求按文档数 chunk_size 和字节数 max_chunk_bytes 切分，429拒绝的文档按指数退避重试；
+        thread_count>1 时文档分片后并发写入
+        结果格式: [{"id": 文档id, "ok": 是否成功, "status": HTTP状态码, "error": 错误信息}]
+        """
+        if not documents:
+            return []
+
+        chunk_size = chunk_size or self.bulk_chunk_size
+        thread_count = max(1, min(self.bulk_thread_count, math.ceil(len(documents) / chunk_size)))
+        if thread_count == 1:
+            results = self._streaming_bulk(index_name, documents, chunk_size)
+        else:
+            # 按连续区间分片，保证结果顺序与documents一致
+            slice_size = math.ceil(len(documents) / thread_count)
+            slices = [documents[i:i + slice_size] for i in range(0, len(documents), slice_size)]
+            with ThreadPoolExecutor(max_workers=thread_count, thread_name_prefix='es-bulk') as executor:
+                results = [result
+                           for slice_results in executor.map(
+                               lambda docs: self._streaming_bulk(index_name, docs, chunk_size), slices)
+                           for result in slice_results]
+
+        failed = sum(1 for r in results if not r['ok'])
+        if failed:
+            logger.error(f"批量索引部分失败: {index_name}, 失败{failed}/{len(documents)}个")
+        else:
+            logger.info(f"批量索引成功: {index_name}, {len(documents)}个文档")
+        return results
 
+    def _streaming_bulk(self, index_name: str, documents: List[Dict[str, Any]],
+                        chunk_size: int) -> List[Dict[str, Any]]:
+        """单线程流式批量索引，返回每个文档的索引结果"""
+        results_by_id: Dict[str, Dict[str, Any]] = {}
+        actions = (
+            {
+                "_op_type": "index",
+                "_index": index_name,
+                "_id": doc.get('id'),
+                "_source": doc
+            }
+            for doc in documents
+        )
+        try:
+            for ok, item in helpers.streaming_bulk(self.client, actions,
+                                                   chunk_size=chunk_size,
+                                                   max_chunk_bytes=self.bulk_max_chunk_bytes,
+                                                   max_retries=self.bulk_max_retries,
+                                                   initial_backoff=self.bulk_initial_backoff,
+                                                   max_backoff=self.bulk_max_backoff,
+                                                   raise_on_error=False,
+                                                   raise_on_exception=False):
+                op_result = item.get('index', {})
+                results_by_id[op_result.get('_id')] = {
+                    "id": op_result.get('_id'),
+                    "ok": ok,
+                    "status": op_result.get('status'),
+                    "error": None if ok else self._format_bulk_error(op_result)
+                }
         except Exception as e:
-            logger.error(f"批量索引失败: {e}")
-            return False
+            logger.error(f"批量索引异常: {e}")
+
+        # 未返回结果的文档（请求异常中断）视为失败
+        return [results_by_id.get(doc.get('id')) or
+                {"id": doc.get('id'), "ok": False, "status": None, "error": "批量索引请求中断"}
+                for doc in documents]
+
+    def _format_bulk_error(self, op_result: Dict[str, Any]) -> str:
+        """格式化bulk单条失败原因"""
+        error = op_result.get('error')
+        if isinstance(error, dict):
+            return f"{error.get('type')}: {error.get('reason')}"
+        if op_result.get('status') == 429:
+            return f"写入被拒绝（429），已重试{self.bulk_max_retries}次"
+        return str(error)
 
     def health_check(self) -> bool:
         """健康检查"""
@@ -0,0 +1,181 @@
+# ES存储脚本（Painless）和存储检索模板（Mustache）
+# 启动时注册到ES，检索时按id引用，请求中不再携带脚本源码，脚本只在注册时编译一次
+
+# -------------------------- Painless 打分/更新脚本 --------------------------
+# 文本分数归一化：BM25分数截断到 text_max_value 后归一化到 [0, 1]
+SCRIPT_TEXT_SCORE = 'rag_text_score'
+# 向量分数：(cosine + 1) / 2
+SCRIPT_VECTOR_SCORE = 'rag_vector_score'
+# 加权混合分数
+SCRIPT_HYBRID_SCORE = 'rag_hybrid_score'
+# 修改分块启用状态（update_by_query）
+SCRIPT_SET_ENABLED = 'rag_set_enabled'
+
+# 脚本id -> (编译上下文, 源码)
+PAINLESS_SCRIPTS = {
+    SCRIPT_TEXT_SCORE: ('score', """
+        double textScore = _score;
+        textScore = Math.min(textScore, params.text_max_value);
+        return textScore / params.text_max_value;
+    """),
+    SCRIPT_VECTOR_SCORE: ('score', """
+        return (cosineSimilarity(params.query_vector, 'chunk_embedding') + 1.0) / 2.0;
+    """),
+    SCRIPT_HYBRID_SCORE: ('score', """
+        // 文本分数归一化
+        double textScore = _score;
+        textScore = Math.min(textScore, params.text_max_value);
+        textScore = textScore / params.text_max_value;
+
+        // 向量分数计算
+        double vectorScore = (cosineSimilarity(params.query_vector, 'chunk_embedding') + 1.0) / 2.0;
+        vectorScore = Math.max(vectorScore, 0.0);
+
+        // 应用权重计算最终得分
+        return (textScore * params.text_weight) + (vectorScore * params.vector_weight);
+    """),
+    SCRIPT_SET_ENABLED: ('update', "ctx._source.metadata.enabled = params.enabled"),
+}
+
+# -------------------------- Mustache 检索模板 --------------------------
+# 公共参数：size、source（_source过滤）、filters（filter上下文的过滤条件列表）
+TEMPLATE_TEXT_SEARCH = 'rag_text_search'
+TEMPLATE_HYBRID_SEARCH = 'rag_hybrid_search'
+TEMPLATE_EXACT_VECTOR_SEARCH = 'rag_exact_vector_search'
+TEMPLATE_KNN_SEARCH = 'rag_knn_search'
+TEMPLATE_MATCH_SEARCH = 'rag_match_search'
+TEMPLATE_HYBRID_RESCORE_SEARCH = 'rag_hybrid_rescore_search'
+
+# 模板id -> 源码（含条件段落，只能使用字符串形式）
+# 存储模板不可用时由 ElasticsearchClient._build_inline_body 构建等价请求体，两者一致性见 tests/test_es_scripts.py
+SEARCH_TEMPLATES = {
+    # 纯文本检索，参数：query_text、text_max_value、min_score
+    TEMPLATE_TEXT_SEARCH: """{
+        "query": {
+            "function_score": {
+                "query": {
+                    "bool": {
+                        "should": [{"match": {"chunk_content": {"query": {{#toJson}}query_text{{/toJson}}}}}],
+                        "minimum_should_match": 1,
+                        "filter": {{#toJson}}filters{{/toJson}}
+                    }
+                },
+                "functions": [{"script_score": {"script": {
+                    "id": "rag_text_score",
+                    "params": {"text_max_value": {{text_max_value}}}
+                }}}],
+                "min_score": {{min_score}},
+                "boost_mode": "replace"
+            }
+        },
+        "size": {{size}},
+        "_source": {{#toJson}}source{{/toJson}}
+    }""",
+    # 加权混合检索，参数：query_text、query_vector、text_weight、vector_weight、text_max_value、min_score
+    TEMPLATE_HYBRID_SEARCH: """{
+        "query": {
+            "function_score": {
+                "query": {
+                    "bool": {
+                        "should": [{"match": {"chunk_content": {"query": {{#toJson}}query_text{{/toJson}}}}}],
+                        "minimum_should_match": 1,
+                        "filter": {{#toJson}}filters{{/toJson}}
+                    }
+                },
+                "functions": [{"script_score": {"script": {
+                    "id": "rag_hybrid_score",
+                    "params": {
+                        "query_vector": {{#toJson}}query_vector{{/toJson}},
+                        "text_weight": {{text_weight}},
+                        "vector_weight": {{vector_weight}},
+                        "text_max_value": {{text_max_value}}
+                    }
+                }}}],
+                "min_score": {{min_score}},
+                "boost_mode": "replace"
+            }
+        },
+        "size": {{size}},
+        "_source": {{#toJson}}source{{/toJson}}
+    }""",
+    # 精确向量检索，参数：query_vector、min_score
+    TEMPLATE_EXACT_VECTOR_SEARCH: """{
+        "query": {
+            "function_score": {
+                "query": {"bool": {"must": {"match_all": {}}, "filter": {{#toJson}}filters{{/toJson}}}},
+                "functions": [{"script_score": {"script": {
+                    "id": "rag_vector_score",
+                    "params": {"query_vector": {{#toJson}}query_vector{{/toJson}}}
+                }}}],
+                "min_score": {{min_score}},
+                "boost_mode": "replace"
+            }
+        },
+        "size": {{size}},
+        "_source": {{#toJson}}source{{/toJson}}
+    }""",
+    # knn检索，参数：query_vector、k、num_candidates、has_similarity、similarity
+    TEMPLATE_KNN_SEARCH: """{
+        "knn": {
+            "field": "chunk_embedding",
+            "query_vector": {{#toJson}}query_vector{{/toJson}},
+            "k": {{k}},
+            "num_candidates": {{num_candidates}},
+            {{#has_similarity}}"similarity": {{similarity}},{{/has_similarity}}
+            "filter": {"bool": {"filter": {{#toJson}}filters{{/toJson}}}}
+        },
+        "size": {{size}},
+        "_source": {{#toJson}}source{{/toJson}}
+    }""",
+    # 两阶段混合检索：第一阶段只计算归一化的文本分数，rescore窗口内的前 window_size 个结果再计算向量分数，
+    # 最终得分 = 文本分数 * text_weight + 向量分数 * vector_weight；
+    # 参数：query_text、text_max_value、window_size、query_vector、text_weight、vector_weight
+    TEMPLATE_HYBRID_RESCORE_SEARCH: """{
+        "query": {
+            "function_score": {
+                "query": {
+                    "bool": {
+                        "should": [{"match": {"chunk_content": {"query": {{#toJson}}query_text{{/toJson}}}}}],
+                        "minimum_should_match": 1,
+                        "filter": {{#toJson}}filters{{/toJson}}
+                    }
+                },
+                "functions": [{"script_score": {"script": {
+                    "id": "rag_text_score",
+                    "params": {"text_max_value": {{text_max_value}}}
+                }}}],
+                "boost_mode": "replace"
+            }
+        },
+        "rescore": {
+            "window_size": {{window_size}},
+            "query": {
+                "rescore_query": {
+                    "script_score": {
+                        "query": {"match_all": {}},
+                        "script": {
+                            "id": "rag_vector_score",
+                            "params": {"query_vector": {{#toJson}}query_vector{{/toJson}}}
+                        }
+                    }
+                },
+                "query_weight": {{text_weight}},
+                "rescore_query_weight": {{vector_weight}},
+                "score_mode": "total"
+            }
+        },
+        "size": {{size}},
+        "_source": {{#toJson}}source{{/toJson}}
+    }""",
+    # BM25原始分数检索（RRF文本路），参数：query_text
+    TEMPLATE_MATCH_SEARCH: """{
+        "query": {
+            "bool": {
+                "must": {"match": {"chunk_content": {"query": {{#toJson}}query_text{{/toJson}}}}},
+                "filter": {{#toJson}}filters{{/toJson}}
+            }
+        },
+        "size": {{size}},
+        "_source": {{#toJson}}source{{/toJson}}
+    }""",
+}
@@ -0,0 +1,79 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Any
+
+from utils.config import config
+
+logger = logging.getLogger(__name__)
+
+
+class JobExecutor:
+    """后台任务执行器（有界线程池）"""
+
+    def __init__(self):
+        self.max_workers = 4
+        self.max_pending = 32
+        self._executor: ThreadPoolExecutor = None
+        self._slots: threading.BoundedSemaphore = None
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._initialize_executor()
+
+    def _initialize_executor(self):
+        """初始化线程池"""
+        job_config = config.get_section('ingest_job')
+        self.max_workers = job_config.get('max_workers', 4)
+        # 排队 + 运行中的任务总数上限，超出后直接拒绝，避免上传洪峰把内存和磁盘打满
+        self.max_pending = max(job_config.get('max_pending', 32), self.max_workers)
+
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='ingest-job')
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+
+        logger.info(f"后台任务执行器初始化完成: workers={self.max_workers}, max_pending={self.max_pending}")
+
+    def submit(self, fn: Callable[..., Any], *args, **kwargs) -> bool:
+        """提交任务，队列已满时返回False"""
+        if not self._slots.acquire(blocking=False):
+            logger.warning(f"任务队列已满，拒绝提交: pending={self._pending}")
+            return False
+
+        with self._lock:
+            self._pending += 1
+        try:
+            self._executor.submit(self._run, fn, *args, **kwargs)
+            return True
+        except Exception as e:
+            self._release()
+            logger.error(f"任务提交失败: {e}")
+            return False
+
+    def _run(self, fn: Callable[..., Any], *args, **kwargs):
+        """执行任务并释放队列名额"""
+        try:
+            fn(*args, **kwargs)
+        except Exception as e:
+            logger.error(f"后台任务执行异常: {e}")
+        finally:
+            self._release()
+
+    def _release(self):
+        with self._lock:
+            self._pending -= 1
+        self._slots.release()
+
+    def is_full(self) -> bool:
+        """队列是否已满"""
+        return self._pending >= self.max_pending
+
+    def pending_count(self) -> int:
+        """排队 + 运行中的任务数"""
+        return self._pending
+
+    def shutdown(self, wait: bool = True):
+        """关闭线程池"""
+        self._executor.shutdown(wait=wait)
+
+
+# 全局后台任务执行器实例
+job_executor = JobExecutor()
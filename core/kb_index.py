@@ -0,0 +1,272 @@
+import logging
+import re
+import threading
+import zlib
+from contextlib import contextmanager
+from typing import Dict, List, Any, Optional
+
+from core.elasticsearch_client import es_client
+from utils.cache_utils import kb_generations
+from utils.config import config
+
+logger = logging.getLogger(__name__)
+
+
+# 索引布局
+LAYOUT_PER_KB = 'per_kb'
+LAYOUT_SHARED = 'shared'
+
+# 知识库索引模板及其组件模板
+KB_MAPPINGS_COMPONENT = 'kb_mappings'
+KB_SETTINGS_COMPONENT = 'kb_settings'
+KB_INDEX_TEMPLATE = 'kb_template'
+SHARED_INDEX_TEMPLATE = 'kb_shared_template'
+
+
+class KbIndexManager:
+    """
+    知识库索引管理，知识库统一通过别名 kb_{kb_id} 读写，支持两种布局（配置 kb_index.layout）：
+    per_kb：每个知识库一个版本化索引 kb_{kb_id}_v{N}；重建索引时新建下一个版本，数据复制完成后原子切换别名，再删除旧版本；
+            兼容旧数据：别名不存在但存在同名实际索引 kb_{kb_id} 时直接使用，重建后由别名接管
+    shared：所有知识库共用少量共享索引，别名 kb_{kb_id} 为带 kb_id 过滤和路由的过滤别名，
+            写入自动按 kb_id 路由到同一分片，检索只访问该分片；适合大量小知识库，节省分片和集群状态
+    """
+
+    def __init__(self):
+        self.layout = LAYOUT_PER_KB
+        self.shared_index_prefix = 'rag_chunks'
+        self.shared_index_count = 1
+        # 已确认存在的知识库（进程内），避免每次写入和检索前都请求ES确认索引存在
+        self._known_kb_ids = set()
+        self._known_lock = threading.Lock()
+        self._initialize_config()
+
+    def _initialize_config(self):
+        kb_index_config = config.get_section('kb_index')
+        self.layout = kb_index_config.get('layout') or LAYOUT_PER_KB
+        if self.layout not in (LAYOUT_PER_KB, LAYOUT_SHARED):
+            raise ValueError(f"不支持的索引布局: {self.layout}")
+        self.shared_index_prefix = kb_index_config.get('shared_index_prefix', 'rag_chunks')
+        # 共享索引名不能与 kb_* 重叠：否则与知识库别名冲突，两个索引模板的匹配模式也会重叠
+        if not self.shared_index_prefix or self.shared_index_prefix.startswith('kb_') \
+                or 'kb_'.startswith(self.shared_index_prefix):
+            raise ValueError(f"共享索引名前缀不能与 kb_* 重叠: {self.shared_index_prefix}")
+        self.shared_index_count = max(1, kb_index_config.get('shared_index_count', 1))
+
+    @property
+    def supports_versioning(self) -> bool:
+        """是否支持按知识库重建索引（仅 per_kb 布局）"""
+        return self.layout == LAYOUT_PER_KB
+
+    def index_name(self, kb_id: str) -> str:
+        """知识库读写使用的名称（别名）"""
+        return f"kb_{kb_id}"
+
+    def version_index_name(self, kb_id: str, version: int) -> str:
+        """版本化索引名"""
+        return f"kb_{kb_id}_v{version}"
+
+    def shared_index_name(self, kb_id: str) -> str:
+        """shared布局下知识库所在的共享索引，多个共享索引时按kb_id哈希分配"""
+        if self.shared_index_count == 1:
+            return self.shared_index_prefix
+        return f"{self.shared_index_prefix}_{zlib.crc32(str(kb_id).encode('utf-8')) % self.shared_index_count}"
+
+    def install_templates(self) -> bool:
+        """
+        安装知识库索引模板（启动时调用）：kb_* 以及共享索引按模板自动获得mapping和settings，
+        即使其他进程删除了索引、写入时由ES自动创建，mapping也是正确的
+        ES不允许匹配模式重叠的两个模板优先级相同，共享索引模板使用更高的优先级
+        """
+        mapping = es_client.build_default_mapping()
+        settings = es_client.build_default_settings()
+        results = [
+            es_client.put_component_template(KB_MAPPINGS_COMPONENT, {"mappings": mapping}),
+            es_client.put_component_template(KB_SETTINGS_COMPONENT, {"settings": settings}),
+            es_client.put_index_template(KB_INDEX_TEMPLATE, ["kb_*"],
+                                         [KB_MAPPINGS_COMPONENT, KB_SETTINGS_COMPONENT], priority=200),
+            es_client.put_index_template(SHARED_INDEX_TEMPLATE, [f"{self.shared_index_prefix}*"],
+                                         [KB_MAPPINGS_COMPONENT, KB_SETTINGS_COMPONENT],
+                                         template={"mappings": {"_routing": {"required": True}}}, priority=201)
+        ]
+        return all(results)
+
+    def exists(self, kb_id: str) -> bool:
+        """知识库索引是否存在，已确认存在的不再请求ES"""
+        if kb_id in self._known_kb_ids:
+            return True
+        if es_client.index_exists(self.index_name(kb_id)):
+            self._remember(kb_id)
+            return True
+        return False
+
+    def invalidate(self, kb_id: str):
+        """知识库索引被删除（或检索时发现不存在）后移出已知列表"""
+        with self._known_lock:
+            self._known_kb_ids.discard(kb_id)
+
+    def _remember(self, kb_id: str):
+        with self._known_lock:
+            self._known_kb_ids.add(kb_id)
+
+    def ensure_index(self, kb_id: str) -> str:
+        """确保知识库索引存在，返回别名"""
+        alias = self.index_name(kb_id)
+        if self.exists(kb_id):
+            return alias
+
+        if self.layout == LAYOUT_SHARED:
+            if self._ensure_shared_alias(kb_id):
+                self._remember(kb_id)
+            return alias
+
+        # 别名丢失但版本索引还在时，别名指向最新版本
+        versions = self.list_versions(kb_id)
+        if versions:
+            latest = versions[-1]['index']
+            es_client.update_aliases([{"add": {"index": latest, "alias": alias, "is_write_index": True}}])
+            logger.warning(f"知识库别名缺失，已指向最新版本: {alias} -> {latest}")
+            self._remember(kb_id)
+            return alias
+
+        if es_client.create_index(self.version_index_name(kb_id, 1),
+                                  aliases={alias: {"is_write_index": True}}):
+            self._remember(kb_id)
+        return alias
+
+    def _ensure_shared_alias(self, kb_id: str) -> bool:
+        """shared布局：确保共享索引存在，并为知识库创建过滤别名"""
+        alias = self.index_name(kb_id)
+        shared_index = self.shared_index_name(kb_id)
+        if not es_client.index_exists(shared_index):
+            mapping = es_client.build_default_mapping()
+            # 写入必须带路由，避免绕过别名写到错误的分片
+            mapping['_routing'] = {"required": True}
+            es_client.create_index(shared_index, mapping=mapping)
+
+        return es_client.update_aliases([{"add": {
+            "index": shared_index,
+            "alias": alias,
+            "filter": {"term": {"kb_id": kb_id}},
+            "routing": kb_id
+        }}])
+
+    @contextmanager
+    def bulk_load(self, kb_id: str, file_size: int = None):
+        """
+        知识库批量导入模式（按实际索引计数，避免通过不同别名重复保存/恢复settings）
+        shared布局下共享索引同时服务其他知识库的检索，不进入批量导入模式；
+        file_size 小于 elasticsearch.bulk_load.min_file_size 的小文件也不进入，避免频繁修改settings
+        """
+        if file_size is not None and file_size < es_client.bulk_load_min_file_size:
+            yield
+            return
+        indices = self.current_indices(kb_id)
+        use_bulk_load = len(indices) == 1 and not self._is_shared(indices)
+        if not use_bulk_load:
+            yield
+            return
+        # 关闭刷新期间检索到的是导入前的数据，知识库记为有进行中的变更，不缓存检索结果
+        kb_generations.begin_pending(kb_id)
+        try:
+            with es_client.bulk_load(indices[0]):
+                yield
+        finally:
+            kb_generations.end_pending(kb_id)
+
+    def list_versions(self, kb_id: str) -> List[Dict[str, Any]]:
+        """列出知识库的版本化索引，按版本号升序"""
+        if self.layout == LAYOUT_SHARED:
+            return []
+        pattern = re.compile(rf"^{re.escape(self.index_name(kb_id))}_v(\d+)$")
+        versions = []
+        for index in es_client.list_indices(f"{self.index_name(kb_id)}_v*"):
+            match = pattern.match(index)
+            if match:
+                versions.append({'index': index, 'version': int(match.group(1))})
+        return sorted(versions, key=lambda v: v['version'])
+
+    def current_indices(self, kb_id: str) -> List[str]:
+        """别名当前指向的实际索引；旧数据为同名实际索引时返回该索引"""
+        alias = self.index_name(kb_id)
+        indices = es_client.get_alias_indices(alias)
+        if indices:
+            return indices
+        return [alias] if es_client.index_exists(alias) else []
+
+    def get_index_info(self, kb_id: str) -> Dict[str, Any]:
+        """知识库索引信息：别名、当前索引、所有版本"""
+        current = self.current_indices(kb_id)
+        return {
+            'kb_id': kb_id,
+            'layout': self.layout,
+            'alias': self.index_name(kb_id),
+            'current_indices': current,
+            'legacy': self.layout == LAYOUT_PER_KB and current == [self.index_name(kb_id)],
+            'versions': [{**v, 'current': v['index'] in current} for v in self.list_versions(kb_id)]
+        }
+
+    def create_next_version(self, kb_id: str, vector_options: Dict[str, Any] = None) -> Optional[str]:
+        """按当前配置新建下一个版本的索引（不挂别名），返回索引名"""
+        if not self.supports_versioning:
+            raise ValueError(f"{self.layout}布局不支持按知识库重建索引")
+        versions = self.list_versions(kb_id)
+        next_version = versions[-1]['version'] + 1 if versions else 1
+        index_name = self.version_index_name(kb_id, next_version)
+        if not es_client.create_index(index_name, vector_options=vector_options):
+            return None
+        return index_name
+
+    def switch_alias(self, kb_id: str, new_index: str) -> bool:
+        """原子地把别名切换到新索引；旧数据为同名实际索引时，同一请求中删除该索引并创建别名"""
+        alias = self.index_name(kb_id)
+        actions = []
+        if es_client.is_alias(alias):
+            actions.extend({"remove": {"index": index, "alias": alias}}
+                           for index in es_client.get_alias_indices(alias) if index != new_index)
+        elif es_client.index_exists(alias):
+            actions.append({"remove_index": {"index": alias}})
+        actions.append({"add": {"index": new_index, "alias": alias, "is_write_index": True}})
+        return es_client.update_aliases(actions)
+
+    def gc_versions(self, kb_id: str, keep: int = 0) -> List[str]:
+        """删除别名未指向的旧版本索引，保留最近 keep 个旧版本，返回删除的索引"""
+        current = set(self.current_indices(kb_id))
+        old_versions = [v['index'] for v in self.list_versions(kb_id) if v['index'] not in current]
+        to_delete = old_versions[:-keep] if keep > 0 else old_versions
+        deleted = [index for index in to_delete if es_client.delete_index(index)]
+        if deleted:
+            logger.info(f"旧版本索引已删除: {deleted}")
+        return deleted
+
+    def drop(self, kb_id: str) -> bool:
+        """删除知识库的所有索引（别名随索引一起删除）；shared布局下删除知识库的文档和过滤别名"""
+        self.invalidate(kb_id)
+        current = self.current_indices(kb_id)
+        # 按实际所在的索引判断，切换布局前创建的知识库仍按原布局删除，避免误删共享索引
+        if self._is_shared(current):
+            return self._drop_shared(kb_id)
+        indices = set(current) | {v['index'] for v in self.list_versions(kb_id)}
+        return all([es_client.delete_index(index) for index in indices])
+
+    def _is_shared(self, indices: List[str]) -> bool:
+        """是否为共享索引"""
+        return any(index == self.shared_index_prefix or index.startswith(f"{self.shared_index_prefix}_")
+                   for index in indices)
+
+    def _drop_shared(self, kb_id: str) -> bool:
+        """shared布局：按kb_id删除共享索引中的文档，再删除过滤别名"""
+        alias = self.index_name(kb_id)
+        indices = es_client.get_alias_indices(alias)
+        if not indices:
+            return True
+
+        response = es_client.delete_by_query(alias, {"term": {"kb_id": kb_id}})
+        if response is None or response.get('failures'):
+            logger.error(f"共享索引中知识库文档删除失败: {kb_id}")
+            return False
+        return es_client.update_aliases([{"remove": {"index": index, "alias": alias}} for index in indices])
+
+
+# 全局知识库索引管理实例
+kb_index_manager = KbIndexManager()
@@ -1,6 +1,7 @@
 from minio import Minio
+from minio.deleteobjects import DeleteObject
 from minio.error import S3Error
-from typing import Optional, BinaryIO
+from typing import Optional, BinaryIO, List
 import logging
 from utils.config import config
 
@@ -109,6 +110,40 @@ class MinioClient:
             logger.error(f"文件删除失败: {e}")
             return False
 
+    def delete_files(self, object_names: List[str]) -> bool:
+        """批量删除文件"""
+        try:
+            errors = self.client.remove_objects(
+                self.bucket_name,
+                (DeleteObject(object_name) for object_name in object_names)
+            )
+            # remove_objects 是惰性执行的，需要遍历结果
+            failed = [error for error in errors]
+            for error in failed:
+                logger.error(f"文件删除失败: {error}")
+            logger.info(f"文件批量删除完成: {len(object_names) - len(failed)}/{len(object_names)}")
+            return not failed
+        except S3Error as e:
+            logger.error(f"文件批量删除失败: {e}")
+            return False
+
+    def delete_prefix(self, prefix: str) -> bool:
+        """删除指定前缀下的所有文件"""
+        try:
+            objects = self.client.list_objects(self.bucket_name, prefix=prefix, recursive=True)
+            errors = self.client.remove_objects(
+                self.bucket_name,
+                (DeleteObject(obj.object_name) for obj in objects)
+            )
+            failed = [error for error in errors]
+            for error in failed:
+                logger.error(f"文件删除失败: {error}")
+            logger.info(f"前缀文件删除完成: {prefix}")
+            return not failed
+        except S3Error as e:
+            logger.error(f"前缀文件删除失败: {e}")
+            return False
+
     def file_exists(self, object_name: str) -> bool:
         """检查文件是否存在"""
         try:
@@ -1 +1 @@
-__all__ = ["chunk", "document", "dto"]
\ No newline at end of file
+__all__ = ["chunk", "document", "ingest_job", "dto"]
\ No newline at end of file
@@ -12,7 +12,7 @@ class Chunk(Base):
     document_id = Column(String(36), nullable=False, comment='文档id')
     chunk_content = Column(Text, nullable=False, comment='分块内容（长文本）')
     chunk_status = Column(SmallInteger, nullable=False, default=1, comment='分块状态 1-启用 0-禁用')
-    index_status = Column(String(2), nullable=False, default='00', comment='同步到es状态')
+    index_status = Column(String(2), nullable=False, default='00', comment='同步到es状态 00-未同步 01-已同步 02-同步失败 10-待更新')
     chunk_order = Column(Integer, comment='排序，从1开始')
     kb_id = Column(String(64), nullable=False, comment='所属知识库id')
     created_time = Column(DateTime, nullable=False, default=func.now(), comment='创建时间')
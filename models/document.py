@@ -10,7 +10,7 @@ class Document(Base):
 
     document_id = Column(String(36), primary_key=True, comment='文档id')
     document_name = Column(String(255), nullable=False, comment='文档名称')
-    document_status = Column(SmallInteger, nullable=False, default=1, comment='状态 1-启用 0-禁用 2-失败')
+    document_status = Column(SmallInteger, nullable=False, default=1, comment='状态 1-启用 0-禁用 2-失败 3-删除中')
     document_error = Column(Text, comment='失败原因（长文本）')
     document_order = Column(Integer, comment='排序，从1开始')
     kb_id = Column(String(64), nullable=False, comment='所属知识库id')
@@ -14,6 +14,18 @@ class ChunkStatusModify(TypedDict):
 
 
 
+class SearchHit(TypedDict):
+    """检索结果（不包含向量字段）"""
+    chunk_id: str
+    score: float
+    content: str
+    document_id: str
+    document_name: str
+    kb_id: str
+    metadata: dict
+
+
+
 # if __name__ == '__main__':
 #     document_status_modify = DocumentStatusModify(document_id="1", document_status="1")
 #     print(document_status_modify, type(document_status_modify))
@@ -0,0 +1,48 @@
+import json
+
+from sqlalchemy import Column, String, Integer, DateTime, Text, SmallInteger, Index
+from sqlalchemy.sql import func
+from core.database import Base
+
+
+class IngestJob(Base):
+    """文档入库任务模型"""
+    __tablename__ = 'tb_ingest_job'
+
+    job_id = Column(String(36), primary_key=True, comment='任务id')
+    document_id = Column(String(36), nullable=False, comment='文档id')
+    kb_id = Column(String(64), nullable=False, comment='所属知识库id')
+    job_status = Column(SmallInteger, nullable=False, default=0, comment='任务状态 0-排队中 1-处理中 2-成功 3-失败 4-部分失败 5-已取消')
+    current_stage = Column(String(16), comment='当前阶段 parse/split/embed/index')
+    stage_progress = Column(Text, comment='各阶段进度（JSON）')
+    chunk_count = Column(Integer, comment='成功入库的分块数量')
+    job_error = Column(Text, comment='失败原因（长文本）')
+    started_time = Column(DateTime, comment='开始处理时间')
+    finished_time = Column(DateTime, comment='结束时间')
+    created_time = Column(DateTime, nullable=False, default=func.now(), comment='创建时间')
+    created_by = Column(String(64), comment='创建人')
+    updated_time = Column(DateTime, nullable=False, default=func.now(), onupdate=func.now(), comment='更新时间')
+
+    # 索引定义
+    __table_args__ = (
+        Index('idx_job_document_id', 'document_id'),
+        Index('idx_job_kb_id', 'kb_id'),
+    )
+
+    def to_dict(self):
+        """转换为字典"""
+        return {
+            'job_id': self.job_id,
+            'document_id': self.document_id,
+            'kb_id': self.kb_id,
+            'job_status': self.job_status,
+            'current_stage': self.current_stage,
+            'stage_progress': json.loads(self.stage_progress) if self.stage_progress else {},
+            'chunk_count': self.chunk_count,
+            'job_error': self.job_error,
+            'started_time': self.started_time.isoformat() if self.started_time else None,
+            'finished_time': self.finished_time.isoformat() if self.finished_time else None,
+            'created_time': self.created_time.isoformat() if self.created_time else None,
+            'created_by': self.created_by,
+            'updated_time': self.updated_time.isoformat() if self.updated_time else None
+        }
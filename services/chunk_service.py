@@ -1,12 +1,19 @@
 import logging
+import threading
+import time
 import uuid
+from datetime import datetime
 from typing import List, Dict, Any, Optional
 
-from sqlalchemy import desc, asc
+from sqlalchemy import desc, asc, insert
 
 from core.database import db_manager, PaginationQuery
 from core.elasticsearch_client import es_client
+from core.es_scripts import SCRIPT_SET_ENABLED
+from core.kb_index import kb_index_manager
 from models.chunk import Chunk
+from utils.cache_utils import kb_generations
+from utils.config import config
 
 logger = logging.getLogger(__name__)
 
@@ -14,6 +21,13 @@ logger = logging.getLogger(__name__)
 class ChunkService:
     """分块服务"""
 
+    def __init__(self):
+        # 批量入库时每批写入MySQL和ES的分块数量
+        self.bulk_batch_size = config.get('ingest_job.bulk_batch_size', 500)
+        # 异步按查询更新任务的轮询间隔和最长等待时间（秒），任务完成前知识库的检索结果不缓存
+        self.task_poll_interval = config.get('document.status_task_poll_interval', 2)
+        self.task_watch_timeout = config.get('document.status_task_timeout', 3600)
+
     def create_chunk(self, chunk_data: Dict[str, Any]) -> Optional[str]:
         """创建分块"""
         try:
@@ -47,27 +61,13 @@ class ChunkService:
                 return
 
             # 构建ES文档
-            es_doc = {
-                'kb_id': chunk.kb_id,
-                'id': chunk.chunk_id,
-                'chunk_content': chunk.chunk_content,
-                'chunk_embedding': embedding,
-                'document_id': chunk.document_id,
-                'metadata': {
-                    'enabled': chunk.chunk_status == 1,
-                    'chunk_status': str(chunk.chunk_status),
-                    'document_id': chunk.document_id
-                }
-            }
+            es_doc = self.build_es_doc(chunk, embedding)
 
-            # 索引到ES
-            index_name = f"kb_{chunk.kb_id}"
-
-            # 确保索引存在
-            if not es_client.index_exists(index_name):
-                es_client.create_index(index_name)
+            # 索引到ES，确保索引存在
+            index_name = self.ensure_index(chunk.kb_id)
 
             success = es_client.add_document(index_name, chunk.chunk_id, es_doc)
+            kb_generations.bump(chunk.kb_id)
 
             if success:
                 # 更新索引状态
@@ -82,6 +82,103 @@ class ChunkService:
         except Exception as e:
             logger.error(f"分块索引异常: {e}")
 
+    def build_es_doc(self, chunk: Chunk, embedding: List[float], enabled: bool = None) -> Dict[str, Any]:
+        """构建分块对应的ES文档，enabled 为所属文档是否启用，为空时按分块状态"""
+        return {
+            'kb_id': chunk.kb_id,
+            'id': chunk.chunk_id,
+            'chunk_content': chunk.chunk_content,
+            'chunk_embedding': embedding,
+            'document_id': chunk.document_id,
+            'created_time': (chunk.created_time or datetime.now()).isoformat(),
+            'metadata': {
+                'enabled': chunk.chunk_status == 1 if enabled is None else enabled,
+                'chunk_status': str(chunk.chunk_status),
+                'document_id': chunk.document_id
+            }
+        }
+
+    def ensure_index(self, kb_id: str) -> str:
+        """确保知识库索引存在，返回索引名（别名）"""
+        return kb_index_manager.ensure_index(kb_id)
+
+    def create_chunks_bulk(self, chunk_data_list: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        批量创建分块：按批次多行写入MySQL，一次bulk写入ES，再批量更新索引状态
+        返回: {"success": [成功的chunk_id], "failed": [{"chunk_id": ..., "error": ...}]}
+        """
+        result = {'success': [], 'failed': []}
+        if not chunk_data_list:
+            return result
+
+        for chunk_data in chunk_data_list:
+            if not chunk_data.get('chunk_id'):
+                chunk_data['chunk_id'] = str(uuid.uuid4())
+
+        for start in range(0, len(chunk_data_list), self.bulk_batch_size):
+            batch = chunk_data_list[start:start + self.bulk_batch_size]
+            chunks = [Chunk.from_dict(chunk_data) for chunk_data in batch]
+            # 创建时间同时写入MySQL和ES，用于按时间范围过滤检索
+            now = datetime.now()
+            for chunk in chunks:
+                chunk.created_time = chunk.created_time or now
+
+            # 批量写入数据库
+            try:
+                rows = [{
+                    'chunk_id': chunk.chunk_id,
+                    'document_id': chunk.document_id,
+                    'chunk_content': chunk.chunk_content,
+                    'chunk_status': chunk.chunk_status,
+                    'index_status': chunk.index_status,
+                    'chunk_order': chunk.chunk_order,
+                    'kb_id': chunk.kb_id,
+                    'created_time': chunk.created_time,
+                    'created_by': chunk.created_by,
+                    'updated_by': chunk.updated_by
+                } for chunk in chunks]
+                with db_manager.get_session() as session:
+                    session.execute(insert(Chunk), rows)
+            except Exception as e:
+                logger.error(f"分块批量写入数据库失败: {e}")
+                result['failed'].extend({'chunk_id': chunk.chunk_id, 'error': f"数据库写入失败: {e}"}
+                                        for chunk in chunks)
+                continue
+
+            # 构建ES文档，没有向量的分块无法索引，与索引失败的分块一样标记为同步失败
+            indexed_ids, index_failed_ids = [], []
+            docs_by_kb: Dict[str, List[Dict[str, Any]]] = {}
+            for chunk, chunk_data in zip(chunks, batch):
+                embedding = chunk_data.get('chunk_vector')
+                if not embedding:
+                    index_failed_ids.append(chunk.chunk_id)
+                    result['failed'].append({'chunk_id': chunk.chunk_id, 'error': '缺少向量'})
+                    continue
+                docs_by_kb.setdefault(chunk.kb_id, []).append(self.build_es_doc(chunk, embedding))
+
+            for kb_id, docs in docs_by_kb.items():
+                # 确保索引存在（已确认存在的知识库不再请求ES）
+                index_name = self.ensure_index(kb_id)
+
+                for item in es_client.bulk_index_documents(index_name, docs):
+                    if item['ok']:
+                        indexed_ids.append(item['id'])
+                    else:
+                        index_failed_ids.append(item['id'])
+                        result['failed'].append({'chunk_id': item['id'], 'error': item['error']})
+
+            # 更新索引状态：成功01，缺少向量或索引失败02（可按状态重新索引）
+            if index_failed_ids:
+                self.batch_update_index_status(index_failed_ids, '02')
+            if indexed_ids:
+                self.batch_update_index_status(indexed_ids, '01')
+                for kb_id in docs_by_kb:
+                    kb_generations.bump(kb_id)
+            result['success'].extend(indexed_ids)
+
+        logger.info(f"分块批量创建完成: 成功{len(result['success'])}个, 失败{len(result['failed'])}个")
+        return result
+
     def get_chunk(self, chunk_id: str) -> Optional[Dict[str, Any]]:
         """获取分块"""
         try:
@@ -110,6 +207,7 @@ class ChunkService:
                 if 'chunk_content' in kwargs or 'chunk_status' in kwargs:
                     chunk.index_status = '10'  # 标记为需要更新
                     self._index_chunk_to_es(chunk)
+                    kb_generations.bump(chunk.kb_id)
 
                 logger.info(f"分块更新成功: {chunk_id}")
                 return True
@@ -126,8 +224,9 @@ class ChunkService:
                     return False
 
                 # 从ES中删除
-                index_name = f"kb_{chunk.kb_id}"
+                index_name = kb_index_manager.index_name(chunk.kb_id)
                 es_client.delete_document(index_name, chunk_id)
+                kb_generations.bump(chunk.kb_id)
 
                 # 删除数据库记录
                 session.delete(chunk)
@@ -141,9 +240,10 @@ class ChunkService:
     def modify_document_status(self, chunk: Chunk, document_status: int) -> bool:
         """修改文档状态"""
         try:
-            index_name = f"kb_{chunk.kb_id}"
+            index_name = kb_index_manager.index_name(chunk.kb_id)
             # 更新es文档状态
             es_client.update_document(index_name, chunk.chunk_id, {'metadata': {'enabled': document_status == 1}})
+            kb_generations.bump(chunk.kb_id)
 
             logger.info(f"分块es更新成功: {chunk.chunk_id}")
             return True
@@ -151,6 +251,61 @@ class ChunkService:
             logger.error(f"分块es更新失败: {e}")
             return False
 
+    def modify_documents_enabled(self, kb_id: str, document_ids: List[str], enabled: bool,
+                                 wait_for_completion: bool = True) -> Optional[Dict[str, Any]]:
+        """
+        批量修改文档下所有分块在ES中的启用状态，一次 update_by_query 完成
+        返回 {"updated": 更新数量, "failures": [...]}，异步执行时返回 {"task": ES任务id}；失败返回None
+        """
+        if not document_ids:
+            return {"updated": 0, "failures": []}
+
+        index_name = kb_index_manager.index_name(kb_id)
+        response = es_client.update_by_query(
+            index_name,
+            query={"terms": {"document_id": document_ids}},
+            script=es_client.script(SCRIPT_SET_ENABLED, {"enabled": enabled}),
+            wait_for_completion=wait_for_completion
+        )
+        kb_generations.bump(kb_id)
+        if response is not None and 'task' in response:
+            self._watch_update_task(kb_id, response['task'])
+
+        if response is None:
+            logger.error(f"分块es批量更新失败: {index_name}, 文档数: {len(document_ids)}")
+        else:
+            logger.info(f"分块es批量更新成功: {index_name}, 文档数: {len(document_ids)}, "
+                        f"更新: {response.get('updated', response.get('task'))}")
+        return response
+
+    def _watch_update_task(self, kb_id: str, task_id: str):
+        """
+        后台轮询异步按查询更新任务：任务完成并refresh前，已修改和未修改的分块混在检索结果中，
+        知识库记为有进行中的变更（不缓存检索结果），完成或超时后递增版本号
+        """
+        kb_generations.begin_pending(kb_id)
+
+        def watch():
+            deadline = time.monotonic() + self.task_watch_timeout
+            misses = 0
+            try:
+                while time.monotonic() < deadline:
+                    task = es_client.get_task(task_id)
+                    if task is not None and task.get('completed'):
+                        logger.info(f"异步按查询更新完成: {kb_id}, {task_id}")
+                        return
+                    # 任务不存在或查询失败连续多次时不再等待
+                    misses = misses + 1 if task is None else 0
+                    if misses >= 3:
+                        logger.warning(f"异步按查询更新任务状态获取失败，不再等待: {kb_id}, {task_id}")
+                        return
+                    time.sleep(self.task_poll_interval)
+                logger.warning(f"异步按查询更新等待超时: {kb_id}, {task_id}")
+            finally:
+                kb_generations.end_pending(kb_id)
+
+        threading.Thread(target=watch, name=f"es-task-watch-{task_id}", daemon=True).start()
+
     def modify_status(self, chunk_id: str, chunk_status: int) -> bool:
         """修改块状态"""
         try:
@@ -162,9 +317,10 @@ class ChunkService:
                 # 实体类字段更新后，在session执行session.commit() 会更新数据库
                 chunk.chunk_status = chunk_status
                 # 更新es数据
-                index_name = f"kb_{chunk.kb_id}"
+                index_name = kb_index_manager.index_name(chunk.kb_id)
                 es_client.update_document(index_name, chunk.chunk_id,
                                           {'metadata': {'chunk_status': chunk_status}})
+                kb_generations.bump(chunk.kb_id)
 
 
                 logger.info(f"分块状态更新成功: {chunk_id}")
@@ -211,11 +367,12 @@ class ChunkService:
         """批量更新索引状态"""
         try:
             with db_manager.get_session() as session:
-                chunks = session.query(Chunk).filter(Chunk.chunk_id.in_(chunk_ids)).all()
-                for chunk in chunks:
-                    chunk.index_status = status
+                # 单条UPDATE语句完成，不再逐条加载实体
+                updated = session.query(Chunk).filter(Chunk.chunk_id.in_(chunk_ids)).update(
+                    {Chunk.index_status: status}, synchronize_session=False
+                )
 
-                logger.info(f"批量更新索引状态成功: {len(chunks)}个分块")
+                logger.info(f"批量更新索引状态成功: {updated}个分块")
                 return True
         except Exception as e:
             logger.error(f"批量更新索引状态失败: {e}")
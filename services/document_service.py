@@ -1,22 +1,29 @@
 import logging
 import os
 import tempfile
+import threading
+import time
 import uuid
 from string import Template
-from typing import List, Dict, Any, Optional, Tuple
+from typing import List, Dict, Any, Optional, Tuple, Callable
 
 from langchain_community.graphs.graph_document import GraphDocument
 from langchain_core.prompts import HumanMessagePromptTemplate, SystemMessagePromptTemplate, ChatPromptTemplate
 from langchain_experimental.graph_transformers import LLMGraphTransformer
-from sqlalchemy import desc, asc
+from sqlalchemy import desc, asc, func
 from werkzeug.datastructures import FileStorage
 
 from core.database import db_manager, PaginationQuery
+from core.elasticsearch_client import es_client
+from core.job_executor import job_executor
+from core.kb_index import kb_index_manager
 from core.minio_client import minio_client
 from models.chunk import Chunk
 from models.document import Document
 from services.chunk_service import ChunkService
+from services.ingest_job_service import IngestJobService
 from services.knowledge_graph_service import KnowledgeGraphService
+from utils.cache_utils import kb_generations
 from utils.embedding_utils import embedding_utils
 from utils.text_splitter import TextSplitter
 from core.llm_client import llm_client
@@ -25,6 +32,14 @@ from utils.config import config
 logger = logging.getLogger(__name__)
 
 
+class DocumentDeletedError(Exception):
+    """入库过程中文档被删除"""
+
+
+class IngestCancelledError(Exception):
+    """入库任务已取消（知识库被删除）"""
+
+
 class DocumentService:
     """文档服务"""
 
@@ -32,13 +47,34 @@ class DocumentService:
         self.text_splitter = TextSplitter()
         self.chunk_service = ChunkService()
         self.knowledge_graph_service = KnowledgeGraphService()
+        self.ingest_job_service = IngestJobService()
+        # 批量修改状态时，知识库内受影响分块数达到该值则异步执行update_by_query
+        self.status_async_threshold = config.get('document.status_async_threshold', 5000)
+        # 定时清理删除中文档的间隔（秒），清理任务提交失败或ES清理失败的文档由定时清理兜底
+        self.purge_interval = config.get('document.purge_interval', 300)
+        # 同一时间只执行一个全量清理
+        self._purge_lock = threading.Lock()
+        self._purger_started = False
+        # 删除知识库时等待本进程内运行中的入库任务停止的最长时间（秒）
+        self.cancel_wait_seconds = config.get('ingest_job.cancel_wait_seconds', 60)
+        # 本进程内运行中的入库任务数：知识库ID -> 任务数
+        self._running_jobs: Dict[str, int] = {}
+        self._running_jobs_cond = threading.Condition()
 
     def create_document(self, document_name: str, kb_id: str,
-                        file: FileStorage, created_by: str = None) -> Optional[str]:
-        """创建文档"""
+                        file: FileStorage, created_by: str = None) -> Optional[Dict[str, str]]:
+        """
+        创建文档：保存文件并提交后台入库任务，返回文档id和任务id
+        任务队列已满、任务未能提交时返回的结果中 rejected 为True（文档已标记为失败）
+        """
         document_id = str(uuid.uuid4())
+        object_name = f"{kb_id}/{document_id}/{document_name}"
+        spool_path = None
 
         try:
+            # 上传文件先落盘暂存，后台任务直接从本地文件解析
+            spool_path = self._spool_upload(file, document_name)
+
             with db_manager.get_session() as session:
                 # 创建文档记录
                 document = Document(
@@ -52,39 +88,141 @@ class DocumentService:
                 session.flush()
 
                 # 上传文件到MinIO
-                object_name = f"{kb_id}/{document_id}/{document_name}"
-                file.stream.seek(0)  # 重置文件指针
-                success = minio_client.upload_file(
-                    object_name=object_name,
-                    file_data=file.stream,
-                    file_size=file.content_length
-                )
-
-                if not success:
-                    raise Exception("文件上传失败")
-
-                # 处理文档内容
-                file.stream.seek(0)  # 重置文件指针
-
-                # 处理文件数据，使用es、embedding 等方式处理文档内容  【普通RAG方案】
-                self._process_document_content(document_id, document_name, kb_id, file.stream.read())
-
-                # 改造成graph知识图谱模型处室文档内容，将数据存储到neo4j数据库中   【graphRAG方案】
-                # self._process_document_graph(document_id, document_name, kb_id, file.stream.read())
-
-                logger.info(f"文档创建成功: {document_id}")
-                return document_id
+                minio_client.upload_file_from_path(object_name=object_name, file_path=spool_path)
 
         except Exception as e:
             logger.error(f"文档创建失败: {e}")
             # 回滚：删除已上传的文件
             try:
-                object_name = f"{kb_id}/{document_id}/{document_name}"
                 minio_client.delete_file(object_name)
             except:
                 pass
+            self._remove_spool_file(spool_path)
             return None
 
+        job_id = self.ingest_job_service.create_job(document_id, kb_id, created_by)
+        if not job_id:
+            self._mark_document_failed(document_id, "入库任务创建失败")
+            self._remove_spool_file(spool_path)
+            return None
+
+        # 处理文件数据，使用es、embedding 等方式处理文档内容  【普通RAG方案】
+        submitted = job_executor.submit(self._run_ingest_job, job_id, document_id, document_name, kb_id, spool_path)
+        if not submitted:
+            error = "任务队列已满，请稍后重试"
+            self.ingest_job_service.mark_failed(job_id, error)
+            self._mark_document_failed(document_id, error)
+            self._remove_spool_file(spool_path)
+            logger.warning(f"入库任务提交失败: {job_id}, 文档: {document_id}, {error}")
+            return {'document_id': document_id, 'job_id': job_id, 'rejected': True}
+
+        # 改造成graph知识图谱模型处室文档内容，将数据存储到neo4j数据库中   【graphRAG方案】
+        # self._process_document_graph(document_id, document_name, kb_id, file.stream.read())
+
+        logger.info(f"文档创建成功: {document_id}, 入库任务: {job_id}")
+        return {'document_id': document_id, 'job_id': job_id}
+
+    def can_accept_job(self) -> bool:
+        """后台任务队列是否还能接收新任务"""
+        return not job_executor.is_full()
+
+    def _spool_upload(self, file: FileStorage, document_name: str) -> str:
+        """将上传文件流式写入本地暂存文件"""
+        spool_dir = config.get('ingest_job.spool_dir') or None
+        if spool_dir:
+            os.makedirs(spool_dir, exist_ok=True)
+        fd, spool_path = tempfile.mkstemp(suffix=os.path.splitext(document_name)[1], dir=spool_dir)
+        os.close(fd)
+        file.save(spool_path)
+        return spool_path
+
+    def _remove_spool_file(self, spool_path: Optional[str]):
+        """删除暂存文件"""
+        if spool_path and os.path.exists(spool_path):
+            try:
+                os.unlink(spool_path)
+            except OSError as e:
+                logger.warning(f"暂存文件删除失败: {spool_path}, {e}")
+
+    def _run_ingest_job(self, job_id: str, document_id: str, document_name: str,
+                        kb_id: str, file_path: str):
+        """执行入库任务（后台线程）"""
+        # 先登记为运行中再更新任务状态，删除知识库时取消任务后能等到本任务停止
+        with self._running_jobs_cond:
+            self._running_jobs[kb_id] = self._running_jobs.get(kb_id, 0) + 1
+        if not self.ingest_job_service.mark_running(job_id):
+            # 排队期间任务已取消（知识库被删除）
+            logger.warning(f"入库任务不是排队状态，不再执行: {job_id}")
+            self._remove_spool_file(file_path)
+            self._unregister_running_job(kb_id)
+            return
+
+        def report_progress(stage: str, done: int, total: int):
+            self.ingest_job_service.update_progress(job_id, stage, done, total)
+
+        try:
+            # 大文件入库期间索引进入批量导入模式，结束后恢复刷新；恢复后分块才可被检索，需要使检索缓存失效
+            self.chunk_service.ensure_index(kb_id)
+            try:
+                with kb_index_manager.bulk_load(kb_id, file_size=os.path.getsize(file_path)):
+                    chunk_count, failed_count = self._process_document_content(
+                        document_id, document_name, kb_id, file_path, progress_callback=report_progress,
+                        job_id=job_id)
+            finally:
+                kb_generations.bump(kb_id)
+            if failed_count:
+                error = f"部分分块入库失败: {failed_count}/{chunk_count + failed_count}个"
+                self.ingest_job_service.mark_partial(job_id, chunk_count, error)
+                logger.warning(f"入库任务部分失败: {job_id}, 文档: {document_id}, {error}")
+            else:
+                self.ingest_job_service.mark_success(job_id, chunk_count)
+                logger.info(f"入库任务完成: {job_id}, 文档: {document_id}, 分块数量: {chunk_count}")
+        except DocumentDeletedError as e:
+            logger.warning(f"入库任务停止: {job_id}, {e}")
+            self.ingest_job_service.mark_failed(job_id, str(e))
+        except IngestCancelledError as e:
+            # 任务状态已由取消方更新
+            logger.warning(f"入库任务停止: {job_id}, {e}")
+        except Exception as e:
+            logger.error(f"入库任务失败: {job_id}, {e}")
+            self.ingest_job_service.mark_failed(job_id, str(e))
+            self._mark_document_failed(document_id, str(e))
+        finally:
+            self._remove_spool_file(file_path)
+            # 入库期间文档被删除时，清理任务可能与入库并发执行，之后写入的分块需要再清理一次
+            if self._is_document_deleted(document_id):
+                self._submit_purge([document_id])
+            self._unregister_running_job(kb_id)
+
+    def _unregister_running_job(self, kb_id: str):
+        """运行中的入库任务结束，通知等待知识库删除的线程"""
+        with self._running_jobs_cond:
+            self._running_jobs[kb_id] -= 1
+            if not self._running_jobs[kb_id]:
+                del self._running_jobs[kb_id]
+            self._running_jobs_cond.notify_all()
+
+    def _mark_document_failed(self, document_id: str, error: str):
+        """更新文档状态为失败，已标记删除的文档不修改（保留删除标记）"""
+        try:
+            with db_manager.get_session() as session:
+                session.query(Document) \
+                    .filter(Document.document_id == document_id, Document.document_status != 3) \
+                    .update({Document.document_status: 2, Document.document_error: error}, synchronize_session=False)
+        except Exception as e:
+            logger.error(f"文档失败状态更新失败: {document_id}, {e}")
+
+    def _is_document_deleted(self, document_id: str) -> bool:
+        """文档是否已删除或标记为删除中"""
+        try:
+            with db_manager.get_session() as session:
+                document_status = session.query(Document.document_status) \
+                    .filter(Document.document_id == document_id).scalar()
+            return document_status is None or document_status == 3
+        except Exception as e:
+            logger.error(f"文档状态查询失败: {document_id}, {e}")
+            return False
+
 
     def _process_document_graph(self, document_id: str, document_name: str,
                                   kb_id: str, file_data: bytes):
@@ -128,53 +266,66 @@ class DocumentService:
 
 
 
-    def _process_document_content(self, document_id: str, document_name: str,
-                                  kb_id: str, file_data: bytes):
-        """处理文档内容"""
-        try:
-            # 创建临时文件
-            with tempfile.NamedTemporaryFile(delete=False, suffix=os.path.splitext(document_name)[1]) as temp_file:
-                temp_file.write(file_data)
-                temp_file_path = temp_file.name
-
-            try:
-                # 分割文档
-                chunks = self.text_splitter.load_and_split_file(
-                    temp_file_path, document_id, kb_id
-                )
-
-                logger.info(f"文档分割完成: {document_id}, 分块数量: {len(chunks)}")
-                text_list = [f['chunk_content'] for f in chunks]
-                chunk_vectors = embedding_utils.get_embeddings(text_list)
-                logger.info(f"文档分割完成并完成embedding: {document_id}, embedding数量: {len(chunk_vectors)}")
-                # 批量创建分块
-                for i, chunk_data in enumerate(chunks):
-                    chunk_data['chunk_vector'] = chunk_vectors[i]
-                    self.chunk_service.create_chunk(chunk_data)
-
-                logger.info(f"文档处理完成: {document_id}, 分块数量: {len(chunks)}")
-
-
-                # logger.info(f"文档分割完成: {document_id}, 分块数量: {len(chunks)}")
-                # # 批量创建分块
-                # for chunk_data in chunks:
-                #     # 改用单个embedding获取，上面批量获取embedding速度太慢了【改回单个embedding】
-                #     chunk_data['chunk_vector'] = embedding_utils.get_embedding(chunk_data['chunk_content'])
-                #     self.chunk_service.create_chunk(chunk_data)
-                # logger.info(f"文档处理完成: {document_id}, 分块数量: {len(chunks)}")
-
-            finally:
-                # 删除临时文件
-                os.unlink(temp_file_path)
-
-        except Exception as e:
-            logger.error(f"文档处理失败: {e}")
-            # 更新文档状态为失败
-            with db_manager.get_session() as session:
-                document = session.query(Document).filter_by(document_id=document_id).first()
-                if document:
-                    document.document_status = 2
-                    document.document_error = str(e)
+    def _process_document_content(self, document_id: str, document_name: str, kb_id: str, file_path: str,
+                                  progress_callback: Callable[[str, int, Optional[int]], None] = None,
+                                  job_id: str = None) -> Tuple[int, int]:
+        """
+        流式处理文档内容，返回 (成功入库的分块数, 入库失败的分块数)
+        文件按页/段解析、增量分割，分块攒满一批后立即向量化并入库，内存占用与文件大小无关
+        job_id 不为空时每批入库前确认任务未被取消
+        """
+        report = progress_callback or (lambda stage, done, total: None)
+        counters = {'parse': 0, 'split': 0, 'embed': 0, 'index': 0, 'failed': 0}
+
+        def counted_sections():
+            for section in self.text_splitter.iter_file_sections(file_path):
+                counters['parse'] += 1
+                yield section
+
+        def flush(batch: List[Dict[str, Any]]):
+            # 每批入库前确认任务未被取消、文档未被删除，否则停止入库
+            if job_id and self.ingest_job_service.is_cancelled(job_id):
+                raise IngestCancelledError(f"入库任务已取消，停止入库: {job_id}")
+            if self._is_document_deleted(document_id):
+                raise DocumentDeletedError(f"文档已删除，停止入库: {document_id}")
+
+            report('parse', counters['parse'], None)
+            report('split', counters['split'], None)
+
+            chunk_vectors = embedding_utils.get_embeddings([f['chunk_content'] for f in batch])
+            for chunk_data, vector in zip(batch, chunk_vectors):
+                chunk_data['chunk_vector'] = vector
+            counters['embed'] += sum(1 for v in chunk_vectors if v)
+            report('embed', counters['embed'], None)
+
+            bulk_result = self.chunk_service.create_chunks_bulk(batch)
+            counters['index'] += len(bulk_result['success'])
+            counters['failed'] += len(bulk_result['failed'])
+            report('index', counters['index'], None)
+
+        batch = []
+        for chunk_data in self.text_splitter.iter_split_sections(counted_sections(), document_id, kb_id):
+            counters['split'] += 1
+            batch.append(chunk_data)
+            if len(batch) >= self.chunk_service.bulk_batch_size:
+                flush(batch)
+                batch = []
+        if batch:
+            flush(batch)
+
+        total = counters['split']
+        report('parse', counters['parse'], counters['parse'])
+        report('split', total, total)
+        report('embed', counters['embed'], total)
+        report('index', counters['index'], total)
+
+        if total and counters['index'] == 0:
+            raise Exception(f"分块全部入库失败: {counters['failed']}个")
+        if counters['failed']:
+            logger.warning(f"文档部分分块入库失败: {document_id}, 失败{counters['failed']}/{total}个")
+
+        logger.info(f"文档处理完成: {document_id}, 分块数量: {total}, 成功入库: {counters['index']}")
+        return counters['index'], counters['failed']
 
     def get_document(self, document_id: str) -> Optional[Dict[str, Any]]:
         """获取文档"""
@@ -208,57 +359,259 @@ class DocumentService:
 
     def delete_document(self, document_id: str) -> bool:
         """删除文档"""
+        result = self.batch_delete_documents([document_id])
+        return document_id in result['deleted']
+
+    def batch_delete_documents(self, document_ids: List[str]) -> Dict[str, Any]:
+        """
+        批量删除文档：先标记为删除中（一条UPDATE）并立即返回，分块、ES数据和MinIO文件由后台任务清理
+        返回: {"deleted": [...], "not_found": [...], "failed": [...]}
+        """
+        result = {'deleted': [], 'not_found': [], 'failed': []}
         try:
             with db_manager.get_session() as session:
-                document = session.query(Document).filter_by(document_id=document_id).first()
-                if not document:
-                    return False
+                documents = session.query(Document.document_id, Document.kb_id) \
+                    .filter(Document.document_id.in_(document_ids), Document.document_status != 3).all()
+                result['deleted'] = [d.document_id for d in documents]
+                deleted_set = set(result['deleted'])
+                result['not_found'] = [i for i in document_ids if i not in deleted_set]
+                if not documents:
+                    return result
+
+                session.query(Document).filter(Document.document_id.in_(result['deleted'])).update(
+                    {Document.document_status: 3}, synchronize_session=False
+                )
+
+                chunk_counts = dict(
+                    session.query(Chunk.kb_id, func.count(Chunk.chunk_id))
+                    .filter(Chunk.document_id.in_(result['deleted']))
+                    .group_by(Chunk.kb_id).all()
+                )
+        except Exception as e:
+            logger.error(f"文档批量删除失败: {e}")
+            result['failed'] = list(document_ids)
+            return result
+
+        # 清理完成前分块仍在ES中，先禁用分块，使其立即不可检索
+        docs_by_kb: Dict[str, List[str]] = {}
+        for d in documents:
+            docs_by_kb.setdefault(d.kb_id, []).append(d.document_id)
+        for kb_id, kb_document_ids in docs_by_kb.items():
+            wait = chunk_counts.get(kb_id, 0) < self.status_async_threshold
+            response = self.chunk_service.modify_documents_enabled(kb_id, kb_document_ids, False,
+                                                                  wait_for_completion=wait)
+            if response is None or response.get('failures'):
+                logger.warning(f"删除中文档的分块禁用失败，清理完成前仍可检索: {kb_id}, 文档数: {len(kb_document_ids)}")
+
+        # 提交后台清理，队列已满时保留删除标记，由定时清理处理
+        self._submit_purge(result['deleted'])
+
+        logger.info(f"文档已标记删除: {len(result['deleted'])}个")
+        return result
+
+    def _submit_purge(self, document_ids: List[str]):
+        """提交后台清理，队列已满时保留删除标记，由定时清理处理"""
+        if not job_executor.submit(self._purge_documents, document_ids):
+            logger.warning(f"清理任务提交失败，等待定时清理: {len(document_ids)}个文档")
+
+    def _purge_documents(self, document_ids: List[str]):
+        """清理已标记删除的文档：每个知识库一次ES delete_by_query，批量删除MinIO文件，再批量删除数据库记录"""
+        with db_manager.get_session() as session:
+            documents = session.query(Document.document_id, Document.kb_id, Document.document_name) \
+                .filter(Document.document_id.in_(document_ids), Document.document_status == 3).all()
+        if not documents:
+            return
+
+        docs_by_kb: Dict[str, List[Any]] = {}
+        for d in documents:
+            docs_by_kb.setdefault(d.kb_id, []).append(d)
+
+        for kb_id, kb_documents in docs_by_kb.items():
+            kb_document_ids = [d.document_id for d in kb_documents]
+
+            # ES删除失败时保留删除标记，由定时清理重试
+            response = es_client.delete_by_query(kb_index_manager.index_name(kb_id), {"terms": {"document_id": kb_document_ids}})
+            if response is None or response.get('failures'):
+                logger.error(f"文档分块ES清理失败: {kb_id}, 文档数: {len(kb_document_ids)}")
+                continue
+            kb_generations.bump(kb_id)
+
+            minio_client.delete_files([f"{d.kb_id}/{d.document_id}/{d.document_name}" for d in kb_documents])
 
-                # 删除关联的分块
-                chunks = session.query(Chunk).filter_by(document_id=document_id).all()
-                for chunk in chunks:
-                    self.chunk_service.delete_chunk(chunk.chunk_id)
+            with db_manager.get_session() as session:
+                chunk_count = session.query(Chunk).filter(Chunk.document_id.in_(kb_document_ids)) \
+                    .delete(synchronize_session=False)
+                session.query(Document).filter(Document.document_id.in_(kb_document_ids)) \
+                    .delete(synchronize_session=False)
+
+            logger.info(f"文档清理完成: {kb_id}, 文档数: {len(kb_document_ids)}, 分块数: {chunk_count}")
+
+    def start_tombstone_purger(self):
+        """启动定时清理线程：每隔 purge_interval 秒提交一次全量清理，清理任务提交失败或ES清理失败的文档在这里重试"""
+        if self._purger_started:
+            return
+        self._purger_started = True
+        if not self.purge_interval or self.purge_interval <= 0:
+            job_executor.submit(self.purge_tombstones)
+            return
+
+        def loop():
+            while True:
+                job_executor.submit(self.purge_tombstones)
+                time.sleep(self.purge_interval)
+
+        threading.Thread(target=loop, name='tombstone-purger', daemon=True).start()
+        logger.info(f"删除中文档定时清理已启动: 间隔{self.purge_interval}秒")
+
+    def purge_tombstones(self, batch_size: int = 100):
+        """清理所有标记为删除中的文档（启动时及定时执行）"""
+        # 上一次清理还未结束时跳过
+        if not self._purge_lock.acquire(blocking=False):
+            return
+        try:
+            with db_manager.get_session() as session:
+                document_ids = [row.document_id for row in
+                                session.query(Document.document_id).filter(Document.document_status == 3).all()]
+            for start in range(0, len(document_ids), batch_size):
+                self._purge_documents(document_ids[start:start + batch_size])
+            if document_ids:
+                logger.info(f"待删除文档清理完成: {len(document_ids)}个")
+        except Exception as e:
+            logger.error(f"待删除文档清理失败: {e}")
+        finally:
+            self._purge_lock.release()
 
-                # 删除MinIO中的文件
-                object_name = f"{document.kb_id}/{document_id}/{document.document_name}"
-                minio_client.delete_file(object_name)
+    def drop_knowledge_base(self, kb_id: str) -> bool:
+        """
+        删除整个知识库：删除ES索引（含所有版本），批量删除数据库记录，MinIO文件后台删除
+        先取消知识库未结束的入库任务并等待本进程内运行中的任务停止，避免任务在删除后重新创建索引、写入孤立分块
+        """
+        try:
+            if self.ingest_job_service.cancel_kb_jobs(kb_id, "知识库已删除"):
+                self._wait_jobs_stopped(kb_id)
 
-                # 删除文档记录
-                session.delete(document)
+            if not kb_index_manager.drop(kb_id):
+                return False
+            kb_generations.bump(kb_id)
 
-                logger.info(f"文档删除成功: {document_id}")
-                return True
+            with db_manager.get_session() as session:
+                chunk_count = session.query(Chunk).filter(Chunk.kb_id == kb_id).delete(synchronize_session=False)
+                document_count = session.query(Document).filter(Document.kb_id == kb_id) \
+                    .delete(synchronize_session=False)
+
+            if not job_executor.submit(minio_client.delete_prefix, f"{kb_id}/"):
+                minio_client.delete_prefix(f"{kb_id}/")
+
+            logger.info(f"知识库删除成功: {kb_id}, 文档数: {document_count}, 分块数: {chunk_count}")
+            return True
         except Exception as e:
-            logger.error(f"文档删除失败: {e}")
+            logger.error(f"知识库删除失败: {e}")
             return False
 
+    def _wait_jobs_stopped(self, kb_id: str):
+        """等待本进程内知识库运行中的入库任务停止（任务在下一批入库前检查取消状态）"""
+        with self._running_jobs_cond:
+            stopped = self._running_jobs_cond.wait_for(lambda: not self._running_jobs.get(kb_id),
+                                                       timeout=self.cancel_wait_seconds)
+        if not stopped:
+            logger.warning(f"等待入库任务停止超时，继续删除知识库: {kb_id}")
 
     def modify_status(self, document_id: str, document_status: int) -> bool:
         """修改文档状态"""
+        result = self.batch_modify_status([document_id], document_status)
+        return document_id in result['updated']
+
+    def batch_modify_status(self, document_ids: List[str], document_status: int) -> Dict[str, Any]:
+        """
+        批量修改文档状态：一条UPDATE更新tb_document，每个知识库一次ES update_by_query更新分块；
+        分块数超过阈值的知识库异步执行，返回ES任务id供查询进度
+        返回: {"updated": [...], "skipped": [...], "failed": [...], "tasks": [{"kb_id": ..., "task_id": ...}]}
+        """
+        result = {'updated': [], 'skipped': [], 'failed': [], 'tasks': []}
+        if document_status not in [0, 1]:
+            # 状态类型不对，只能是1或0
+            result['skipped'] = list(document_ids)
+            return result
+
         try:
             with db_manager.get_session() as session:
-                document = session.query(Document).filter_by(document_id=document_id).first()
-                if not document:
-                    return False
-                if document_status not in [0,1]:
-                    # 抛出ValueError
-                    # raise ValueError("状态类型不对，只能是1或0")
-                    return False
-                if document_status == document.document_status:
-                    return False
-
-                document.document_status = document_status
-
-                # 更新es数据
-                chunks = session.query(Chunk).filter_by(document_id=document_id).all()
-                for chunk in chunks:
-                    self.chunk_service.modify_document_status(chunk, document_status)
+                documents = session.query(Document.document_id, Document.kb_id, Document.document_status) \
+                    .filter(Document.document_id.in_(document_ids)).all()
+
+                # 状态相同或失败的文档不处理
+                changed = [d for d in documents if d.document_status in (0, 1) and d.document_status != document_status]
+                changed_ids = [d.document_id for d in changed]
+                changed_id_set = set(changed_ids)
+                result['skipped'] = [i for i in document_ids if i not in changed_id_set]
+                if not changed:
+                    return result
+
+                session.query(Document).filter(Document.document_id.in_(changed_ids)).update(
+                    {Document.document_status: document_status}, synchronize_session=False
+                )
 
-                logger.info(f"文档状态修改成功: {document_id}")
-                return True
+                # 各知识库受影响的分块数量，用于决定是否异步执行
+                chunk_counts = dict(
+                    session.query(Chunk.kb_id, func.count(Chunk.chunk_id))
+                    .filter(Chunk.document_id.in_(changed_ids))
+                    .group_by(Chunk.kb_id).all()
+                )
         except Exception as e:
-            logger.error(f"文档状态修改失败: {e}")
-            return False
+            logger.error(f"文档状态批量修改失败: {e}")
+            result['failed'] = list(document_ids)
+            result['skipped'] = []
+            return result
+
+        # 数据库事务提交后再更新ES，避免长时间持有行锁
+        docs_by_kb: Dict[str, List[str]] = {}
+        for d in changed:
+            docs_by_kb.setdefault(d.kb_id, []).append(d.document_id)
+
+        for kb_id, kb_document_ids in docs_by_kb.items():
+            wait = chunk_counts.get(kb_id, 0) < self.status_async_threshold
+            response = self.chunk_service.modify_documents_enabled(kb_id, kb_document_ids, document_status == 1,
+                                                                  wait_for_completion=wait)
+            if response is not None and response.get('failures'):
+                logger.error(f"分块es批量更新部分失败: {kb_id}, {response['failures'][:5]}")
+            if response is None or response.get('failures'):
+                # ES未更新成功时恢复文档状态，保持MySQL与ES一致
+                self._revert_document_status(kb_document_ids, document_status)
+                result['failed'].extend(kb_document_ids)
+                continue
+            if 'task' in response:
+                result['tasks'].append({'kb_id': kb_id, 'task_id': response['task']})
+            result['updated'].extend(kb_document_ids)
+
+        logger.info(f"文档状态批量修改完成: 成功{len(result['updated'])}个, 跳过{len(result['skipped'])}个, "
+                    f"失败{len(result['failed'])}个, 异步任务{len(result['tasks'])}个")
+        return result
+
+    def _revert_document_status(self, document_ids: List[str], document_status: int):
+        """ES更新失败后恢复文档原状态（只恢复仍为本次修改后状态的文档）"""
+        try:
+            with db_manager.get_session() as session:
+                session.query(Document) \
+                    .filter(Document.document_id.in_(document_ids), Document.document_status == document_status) \
+                    .update({Document.document_status: 1 - document_status}, synchronize_session=False)
+            logger.warning(f"分块ES更新失败，文档状态已恢复: {len(document_ids)}个")
+        except Exception as e:
+            logger.error(f"文档状态恢复失败: {e}")
+
+    def get_status_task(self, task_id: str) -> Optional[Dict[str, Any]]:
+        """查询异步状态修改任务的进度"""
+        task = es_client.get_task(task_id)
+        if not task:
+            return None
+        status = task.get('task', {}).get('status', {})
+        return {
+            'task_id': task_id,
+            'completed': task.get('completed', False),
+            'total': status.get('total'),
+            'updated': status.get('updated'),
+            'version_conflicts': status.get('version_conflicts'),
+            'failures': task.get('response', {}).get('failures', []),
+            'error': task.get('error')
+        }
 
 
     def list_documents(self, kb_id: str = None, page: int = 1,
@@ -267,7 +620,8 @@ class DocumentService:
         """列出文档"""
         try:
             with db_manager.get_session() as session:
-                query = session.query(Document)
+                # 删除中的文档不展示
+                query = session.query(Document).filter(Document.document_status != 3)
 
                 if kb_id:
                     query = query.filter_by(kb_id=kb_id)
@@ -0,0 +1,173 @@
+import logging
+import math
+import time
+import uuid
+from datetime import datetime
+from typing import List, Dict, Any, Optional
+
+from core.elasticsearch_client import es_client
+from core.job_executor import job_executor
+from core.kb_index import kb_index_manager
+from utils.cache_utils import TTLCache
+
+logger = logging.getLogger(__name__)
+
+# 对比任务状态
+BENCHMARK_STATUS_RUNNING = 'running'
+BENCHMARK_STATUS_SUCCESS = 'success'
+BENCHMARK_STATUS_FAILED = 'failed'
+
+# 对比用的临时索引前缀，不使用 kb_ 前缀，避免被 kb_* 的检索和模板匹配
+BENCHMARK_INDEX_PREFIX = 'bench_kb_'
+
+# 等待重建索引完成的轮询间隔（秒）
+REINDEX_POLL_INTERVAL = 2.0
+
+
+class IndexBenchmarkService:
+    """向量索引参数对比服务：同一知识库的数据按不同向量索引参数重建，对比内存占用和召回率"""
+
+    def __init__(self):
+        # 对比结果只保存在当前进程内存中
+        self._benchmarks = TTLCache(max_size=100, ttl=86400)
+
+    def start_benchmark(self, kb_id: str, options: List[Dict[str, Any]], sample_size: int = 100,
+                        top_k: int = 10, num_candidates: int = None, keep_indices: bool = False) -> Optional[str]:
+        """
+        提交对比任务，返回对比任务ID；后台线程池已满时返回None
+        options: 向量索引参数列表，如 [{"type": "int8_hnsw", "m": 16, "ef_construction": 100}, {"type": "bbq_hnsw"}]
+        """
+        benchmark_id = str(uuid.uuid4())
+        self._benchmarks.set(benchmark_id, {
+            'benchmark_id': benchmark_id,
+            'kb_id': kb_id,
+            'status': BENCHMARK_STATUS_RUNNING,
+            'sample_size': sample_size,
+            'top_k': top_k,
+            'num_candidates': num_candidates,
+            'results': [],
+            'error': None,
+            'started_time': datetime.now().isoformat(),
+            'finished_time': None
+        })
+
+        if not job_executor.submit(self._run_benchmark, benchmark_id, kb_id, options, sample_size,
+                                   top_k, num_candidates, keep_indices):
+            self._benchmarks.delete(benchmark_id)
+            return None
+
+        logger.info(f"向量索引对比任务已提交: {benchmark_id}, kb_id={kb_id}, options={len(options)}个")
+        return benchmark_id
+
+    def get_benchmark(self, benchmark_id: str) -> Optional[Dict[str, Any]]:
+        """获取对比任务状态及结果"""
+        return self._benchmarks.get(benchmark_id)
+
+    def _run_benchmark(self, benchmark_id: str, kb_id: str, options: List[Dict[str, Any]],
+                       sample_size: int, top_k: int, num_candidates: Optional[int], keep_indices: bool):
+        """执行对比：抽样查询向量 → 在源索引上精确检索得到基准结果 → 逐个参数重建索引并测量"""
+        benchmark = self._benchmarks.get(benchmark_id)
+        source_index = kb_index_manager.index_name(kb_id)
+        try:
+            samples = es_client.sample_vectors(source_index, sample_size)
+            if not samples:
+                raise ValueError(f"源索引没有可用的向量（索引不存在或向量未存储在_source中）: {source_index}")
+
+            # 精确检索（script_score 暴力计算）作为召回率的基准
+            ground_truth = []
+            for sample in samples:
+                response = es_client.vector_search(source_index, sample['vector'], size=top_k,
+                                                   min_score=0.0, fields=['id'], mode='exact')
+                ground_truth.append([hit['_id'] for hit in response['hits']['hits']])
+
+            for position, option in enumerate(options, start=1):
+                result = self._benchmark_option(kb_id, position, option, samples, ground_truth,
+                                                top_k, num_candidates, keep_indices)
+                benchmark['results'].append(result)
+
+            benchmark['status'] = BENCHMARK_STATUS_SUCCESS
+            logger.info(f"向量索引对比完成: {benchmark_id}")
+
+        except Exception as e:
+            benchmark['status'] = BENCHMARK_STATUS_FAILED
+            benchmark['error'] = str(e)
+            logger.error(f"向量索引对比失败: {benchmark_id}, {e}")
+        finally:
+            benchmark['finished_time'] = datetime.now().isoformat()
+            self._benchmarks.set(benchmark_id, benchmark)
+
+    def _benchmark_option(self, kb_id: str, position: int, option: Dict[str, Any],
+                          samples: List[Dict[str, Any]], ground_truth: List[List[str]],
+                          top_k: int, num_candidates: Optional[int], keep_indices: bool) -> Dict[str, Any]:
+        """按一组向量索引参数重建索引，测量段文件大小、召回率和检索耗时"""
+        index_name = f"{BENCHMARK_INDEX_PREFIX}{kb_id}_{position}_{option.get('type') or 'default'}"
+        result = {'option': option, 'index_name': index_name, 'error': None}
+        try:
+            es_client.delete_index(index_name)
+            if not es_client.create_index(index_name, vector_options=option):
+                raise ValueError(f"创建对比索引失败: {index_name}")
+
+            self._reindex_and_wait(kb_index_manager.index_name(kb_id), index_name)
+
+            stats = es_client.get_index_stats(index_name) or {}
+            result['stats'] = stats
+            result['estimated_memory_in_bytes'] = self._estimate_vector_memory(
+                option, stats.get('docs_count', 0), es_client.vector_dims)
+
+            recalls, took = [], []
+            for sample, expected in zip(samples, ground_truth):
+                start = time.perf_counter()
+                response = es_client.vector_search(index_name, sample['vector'], size=top_k, min_score=0.0,
+                                                   fields=['id'], mode='knn', num_candidates=num_candidates)
+                took.append((time.perf_counter() - start) * 1000)
+                if expected:
+                    actual = {hit['_id'] for hit in response['hits']['hits']}
+                    recalls.append(len(actual & set(expected)) / len(expected))
+
+            result['recall'] = sum(recalls) / len(recalls) if recalls else None
+            result['avg_latency_ms'] = sum(took) / len(took) if took else None
+
+        except Exception as e:
+            result['error'] = str(e)
+            logger.error(f"向量索引参数测量失败: {index_name}, {e}")
+        finally:
+            if not keep_indices:
+                es_client.delete_index(index_name)
+        return result
+
+    def _reindex_and_wait(self, source_index: str, dest_index: str):
+        """提交重建索引任务并等待完成"""
+        response = es_client.reindex(source_index, dest_index, wait_for_completion=False)
+        if not response or 'task' not in response:
+            raise ValueError(f"提交重建索引失败: {source_index} -> {dest_index}")
+
+        while True:
+            task = es_client.get_task(response['task'])
+            if task is None:
+                raise ValueError(f"重建索引任务不存在: {response['task']}")
+            if task.get('completed'):
+                failures = task.get('response', {}).get('failures', [])
+                if task.get('error') or failures:
+                    raise ValueError(f"重建索引失败: {task.get('error') or failures[:3]}")
+                break
+            time.sleep(REINDEX_POLL_INTERVAL)
+
+        es_client.refresh_index(dest_index)
+
+    def _estimate_vector_memory(self, option: Dict[str, Any], num_vectors: int, dims: int) -> Dict[str, int]:
+        """
+        估算检索时需要常驻页缓存的向量数据大小（参考ES官方kNN调优文档的估算公式）
+        vectors: 参与检索的向量数据，graph: HNSW图（约 num_vectors * 4 * m）
+        """
+        index_type = option.get('type') or 'int8_hnsw'
+        if index_type.startswith('int8'):
+            vectors = num_vectors * (dims + 4)
+        elif index_type.startswith('int4'):
+            vectors = num_vectors * (math.ceil(dims / 2) + 4)
+        elif index_type.startswith('bbq'):
+            vectors = num_vectors * (math.ceil(dims / 8) + 14)
+        else:
+            vectors = num_vectors * 4 * (dims + 12)
+
+        graph = num_vectors * 4 * int(option.get('m') or 16) if index_type.endswith('hnsw') else 0
+        return {'vectors': vectors, 'graph': graph, 'total': vectors + graph}
@@ -0,0 +1,171 @@
+import json
+import logging
+import uuid
+from typing import Dict, Any, Optional
+
+from sqlalchemy import desc
+from sqlalchemy.sql import func
+
+from core.database import db_manager, PaginationQuery
+from models.ingest_job import IngestJob
+
+logger = logging.getLogger(__name__)
+
+# 任务状态
+JOB_STATUS_PENDING = 0
+JOB_STATUS_RUNNING = 1
+JOB_STATUS_SUCCESS = 2
+JOB_STATUS_FAILED = 3
+JOB_STATUS_PARTIAL = 4
+JOB_STATUS_CANCELLED = 5
+# 未结束的任务状态
+JOB_ACTIVE_STATUSES = (JOB_STATUS_PENDING, JOB_STATUS_RUNNING)
+
+# 入库阶段，按执行顺序排列
+JOB_STAGES = ['parse', 'split', 'embed', 'index']
+
+
+class IngestJobService:
+    """文档入库任务服务"""
+
+    def create_job(self, document_id: str, kb_id: str, created_by: str = None) -> Optional[str]:
+        """创建入库任务"""
+        try:
+            with db_manager.get_session() as session:
+                job = IngestJob(
+                    job_id=str(uuid.uuid4()),
+                    document_id=document_id,
+                    kb_id=kb_id,
+                    job_status=JOB_STATUS_PENDING,
+                    stage_progress=json.dumps({stage: {'done': 0, 'total': 0} for stage in JOB_STAGES}),
+                    created_by=created_by
+                )
+                session.add(job)
+                session.flush()
+
+                logger.info(f"入库任务创建成功: {job.job_id}, 文档: {document_id}")
+                return job.job_id
+        except Exception as e:
+            logger.error(f"入库任务创建失败: {e}")
+            return None
+
+    def mark_running(self, job_id: str) -> bool:
+        """标记任务开始处理，任务不是排队中（如已取消）时返回False"""
+        return self._update_job(job_id, from_statuses=(JOB_STATUS_PENDING,),
+                                job_status=JOB_STATUS_RUNNING, started_time=func.now())
+
+    def mark_success(self, job_id: str, chunk_count: int) -> bool:
+        """标记任务成功"""
+        return self._update_job(job_id, from_statuses=JOB_ACTIVE_STATUSES, job_status=JOB_STATUS_SUCCESS,
+                                chunk_count=chunk_count, finished_time=func.now())
+
+    def mark_partial(self, job_id: str, chunk_count: int, error: str) -> bool:
+        """标记任务部分成功：部分分块入库失败，chunk_count为成功入库的分块数"""
+        return self._update_job(job_id, from_statuses=JOB_ACTIVE_STATUSES, job_status=JOB_STATUS_PARTIAL,
+                                chunk_count=chunk_count, job_error=error, finished_time=func.now())
+
+    def mark_failed(self, job_id: str, error: str) -> bool:
+        """标记任务失败"""
+        return self._update_job(job_id, from_statuses=JOB_ACTIVE_STATUSES, job_status=JOB_STATUS_FAILED,
+                                job_error=error, finished_time=func.now())
+
+    def cancel_kb_jobs(self, kb_id: str, reason: str) -> int:
+        """取消知识库所有未结束的任务，返回取消的任务数；运行中的任务在下一批入库前停止"""
+        try:
+            with db_manager.get_session() as session:
+                count = session.query(IngestJob) \
+                    .filter(IngestJob.kb_id == kb_id, IngestJob.job_status.in_(JOB_ACTIVE_STATUSES)) \
+                    .update({IngestJob.job_status: JOB_STATUS_CANCELLED, IngestJob.job_error: reason,
+                             IngestJob.finished_time: func.now()}, synchronize_session=False)
+            if count:
+                logger.info(f"入库任务已取消: {kb_id}, {count}个, {reason}")
+            return count
+        except Exception as e:
+            logger.error(f"入库任务取消失败: {kb_id}, {e}")
+            return 0
+
+    def is_cancelled(self, job_id: str) -> bool:
+        """任务是否已取消"""
+        try:
+            with db_manager.get_session() as session:
+                job_status = session.query(IngestJob.job_status).filter(IngestJob.job_id == job_id).scalar()
+            return job_status == JOB_STATUS_CANCELLED
+        except Exception as e:
+            logger.error(f"任务状态查询失败: {job_id}, {e}")
+            return False
+
+    def update_progress(self, job_id: str, stage: str, done: int, total: Optional[int]) -> bool:
+        """更新阶段进度，流式处理时总数未知，total为None"""
+        try:
+            with db_manager.get_session() as session:
+                job = session.query(IngestJob).filter_by(job_id=job_id).first()
+                if not job:
+                    return False
+
+                progress = json.loads(job.stage_progress) if job.stage_progress else {}
+                progress[stage] = {'done': done, 'total': total}
+                job.stage_progress = json.dumps(progress)
+                job.current_stage = stage
+                return True
+        except Exception as e:
+            # 进度更新失败不影响任务本身
+            logger.warning(f"任务进度更新失败: {job_id}, {e}")
+            return False
+
+    def _update_job(self, job_id: str, from_statuses: tuple = None, **kwargs) -> bool:
+        """
+        更新任务，from_statuses 不为空时只更新处于这些状态的任务（条件UPDATE，已取消的任务不会被并发覆盖）
+        """
+        try:
+            with db_manager.get_session() as session:
+                query = session.query(IngestJob).filter(IngestJob.job_id == job_id)
+                if from_statuses is not None:
+                    query = query.filter(IngestJob.job_status.in_(from_statuses))
+                count = query.update({getattr(IngestJob, key): value for key, value in kwargs.items()},
+                                     synchronize_session=False)
+                if not count:
+                    logger.info(f"任务不存在或状态已变化，不更新: {job_id}")
+                return count > 0
+        except Exception as e:
+            logger.error(f"任务状态更新失败: {job_id}, {e}")
+            return False
+
+    def get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """获取任务"""
+        try:
+            with db_manager.get_session() as session:
+                job = session.query(IngestJob).filter_by(job_id=job_id).first()
+                if job:
+                    return job.to_dict()
+                return None
+        except Exception as e:
+            logger.error(f"获取任务失败: {e}")
+            return None
+
+    def list_jobs(self, kb_id: str = None, document_id: str = None, job_status: int = None,
+                  page: int = 1, per_page: int = 10) -> Dict[str, Any]:
+        """列出任务"""
+        try:
+            with db_manager.get_session() as session:
+                query = session.query(IngestJob)
+
+                if kb_id:
+                    query = query.filter_by(kb_id=kb_id)
+                if document_id:
+                    query = query.filter_by(document_id=document_id)
+                if job_status is not None:
+                    query = query.filter_by(job_status=job_status)
+
+                query = query.order_by(desc(IngestJob.created_time))
+
+                # 分页
+                pagination = PaginationQuery(query, page, per_page)
+                result = pagination.paginate()
+
+                # 转换为字典
+                result['rows'] = [job.to_dict() for job in result['rows']]
+
+                return result
+        except Exception as e:
+            logger.error(f"列出任务失败: {e}")
+            return {'rows': [], 'total': 0, 'page': page, 'per_page': per_page}
@@ -0,0 +1,263 @@
+import logging
+import threading
+import uuid
+from datetime import datetime, timedelta
+from typing import List, Dict, Any, Optional, Set, Tuple
+
+from sqlalchemy import or_
+
+from core.database import db_manager
+from core.elasticsearch_client import es_client
+from core.job_executor import job_executor
+from core.kb_index import kb_index_manager
+from models.chunk import Chunk
+from models.document import Document
+from services.chunk_service import ChunkService
+from utils.cache_utils import TTLCache, kb_generations
+from utils.config import config
+from utils.embedding_utils import embedding_utils
+
+logger = logging.getLogger(__name__)
+
+# 重建任务状态
+REINDEX_STATUS_RUNNING = 'running'
+REINDEX_STATUS_SUCCESS = 'success'
+REINDEX_STATUS_FAILED = 'failed'
+
+# 追平阶段回看的时间余量：复制开始前不久写入、复制时尚未提交的变更也会被追平
+CATCH_UP_MARGIN = timedelta(seconds=60)
+
+
+class KbIndexService:
+    """知识库索引重建服务：从MySQL分块和ES中已存储的向量构建新版本索引，完成后原子切换别名"""
+
+    def __init__(self):
+        self.chunk_service = ChunkService()
+        kb_index_config = config.get_section('kb_index')
+        # 每批从MySQL读取并写入新索引的分块数
+        self.reindex_batch_size = kb_index_config.get('reindex_batch_size', 1000)
+        # 切换别名后保留的旧版本数量，0 表示立即删除
+        self.keep_old_versions = kb_index_config.get('keep_old_versions', 0)
+        # 重建任务只保存在当前进程内存中
+        self._tasks = TTLCache(max_size=100, ttl=86400)
+        self._running_kb_ids = set()
+        self._lock = threading.Lock()
+
+    def get_index_info(self, kb_id: str) -> Dict[str, Any]:
+        """知识库索引信息"""
+        return kb_index_manager.get_index_info(kb_id)
+
+    def start_reindex(self, kb_id: str, vector_options: Dict[str, Any] = None) -> Optional[str]:
+        """
+        提交重建索引任务，返回任务ID
+        同一知识库已有重建任务进行中、或后台线程池已满时返回None
+        """
+        with self._lock:
+            if kb_id in self._running_kb_ids:
+                logger.warning(f"知识库正在重建索引: {kb_id}")
+                return None
+            self._running_kb_ids.add(kb_id)
+
+        task_id = str(uuid.uuid4())
+        self._tasks.set(task_id, {
+            'task_id': task_id,
+            'kb_id': kb_id,
+            'status': REINDEX_STATUS_RUNNING,
+            'source_indices': [],
+            'target_index': None,
+            'copied': 0,
+            'reembedded': 0,
+            'caught_up': 0,
+            'removed': 0,
+            'removed_chunks': 0,
+            'deleted_indices': [],
+            'error': None,
+            'started_time': datetime.now().isoformat(),
+            'finished_time': None
+        })
+
+        if not job_executor.submit(self._run_reindex, task_id, kb_id, vector_options):
+            self._tasks.delete(task_id)
+            with self._lock:
+                self._running_kb_ids.discard(kb_id)
+            return None
+
+        logger.info(f"重建索引任务已提交: {task_id}, kb_id={kb_id}")
+        return task_id
+
+    def get_reindex_task(self, task_id: str) -> Optional[Dict[str, Any]]:
+        """获取重建任务状态"""
+        return self._tasks.get(task_id)
+
+    def _run_reindex(self, task_id: str, kb_id: str, vector_options: Optional[Dict[str, Any]]):
+        """
+        执行重建：
+        1、新建下一个版本的索引，批量导入模式下全量复制分块
+        2、原子切换别名，检索无中断
+        3、追平复制期间的新增和修改，清理复制期间删除的文档和分块
+        4、删除旧版本索引
+        """
+        task = self._tasks.get(task_id)
+        target_index = None
+        switched = False
+        try:
+            source_indices = kb_index_manager.current_indices(kb_id)
+            task['source_indices'] = source_indices
+            target_index = kb_index_manager.create_next_version(kb_id, vector_options)
+            if not target_index:
+                raise ValueError("新版本索引创建失败")
+            task['target_index'] = target_index
+
+            started = datetime.now()
+            with es_client.bulk_load(target_index):
+                task['copied'] = self._copy_chunks(kb_id, source_indices, target_index, task)
+
+            if not kb_index_manager.switch_alias(kb_id, target_index):
+                raise ValueError("别名切换失败")
+            switched = True
+            # 追平完成前新索引缺少复制期间的变更，知识库记为有进行中的变更，不缓存检索结果
+            kb_generations.begin_pending(kb_id)
+            logger.info(f"知识库别名已切换: {kb_index_manager.index_name(kb_id)} -> {target_index}")
+
+            # 复制期间写入旧索引的变更，在切换后补到新索引
+            task['caught_up'] = self._copy_chunks(kb_id, source_indices, target_index, task,
+                                                  updated_since=started - CATCH_UP_MARGIN)
+            # 清理前先刷新，保证追平写入的分块对滚动查询和按条件删除可见
+            es_client.refresh_index(target_index)
+            task['removed'] = self._remove_deleted_documents(kb_id, target_index)
+            task['removed_chunks'] = self._remove_deleted_chunks(kb_id, target_index)
+            es_client.refresh_index(target_index)
+
+            task['deleted_indices'] = kb_index_manager.gc_versions(kb_id, self.keep_old_versions)
+            task['status'] = REINDEX_STATUS_SUCCESS
+            logger.info(f"重建索引完成: {task_id}, {target_index}, 复制{task['copied']}个, "
+                        f"追平{task['caught_up']}个, 重新向量化{task['reembedded']}个")
+
+        except Exception as e:
+            task['status'] = REINDEX_STATUS_FAILED
+            task['error'] = str(e)
+            logger.error(f"重建索引失败: {task_id}, {e}")
+            # 切换前失败时删除未使用的新索引，别名仍指向旧索引
+            if target_index and not switched:
+                es_client.delete_index(target_index)
+        finally:
+            # 切换后（成功或追平失败）结束进行中的变更，递增版本号使追平期间的结果失效
+            if switched:
+                kb_generations.end_pending(kb_id)
+            task['finished_time'] = datetime.now().isoformat()
+            self._tasks.set(task_id, task)
+            with self._lock:
+                self._running_kb_ids.discard(kb_id)
+
+    def _copy_chunks(self, kb_id: str, source_indices: List[str], target_index: str,
+                     task: Dict[str, Any], updated_since: datetime = None) -> int:
+        """
+        按chunk_id顺序分批读取知识库的分块，向量优先取源索引中已存储的向量，缺失时重新向量化（走向量缓存）
+        updated_since 不为空时只复制该时间之后新增或修改的分块（分块或所属文档有更新）
+        """
+        copied = 0
+        last_chunk_id = ''
+        while True:
+            rows = self._load_chunk_batch(kb_id, last_chunk_id, updated_since)
+            if not rows:
+                break
+            last_chunk_id = rows[-1][0].chunk_id
+
+            # 追平阶段源索引中取不到时（旧数据的同名实际索引在切换时已删除）再从新索引中取
+            vector_indices = source_indices if updated_since is None else source_indices + [target_index]
+            vectors = self._fetch_vectors(vector_indices, [chunk.chunk_id for chunk, _ in rows])
+            missing = [chunk for chunk, _ in rows if chunk.chunk_id not in vectors]
+            if missing:
+                embeddings = embedding_utils.get_embeddings([chunk.chunk_content for chunk in missing])
+                for chunk, embedding in zip(missing, embeddings):
+                    if embedding:
+                        vectors[chunk.chunk_id] = embedding
+                task['reembedded'] += sum(1 for embedding in embeddings if embedding)
+
+            docs = [self.chunk_service.build_es_doc(chunk, vectors[chunk.chunk_id], enabled=document_status == 1)
+                    for chunk, document_status in rows if chunk.chunk_id in vectors]
+
+            if len(docs) < len(rows):
+                raise ValueError(f"{len(rows) - len(docs)}个分块缺少向量且重新向量化失败")
+
+            failed = [item for item in es_client.bulk_index_documents(target_index, docs) if not item['ok']]
+            if failed:
+                raise ValueError(f"写入新索引失败{len(failed)}个: {failed[0]['error']}")
+
+            copied += len(docs)
+            if updated_since is None:
+                task['copied'] = copied
+        return copied
+
+    def _load_chunk_batch(self, kb_id: str, last_chunk_id: str,
+                          updated_since: datetime = None) -> List[Tuple[Chunk, int]]:
+        """按chunk_id顺序读取一批 (分块, 所属文档状态)，跳过已删除（删除中）的文档"""
+        with db_manager.get_session() as session:
+            query = session.query(Chunk, Document.document_status) \
+                .join(Document, Document.document_id == Chunk.document_id) \
+                .filter(Chunk.kb_id == kb_id, Document.document_status != 3, Chunk.chunk_id > last_chunk_id)
+            if updated_since is not None:
+                query = query.filter(or_(Chunk.updated_time >= updated_since,
+                                         Document.updated_time >= updated_since))
+            rows = query.order_by(Chunk.chunk_id).limit(self.reindex_batch_size).all()
+            # 提交时会使对象过期，先从会话中移出，保留已加载的字段
+            session.expunge_all()
+            return [(chunk, document_status) for chunk, document_status in rows]
+
+    def _existing_chunk_ids(self, kb_id: str, chunk_ids: List[str]) -> Set[str]:
+        """返回仍存在于tb_chunk中的分块id"""
+        with db_manager.get_session() as session:
+            return {row.chunk_id for row in
+                    session.query(Chunk.chunk_id).filter(Chunk.kb_id == kb_id, Chunk.chunk_id.in_(chunk_ids)).all()}
+
+    def _alive_document_ids(self, kb_id: str) -> List[str]:
+        """知识库中未删除的文档id"""
+        with db_manager.get_session() as session:
+            return [row.document_id for row in
+                    session.query(Document.document_id)
+                    .filter(Document.kb_id == kb_id, Document.document_status != 3).all()]
+
+    def _fetch_vectors(self, index_names: List[str], chunk_ids: List[str]) -> Dict[str, List[float]]:
+        """按顺序从各索引中获取已存储的向量"""
+        vectors = {}
+        for index_name in index_names:
+            remaining = [chunk_id for chunk_id in chunk_ids if chunk_id not in vectors]
+            if not remaining:
+                break
+            for doc_id, source in es_client.get_documents(index_name, remaining, fields=['chunk_embedding']).items():
+                if source.get('chunk_embedding'):
+                    vectors[doc_id] = source['chunk_embedding']
+        return vectors
+
+    def _remove_deleted_documents(self, kb_id: str, target_index: str) -> int:
+        """删除新索引中属于已删除（或删除中）文档的分块，这些分块是复制期间被删除的"""
+        alive_document_ids = self._alive_document_ids(kb_id)
+
+        # terms 查询的词项数有上限，文档过多时跳过，由删除清理任务兜底
+        if len(alive_document_ids) > 65536:
+            logger.warning(f"知识库文档过多，跳过已删除文档分块清理: {kb_id}")
+            return 0
+
+        response = es_client.delete_by_query(target_index, {
+            "bool": {"must_not": {"terms": {"document_id": alive_document_ids}}}
+        })
+        return response.get('deleted', 0) if response else 0
+
+    def _remove_deleted_chunks(self, kb_id: str, target_index: str) -> int:
+        """
+        删除新索引中已不存在于tb_chunk的分块：复制期间单独删除的分块（ChunkService.delete_chunk）
+        只从当时别名指向的旧索引中删除，新索引中的副本需要在追平阶段删除
+        """
+        removed = 0
+        for chunk_ids in es_client.iter_document_ids(target_index, self.reindex_batch_size):
+            existing = self._existing_chunk_ids(kb_id, chunk_ids)
+            deleted_ids = [chunk_id for chunk_id in chunk_ids if chunk_id not in existing]
+            if not deleted_ids:
+                continue
+            response = es_client.delete_by_query(target_index, {"ids": {"values": deleted_ids}})
+            if response is None or response.get('failures'):
+                raise ValueError(f"新索引中已删除分块清理失败: {len(deleted_ids)}个")
+            removed += response.get('deleted', 0)
+        if removed:
+            logger.info(f"新索引中已删除分块清理完成: {target_index}, {removed}个")
+        return removed
@@ -1,6 +1,6 @@
 import logging
 from enum import Enum
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Union
 
 from langchain_core.output_parsers import StrOutputParser
 from langchain_core.prompts import ChatPromptTemplate
@@ -8,120 +8,338 @@ from langchain_core.runnables import RunnableSerializable, RunnablePassthrough
 
 from core.database import db_manager
 from core.elasticsearch_client import es_client
+from core.kb_index import kb_index_manager
 from core.llm_client import llm_client
 from models.chunk import Chunk
+from models.dto import SearchHit
+from utils.cache_utils import TTLCache, SingleFlight, kb_generations
+from utils.config import config
 from utils.embedding_utils import embedding_utils
 
 logger = logging.getLogger(__name__)
 
+# 检索结果需要的_source字段，向量字段不返回
+SEARCH_SOURCE_FIELDS = ["id", "document_id", "chunk_content", "document_name", "kb_id", "metadata"]
+
+# 跨知识库检索的结果合并方式
+MERGE_SCORE = 'score'  # 按得分合并
+MERGE_RRF = 'rrf'  # 按各知识库内的排名倒数融合，各知识库的BM25统计不同、得分不可直接比较时使用
+
 
 class SearchType(Enum):
     """搜索类型"""
     TEXT = "text"  # 全文搜索
     VECTOR = "vector"  # 向量搜索
     HYBRID = "hybrid"  # 混合搜索
+    HYBRID_RRF = "hybrid_rrf"  # 混合搜索（BM25与knn两路独立检索，RRF融合）
+    HYBRID_RESCORE = "hybrid_rescore"  # 混合搜索（BM25召回前N个，只对这N个计算向量分数重排）
 
 
 class SearchService:
     """搜索服务"""
 
-    def search(self, kb_id: str, query: str, search_type: SearchType = SearchType.HYBRID,
+    def __init__(self):
+        # 查询向量缓存：相同查询在有效期内不再请求向量接口；并发的相同查询合并为一次请求
+        cache_config = config.get_section('retrieval.query_embedding_cache')
+        self._query_vector_cache = TTLCache(
+            max_size=cache_config.get('max_size', 10000),
+            ttl=cache_config.get('ttl', 600)
+        )
+        self._query_vector_flight = SingleFlight()
+
+        # 检索结果缓存：key包含知识库版本号，知识库内容变化后旧结果自动失效
+        result_cache_config = config.get_section('retrieval.result_cache')
+        self._result_cache_enabled = result_cache_config.get('enabled', True)
+        self._result_cache = TTLCache(
+            max_size=result_cache_config.get('max_size', 5000),
+            ttl=result_cache_config.get('ttl', 300)
+        )
+        # 知识库变化后的这段时间内（秒）ES可能还未refresh，检索结果不写入缓存
+        self._result_cache_settle_seconds = result_cache_config.get('settle_seconds', 2.0)
+
+        # 批量搜索单次最多的查询数
+        self.batch_max_queries = config.get('retrieval.batch_max_queries', 100)
+        # 跨知识库检索单次最多的知识库数
+        self.federated_max_kbs = config.get('retrieval.federated_max_kbs', 20)
+        # 批量搜索展开后（查询数 × 知识库数 × 检索路数）单次最多的子检索数
+        self.batch_max_searches = config.get('retrieval.batch_max_searches', 200)
+
+    def _get_query_embedding(self, query: str) -> Optional[List[float]]:
+        """获取查询向量（带缓存和请求合并）"""
+        query_vector = self._query_vector_cache.get(query)
+        if query_vector is not None:
+            return query_vector
+
+        def load():
+            vector = embedding_utils.get_embedding(query)
+            if vector:
+                self._query_vector_cache.set(query, vector)
+            return vector
+
+        return self._query_vector_flight.do(query, load)
+
+    def get_cache_stats(self) -> Dict[str, Any]:
+        """缓存命中统计"""
+        return {
+            'query_embedding': {
+                **self._query_vector_cache.stats(),
+                **self._query_vector_flight.stats()
+            },
+            'embedding_store': embedding_utils.get_cache_stats(),
+            'search_result': {'enabled': self._result_cache_enabled, **self._result_cache.stats()}
+        }
+
+    def _get_query_embeddings(self, queries: List[str]) -> Dict[str, Optional[List[float]]]:
+        """批量获取查询向量：先查缓存，未命中的查询一次批量请求向量接口"""
+        vectors = {query: self._query_vector_cache.get(query) for query in queries}
+        missing = [query for query, vector in vectors.items() if vector is None]
+        if len(missing) == 1:
+            vectors[missing[0]] = self._get_query_embedding(missing[0])
+        elif missing:
+            for query, vector in zip(missing, embedding_utils.get_embeddings(missing, text_type='query')):
+                vectors[query] = vector
+                if vector:
+                    self._query_vector_cache.set(query, vector)
+        return vectors
+
+    def search(self, kb_id: Union[str, List[str]], query: str, search_type: SearchType = SearchType.HYBRID,
                top_k: int = 10, min_score: float = 0.0, use_score_relevance: bool = False,
-               text_weight: float = 0.5, vector_weight: float = 0.5) -> List[Dict[str, Any]]:
-        """搜索知识库"""
+               text_weight: float = 0.5, vector_weight: float = 0.5,
+               vector_mode: str = None, text_window_size: int = None, vector_window_size: int = None,
+               rrf_rank_constant: int = None, document_ids: List[str] = None,
+               created_from: str = None, created_to: str = None,
+               include_disabled: bool = False, rescore_window_size: int = None,
+               merge: str = MERGE_SCORE) -> List[SearchHit]:
+        """
+        搜索知识库
+        vector_mode 为空时使用配置 retrieval.vector_mode（knn/exact）；
+        text_window_size / vector_window_size / rrf_rank_constant 仅用于 HYBRID_RRF，为空时使用配置；
+        rescore_window_size 仅用于 HYBRID_RESCORE（参与向量重打分的BM25结果数），为空时使用配置；
+        默认只检索启用的分块，document_ids / created_from / created_to 限定检索范围；
+        kb_id 为列表时跨知识库检索，结果按 merge（score/rrf）合并，结果中的 kb_id 为来源知识库
+        """
+        output = self._search_groups([{
+            'kb_id': kb_id, 'query': query, 'search_type': search_type, 'top_k': top_k, 'min_score': min_score,
+            'use_score_relevance': use_score_relevance, 'text_weight': text_weight, 'vector_weight': vector_weight,
+            'vector_mode': vector_mode, 'text_window_size': text_window_size,
+            'vector_window_size': vector_window_size, 'rrf_rank_constant': rrf_rank_constant,
+            'document_ids': document_ids, 'created_from': created_from, 'created_to': created_to,
+            'include_disabled': include_disabled, 'rescore_window_size': rescore_window_size, 'merge': merge
+        }])[0]
+        logger.info(f"搜索完成: {len(output['results'])}个结果")
+        return output['results']
+
+    def search_batch(self, requests: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        批量搜索：每一项为 search 的参数，可以是不同的知识库、搜索类型和检索参数
+        未命中缓存的查询一次批量获取向量，所有检索合并为一次_msearch请求
+        返回与requests顺序一致的 [{"results": 检索结果, "error": 错误信息}]
+        """
+        outputs = self._search_groups(requests)
+        logger.info(f"批量搜索完成: {len(requests)}个查询")
+        return outputs
+
+    def count_searches(self, request: Dict[str, Any]) -> int:
+        """一项检索展开后的子检索数（_msearch中的请求数）：知识库数 × 检索路数（RRF为两路）"""
+        kb_id = request['kb_id']
+        kb_count = len(set(kb_id)) if isinstance(kb_id, list) else 1
+        return kb_count * (2 if request['search_type'] == SearchType.HYBRID_RRF else 1)
+
+    def _search_groups(self, requests: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        执行一组检索，每一项为 search 的参数；kb_id 为列表的项按知识库拆分为多个检索，
+        所有知识库的检索一起执行（相同查询只向量化一次），再按 merge 合并为该项的结果
+        """
+        prepared = []
+        groups = []
+        for request in requests:
+            request = dict(request)
+            merge = request.pop('merge', MERGE_SCORE)
+            kb_id = request.pop('kb_id')
+            # 去重并保持顺序
+            kb_ids = list(dict.fromkeys(kb_id)) if isinstance(kb_id, list) else [kb_id]
+            groups.append((len(prepared), len(kb_ids), merge))
+            prepared.extend(self._prepare_search(one_kb_id, **request) for one_kb_id in kb_ids)
+
+        outputs = self._run_searches(prepared)
+        return [outputs[start] if count == 1
+                else self._merge_outputs(prepared[start:start + count], outputs[start:start + count], merge)
+                for start, count, merge in groups]
+
+    def _merge_outputs(self, requests: List[Dict[str, Any]], outputs: List[Dict[str, Any]],
+                       merge: str) -> Dict[str, Any]:
+        """合并多个知识库的检索结果，取前 top_k 个；部分知识库检索失败时返回其余知识库的结果及失败信息"""
+        top_k = requests[0]['top_k']
+        if merge == MERGE_RRF:
+            # 缓存中的结果对象是共享的，融合得分写在副本上
+            rank_constant = requests[0]['rrf_rank_constant'] or es_client.rrf_rank_constant
+            merged = [{**hit, 'score': 1.0 / (rank_constant + rank)}
+                      for output in outputs for rank, hit in enumerate(output['results'], start=1)]
+        else:
+            merged = [hit for output in outputs for hit in output['results']]
+        merged.sort(key=lambda hit: hit['score'], reverse=True)
+
+        errors = [f"{request['kb_id']}: {output['error']}"
+                  for request, output in zip(requests, outputs) if output['error']]
+        return {'results': merged[:top_k], 'error': '; '.join(errors) if errors else None}
+
+    def _prepare_search(self, kb_id: str, query: str, search_type: SearchType = SearchType.HYBRID,
+                        top_k: int = 10, min_score: float = 0.0, use_score_relevance: bool = False,
+                        text_weight: float = 0.5, vector_weight: float = 0.5,
+                        vector_mode: str = None, text_window_size: int = None, vector_window_size: int = None,
+                        rrf_rank_constant: int = None, document_ids: List[str] = None,
+                        created_from: str = None, created_to: str = None,
+                        include_disabled: bool = False, rescore_window_size: int = None) -> Dict[str, Any]:
+        """整理检索参数：过滤条件、最小相关度分数和结果缓存key"""
+        min_relevance_score = min_score if use_score_relevance else 0.1
+        filters = es_client.build_filters(
+            enabled_only=not include_disabled,
+            document_ids=document_ids,
+            created_from=created_from,
+            created_to=created_to
+        )
+        cache_key = None
+        if self._result_cache_enabled:
+            cache_key = (kb_id, kb_generations.get(kb_id), query, search_type, top_k, min_relevance_score,
+                         text_weight, vector_weight, vector_mode, text_window_size, vector_window_size,
+                         rrf_rank_constant, tuple(sorted(document_ids or [])), created_from, created_to,
+                         include_disabled, rescore_window_size)
+        return {
+            'kb_id': kb_id,
+            'index_name': kb_index_manager.index_name(kb_id),
+            'query': query,
+            'search_type': search_type,
+            'top_k': top_k,
+            'min_score': min_relevance_score,
+            'text_weight': text_weight,
+            'vector_weight': vector_weight,
+            'vector_mode': vector_mode,
+            'text_window_size': text_window_size,
+            'vector_window_size': vector_window_size,
+            'rrf_rank_constant': rrf_rank_constant,
+            'rescore_window_size': rescore_window_size,
+            'filters': filters,
+            'cache_key': cache_key
+        }
+
+    def _run_searches(self, requests: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        执行检索：命中结果缓存的直接返回，其余查询的向量一次批量获取，
+        单个检索直接请求ES，多个检索合并为一次_msearch请求
+        """
+        outputs: List[Optional[Dict[str, Any]]] = [None] * len(requests)
         try:
-            index_name = f"kb_{kb_id}"
-
-            # 检查索引是否存在
-            if not es_client.index_exists(index_name):
-                logger.warning(f"索引不存在: {index_name}")
-                return []
-
-            min_relevance_score = min_score if use_score_relevance else 0.1
-
-            # 根据搜索类型执行搜索
-            if search_type == SearchType.TEXT:
-                response = self._text_search(index_name, query, top_k, min_score=min_relevance_score)
-            elif search_type == SearchType.VECTOR:
-                response = self._vector_search(index_name, query, top_k, min_score=min_relevance_score)
-            elif search_type == SearchType.HYBRID:
-                response = self._hybrid_search(index_name, query, top_k, text_weight, vector_weight, min_score=min_relevance_score)
+            pending = []
+            for position, request in enumerate(requests):
+                if request['cache_key'] is not None:
+                    cached = self._result_cache.get(request['cache_key'])
+                    if cached is not None:
+                        logger.info(f"搜索命中缓存: {len(cached)}个结果")
+                        outputs[position] = {'results': cached, 'error': None}
+                        continue
+
+                # 检查索引是否存在（已确认存在的知识库不再请求ES）
+                if not kb_index_manager.exists(request['kb_id']):
+                    logger.warning(f"索引不存在: {request['index_name']}")
+                    outputs[position] = {'results': [], 'error': '索引不存在'}
+                    continue
+                pending.append(position)
+
+            vector_queries = [requests[position]['query'] for position in pending
+                              if requests[position]['search_type'] != SearchType.TEXT]
+            query_vectors = self._get_query_embeddings(vector_queries) if vector_queries else {}
+
+            specs = []
+            for position in pending:
+                request = requests[position]
+                spec = self._build_search_spec(request, query_vectors.get(request['query']))
+                if spec is None:
+                    outputs[position] = {'results': [], 'error': '获取查询向量失败'}
+                else:
+                    specs.append((position, spec))
+
+            if len(specs) == 1:
+                responses = [es_client.run_search(specs[0][1])]
             else:
-                raise ValueError(f"不支持的搜索类型: {search_type}")
-
-            # 处理搜索结果
-            results = []
-            for hit in response['hits']['hits']:
-                result = {
-                    'chunk_id': hit['_id'],
-                    'score': hit['_score'],
-                    'content': hit['_source'].get('chunk_content', ''),
-                    'document_id': hit['_source'].get('document_id', ''),
-                    'document_name': hit['_source'].get('document_name', ''),
-                    'kb_id': hit['_source'].get('kb_id', ''),
-                    'metadata': hit['_source'].get('metadata', {})
-                }
-
-                results.append(result)
-                # 启用阈值 and 分数低于Score阈值  其实在es查询时已经过滤了，这里不再重复过滤
-                # if use_score_relevance and result['score'] < min_score:
-                #     pass
-                # else:
-                #     results.append(result)
+                responses = es_client.multi_search([spec for _, spec in specs])
 
-            logger.info(f"搜索完成: {len(results)}个结果")
-            return results
+            for (position, _), response in zip(specs, responses):
+                outputs[position] = self._handle_response(requests[position], response)
 
         except Exception as e:
             logger.error(f"搜索失败: {e}")
-            return []
-
-    def _text_search(self, index_name: str, query: str, size: int, min_score: float) -> Dict[str, Any]:
-        """全文搜索"""
-        return es_client.text_search(
-            index_name=index_name,
-            query_text=query,
-            fields=["id", "document_id", "chunk_content", "document_name", "kb_id", "metadata"],
-            size=size,
-            min_score=min_score
-        )
-
-    def _vector_search(self, index_name: str, query: str, size: int, min_score: float) -> Dict[str, Any]:
-        """向量搜索"""
-        # 获取查询向量
-        query_vector = embedding_utils.get_embedding(query)
-        if not query_vector:
-            logger.error("获取查询向量失败")
-            return {'hits': {'hits': [], 'total': {'value': 0}}}
-
-        return es_client.vector_search(
-            index_name=index_name,
-            vector=query_vector,
-            fields=["id", "document_id", "chunk_content", "document_name", "kb_id", "metadata"],
-            size=size,
-            min_score=min_score
-        )
-
-    def _hybrid_search(self, index_name: str, query: str, size: int,
-                       text_weight: float, vector_weight: float, min_score: float) -> Dict[str, Any]:
-        """混合搜索"""
-        # 获取查询向量
-        query_vector = embedding_utils.get_embedding(query)
-        if not query_vector:
+            return [output or {'results': [], 'error': str(e)} for output in outputs]
+
+        return outputs
+
+    def _build_search_spec(self, request: Dict[str, Any],
+                           query_vector: Optional[List[float]]) -> Optional[Dict[str, Any]]:
+        """按搜索类型构建ES检索；获取查询向量失败时，混合搜索回退到纯文本搜索，向量搜索返回None"""
+        index_name = request['index_name']
+        query = request['query']
+        search_type = request['search_type']
+        size = request['top_k']
+        min_score = request['min_score']
+        filters = request['filters']
+
+        if search_type != SearchType.TEXT and not query_vector:
+            if search_type == SearchType.VECTOR:
+                logger.error("获取查询向量失败")
+                return None
             logger.warning("获取查询向量失败，回退到纯文本搜索")
-            return self._text_search(index_name, query, size)
-
-        return es_client.hybrid_search(
-            index_name=index_name,
-            query_text=query,
-            vector=query_vector,
-            text_weight=text_weight,
-            vector_weight=vector_weight,
-            size=size,
-            min_score=min_score
+            search_type = SearchType.TEXT
+
+        if search_type == SearchType.TEXT:
+            return es_client.text_search_spec(index_name, query, size, min_score, SEARCH_SOURCE_FIELDS, filters)
+        elif search_type == SearchType.VECTOR:
+            return es_client.vector_search_spec(index_name, query_vector, size, min_score, SEARCH_SOURCE_FIELDS,
+                                                mode=request['vector_mode'], filters=filters)
+        elif search_type == SearchType.HYBRID:
+            return es_client.hybrid_search_spec(index_name, query, query_vector, request['text_weight'],
+                                                request['vector_weight'], size, min_score, SEARCH_SOURCE_FIELDS,
+                                                filters)
+        elif search_type == SearchType.HYBRID_RRF:
+            return es_client.hybrid_rrf_search_spec(index_name, query, query_vector, size,
+                                                    request['text_window_size'], request['vector_window_size'],
+                                                    request['rrf_rank_constant'], min_score,
+                                                    SEARCH_SOURCE_FIELDS, filters)
+        elif search_type == SearchType.HYBRID_RESCORE:
+            return es_client.hybrid_rescore_search_spec(index_name, query, query_vector, request['text_weight'],
+                                                        request['vector_weight'], size,
+                                                        request['rescore_window_size'], min_score,
+                                                        SEARCH_SOURCE_FIELDS, filters)
+        raise ValueError(f"不支持的搜索类型: {search_type}")
+
+    def _handle_response(self, request: Dict[str, Any], response: Dict[str, Any]) -> Dict[str, Any]:
+        """处理检索响应：转换检索结果，检索成功且知识库已稳定时写入结果缓存"""
+        kb_id = request['kb_id']
+        # 索引已被删除（如其他进程删除了知识库）时移出已知列表
+        if response.get('error') == '索引不存在':
+            kb_index_manager.invalidate(kb_id)
+
+        results = [self._to_search_hit(hit) for hit in response['hits']['hits']]
+
+        # 检索出错、知识库有进行中的变更、或刚变化ES尚未refresh时不缓存
+        if request['cache_key'] is not None and 'error' not in response \
+                and kb_generations.is_settled(kb_id, self._result_cache_settle_seconds):
+            self._result_cache.set(request['cache_key'], results)
+
+        return {'results': results, 'error': response.get('error')}
+
+    def _to_search_hit(self, hit: Dict[str, Any]) -> SearchHit:
+        """ES命中结果转换为检索结果"""
+        source = hit.get('_source', {})
+        return SearchHit(
+            chunk_id=hit['_id'],
+            score=hit['_score'],
+            content=source.get('chunk_content', ''),
+            document_id=source.get('document_id', ''),
+            document_name=source.get('document_name', ''),
+            kb_id=source.get('kb_id', ''),
+            metadata=source.get('metadata', {})
         )
 
-    def _search_for_chat(self, kb_id: str, query: str) -> List[Dict[str, Any]]:
+    def _search_for_chat(self, kb_id: Union[str, List[str]], query: str) -> List[Dict[str, Any]]:
         size = 3
         min_score = 0.5
         text_weight = 0.3
@@ -142,22 +360,66 @@ class SearchService:
 
     def get_similar_chunks(self, chunk_id: str, kb_id: str, top_k: int = 5) -> List[Dict[str, Any]]:
         """获取相似分块"""
+        return self.get_similar_chunks_batch([chunk_id], kb_id, top_k).get(chunk_id, [])
+
+    def get_similar_chunks_batch(self, chunk_ids: List[str], kb_id: str,
+                                 top_k: int = 5) -> Dict[str, List[Dict[str, Any]]]:
+        """
+        批量获取相似分块，返回 {分块ID: 相似分块列表}，不存在的分块返回空列表
+        向量直接取ES中已存储的 chunk_embedding（一次mget），不再重新向量化；
+        向量未存储在_source中（exclude_vector_from_source）时按分块内容向量化（走向量缓存）；
+        所有分块的knn检索合并为一次_msearch请求，检索结果排除分块自身
+        """
+        chunk_ids = list(dict.fromkeys(chunk_ids))
+        similar = {chunk_id: [] for chunk_id in chunk_ids}
         try:
-            # 获取分块内容
-            with db_manager.get_session() as session:
-                chunk = session.query(Chunk).filter_by(chunk_id=chunk_id, kb_id=kb_id).first()
-                if not chunk:
+            index_name = kb_index_manager.index_name(kb_id)
+            vectors = self._get_chunk_vectors(index_name, chunk_ids, kb_id)
+            seeds = [chunk_id for chunk_id in chunk_ids if chunk_id in vectors]
+            for chunk_id in chunk_ids:
+                if chunk_id not in vectors:
                     logger.warning(f"分块不存在: {chunk_id}")
-                    return []
 
-                # 向量搜索相似内容
-                return self._vector_search(f"kb_{kb_id}", chunk.chunk_content, top_k, 0.0)['hits']['hits']
+            specs = [es_client.vector_search_spec(
+                index_name, vectors[chunk_id], size=top_k, min_score=0.0, fields=SEARCH_SOURCE_FIELDS,
+                filters=es_client.build_filters() + [{"bool": {"must_not": {"ids": {"values": [chunk_id]}}}}]
+            ) for chunk_id in seeds]
+            responses = [es_client.run_search(specs[0])] if len(specs) == 1 else es_client.multi_search(specs)
+
+            for chunk_id, response in zip(seeds, responses):
+                similar[chunk_id] = response['hits']['hits']
+            return similar
 
         except Exception as e:
             logger.error(f"获取相似分块失败: {e}")
-            return []
-
-    def chat(self, kb_id: str, query: str) -> Optional[str]:
+            return similar
+
+    def _get_chunk_vectors(self, index_name: str, chunk_ids: List[str], kb_id: str) -> Dict[str, List[float]]:
+        """获取分块向量：优先取ES中已存储的向量，取不到时从MySQL读取分块内容重新向量化"""
+        vectors = {}
+        for doc_id, source in es_client.get_documents(index_name, chunk_ids,
+                                                      fields=['chunk_embedding', 'kb_id']).items():
+            # shared布局下按id获取不经过别名的过滤条件，需要确认分块属于该知识库
+            if source.get('kb_id') == kb_id and source.get('chunk_embedding'):
+                vectors[doc_id] = source['chunk_embedding']
+
+        missing = [chunk_id for chunk_id in chunk_ids if chunk_id not in vectors]
+        if missing:
+            with db_manager.get_session() as session:
+                rows = session.query(Chunk.chunk_id, Chunk.chunk_content) \
+                    .filter(Chunk.kb_id == kb_id, Chunk.chunk_id.in_(missing)).all()
+                contents = {row.chunk_id: row.chunk_content for row in rows}
+
+            if contents:
+                # 与入库时相同的向量化方式，命中向量缓存时不请求接口
+                embeddings = embedding_utils.get_embeddings(list(contents.values()))
+                for chunk_id, embedding in zip(contents.keys(), embeddings):
+                    if embedding:
+                        vectors[chunk_id] = embedding
+        return vectors
+
+    def chat(self, kb_id: Union[str, List[str]], query: str) -> Optional[str]:
+        """智能问答，kb_id 为列表时跨知识库检索"""
         qa_chain =  self.setup_qa_chain()
         answer = qa_chain.invoke({"kb_id": kb_id, "query_text": query})
         return answer
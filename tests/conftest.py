@@ -0,0 +1,7 @@
+import os
+import sys
+
+# 测试从项目根目录导入模块
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# 向量化客户端初始化时需要API Key，测试中不会真正调用
+os.environ.setdefault('DASHSCOPE_API_KEY', 'test')
@@ -0,0 +1,151 @@
+"""进程内缓存工具：TTLCache、SingleFlight、KbGenerations"""
+import threading
+import time
+
+import pytest
+
+import utils.cache_utils as cache_utils
+from utils.cache_utils import KbGenerations, SingleFlight, TTLCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(cache_utils.time, 'monotonic', clock)
+    return clock
+
+
+def test_ttl_cache_expires_entries(clock):
+    cache = TTLCache(max_size=10, ttl=5)
+    cache.set('a', 1)
+    clock.now += 4.9
+    assert cache.get('a') == 1
+    clock.now += 0.1
+    assert cache.get('a') is None
+    assert cache.stats()['expirations'] == 1
+    assert cache.stats()['size'] == 0
+
+
+def test_ttl_cache_without_ttl_never_expires(clock):
+    cache = TTLCache(max_size=10, ttl=0)
+    cache.set('a', 1)
+    clock.now += 10 ** 6
+    assert cache.get('a') == 1
+
+
+def test_ttl_cache_evicts_least_recently_used():
+    cache = TTLCache(max_size=2, ttl=0)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    # 读取a后b成为最久未使用
+    assert cache.get('a') == 1
+    cache.set('c', 3)
+    assert cache.get('b') is None
+    assert cache.get('a') == 1
+    assert cache.get('c') == 3
+    assert cache.stats()['evictions'] == 1
+
+    # 覆盖写入同样刷新使用顺序
+    cache.set('a', 10)
+    cache.set('d', 4)
+    assert cache.get('c') is None
+    assert cache.get('a') == 10
+
+
+def _run_followers(flight, key, fn, count):
+    """启动 count 个调用方，返回 (线程列表, 结果列表)；结果为返回值或异常"""
+    results = []
+
+    def call():
+        try:
+            results.append(flight.do(key, fn))
+        except Exception as e:
+            results.append(e)
+
+    threads = [threading.Thread(target=call) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    return threads, results
+
+
+def _wait_until(predicate, timeout=5.0):
+    deadline = time.time() + timeout
+    while not predicate():
+        assert time.time() < deadline, "等待超时"
+        time.sleep(0.01)
+
+
+def test_single_flight_coalesces_concurrent_calls():
+    flight = SingleFlight()
+    release = threading.Event()
+    calls = []
+
+    def fn():
+        calls.append(1)
+        release.wait(5)
+        return 'value'
+
+    threads, results = _run_followers(flight, 'k', fn, 5)
+    # 其余调用方都在等待第一个调用的结果
+    _wait_until(lambda: flight.coalesced == 4)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert calls == [1]
+    assert results == ['value'] * 5
+    assert flight.stats() == {'executions': 1, 'coalesced': 4, 'in_flight': 0}
+
+    # 调用结束后同一个key重新执行
+    assert flight.do('k', lambda: 'again') == 'again'
+
+
+def test_single_flight_leader_error_reaches_followers():
+    flight = SingleFlight()
+    release = threading.Event()
+
+    def fn():
+        release.wait(5)
+        raise RuntimeError('boom')
+
+    threads, results = _run_followers(flight, 'k', fn, 4)
+    _wait_until(lambda: flight.coalesced == 3)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert not any(thread.is_alive() for thread in threads)
+    assert len(results) == 4
+    assert all(isinstance(result, RuntimeError) and str(result) == 'boom' for result in results)
+    assert flight.stats()['in_flight'] == 0
+
+
+def test_kb_generations_pending_blocks_settle_until_ended():
+    generations = KbGenerations()
+    generations.begin_pending('kb1')
+    generation = generations.get('kb1')
+    assert not generations.is_settled('kb1', 0)
+    assert generations.is_settled('kb2', 0)
+
+    generations.end_pending('kb1')
+    assert generations.get('kb1') == generation + 1
+    assert generations.is_settled('kb1', 0)
+    assert not generations.is_settled('kb1', 60)
+
+
+def test_kb_generations_nested_pending():
+    generations = KbGenerations()
+    generations.begin_pending('kb1')
+    generations.begin_pending('kb1')
+    generations.end_pending('kb1')
+    assert not generations.is_settled('kb1', 0)
+    generations.end_pending('kb1')
+    assert generations.is_settled('kb1', 0)
@@ -0,0 +1,183 @@
+"""ElasticsearchClient 中不访问ES的逻辑"""
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip('elasticsearch')
+
+import core.elasticsearch_client as es_module  # noqa: E402
+from core.elasticsearch_client import ElasticsearchClient  # noqa: E402
+
+INDEX_NOT_FOUND = {"type": "index_not_found_exception", "reason": "no such index [kb_x]"}
+RRF_SPEC = {"index": "kb_x", "rank_constant": 60, "size": 10}
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(ElasticsearchClient, '_initialize_client', lambda self: None)
+    return ElasticsearchClient()
+
+
+def test_fuse_responses_all_legs_failed_returns_error(client):
+    response = client._fuse_responses(RRF_SPEC, [{"error": INDEX_NOT_FOUND}, {"error": INDEX_NOT_FOUND}])
+    assert response["error"] == "索引不存在"
+    assert response["hits"]["hits"] == []
+
+
+def test_fuse_responses_partial_failure_keeps_other_legs(client):
+    hits = [{"_id": "a", "_score": 3.0}, {"_id": "b", "_score": 1.0}]
+    response = client._fuse_responses(RRF_SPEC, [{"error": INDEX_NOT_FOUND}, {"hits": {"hits": hits}}])
+    assert 'error' not in response
+    assert [hit["_id"] for hit in response["hits"]["hits"]] == ["a", "b"]
+
+
+def test_rescore_window_clamped_to_max_rescore_window(client):
+    client.max_rescore_window = 1000
+    spec = client.hybrid_rescore_search_spec('kb_x', '查询', [0.1, 0.2], size=10, window_size=50000)
+    assert spec["requests"][0][1]["window_size"] == 1000
+
+    spec = client.hybrid_rescore_search_spec('kb_x', '查询', [0.1, 0.2], size=20, window_size=5)
+    assert spec["requests"][0][1]["window_size"] == 20
+
+
+def test_knn_k_never_exceeds_num_candidates(client):
+    client.knn_max_num_candidates = 500
+    _, params = client._knn_request([0.1, 0.2], size=2000)
+    assert params["k"] == params["size"] == 500
+    assert params["num_candidates"] == 500
+
+    _, params = client._knn_request([0.1, 0.2], size=10, num_candidates=5)
+    assert params["k"] == 10
+    assert params["num_candidates"] == 10
+
+
+def _fake_streaming_bulk(failures, interrupt_after=None):
+    """按文档id返回成功或失败的bulk结果，interrupt_after 条之后抛出异常模拟请求中断"""
+    def streaming_bulk(client, actions, **kwargs):
+        for position, action in enumerate(actions):
+            if interrupt_after is not None and position >= interrupt_after:
+                raise ConnectionError("connection reset")
+            doc_id = action["_id"]
+            if doc_id in failures:
+                yield False, {"index": {"_id": doc_id, "status": failures[doc_id][0], "error": failures[doc_id][1]}}
+            else:
+                yield True, {"index": {"_id": doc_id, "status": 201}}
+    return streaming_bulk
+
+
+def test_bulk_index_documents_maps_results_per_document(client, monkeypatch):
+    failures = {
+        "c2": (400, {"type": "mapper_parsing_exception", "reason": "bad vector"}),
+        "c4": (429, None),
+    }
+    monkeypatch.setattr(es_module.helpers, 'streaming_bulk', _fake_streaming_bulk(failures))
+    docs = [{"id": f"c{i}"} for i in range(1, 6)]
+
+    results = client.bulk_index_documents('kb_x', docs)
+
+    assert [result["id"] for result in results] == ["c1", "c2", "c3", "c4", "c5"]
+    assert [result["id"] for result in results if result["ok"]] == ["c1", "c3", "c5"]
+    assert results[1]["error"] == "mapper_parsing_exception: bad vector"
+    assert results[3]["status"] == 429
+    assert "429" in results[3]["error"]
+
+
+def test_bulk_index_documents_marks_unreported_documents_failed(client, monkeypatch):
+    monkeypatch.setattr(es_module.helpers, 'streaming_bulk', _fake_streaming_bulk({}, interrupt_after=2))
+    results = client.bulk_index_documents('kb_x', [{"id": f"c{i}"} for i in range(1, 5)])
+
+    assert [result["ok"] for result in results] == [True, True, False, False]
+    assert results[2]["error"] == "批量索引请求中断"
+
+
+def test_bulk_index_documents_keeps_order_with_threads(client, monkeypatch):
+    failures = {"c3": (400, {"type": "illegal_argument_exception", "reason": "x"})}
+    monkeypatch.setattr(es_module.helpers, 'streaming_bulk', _fake_streaming_bulk(failures))
+    client.bulk_thread_count = 3
+    docs = [{"id": f"c{i}"} for i in range(1, 8)]
+
+    results = client.bulk_index_documents('kb_x', docs, chunk_size=2)
+
+    assert [result["id"] for result in results] == [doc["id"] for doc in docs]
+    assert [result["id"] for result in results if not result["ok"]] == ["c3"]
+
+
+class FakeIndices:
+    """记录settings修改的索引API"""
+
+    def __init__(self, settings, delay=0.0):
+        self.settings = dict(settings)
+        self.delay = delay
+        self.put_calls = []
+
+    def get_settings(self, index, name=None, flat_settings=True):
+        time.sleep(self.delay)
+        return SimpleNamespace(body={f"{index}_v1": {"settings": dict(self.settings)}})
+
+    def put_settings(self, index, settings):
+        time.sleep(self.delay)
+        self.put_calls.append(dict(settings))
+        self.settings.update(settings)
+
+
+def _bulk_load_client(client, delay=0.0):
+    client.bulk_load_enabled = True
+    client.client = SimpleNamespace(indices=FakeIndices(
+        {"index.refresh_interval": "1s", "index.number_of_replicas": "1"}, delay))
+    client.refreshed = []
+    client.refresh_index = lambda index_name: client.refreshed.append(index_name) or True
+    return client.client.indices
+
+
+def test_nested_bulk_loads_restore_settings_once_after_last_exit(client):
+    indices = _bulk_load_client(client)
+
+    with client.bulk_load('kb_x'):
+        with client.bulk_load('kb_x'):
+            assert indices.settings["index.refresh_interval"] == "-1"
+        # 内层结束时仍有导入进行中，不恢复
+        assert indices.settings["index.refresh_interval"] == "-1"
+        assert client.refreshed == []
+
+    assert indices.put_calls == [
+        {"index.refresh_interval": "-1", "index.number_of_replicas": 0},
+        {"index.refresh_interval": "1s", "index.number_of_replicas": "1"},
+    ]
+    assert client.refreshed == ['kb_x']
+    assert client._bulk_load_states == {}
+
+
+def test_concurrent_bulk_loads_restore_settings_once(client):
+    indices = _bulk_load_client(client, delay=0.02)
+    started = threading.Barrier(4)
+
+    def load(position):
+        started.wait()
+        with client.bulk_load('kb_x'):
+            time.sleep(0.01 * position)
+
+    threads = [threading.Thread(target=load, args=(position,)) for position in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(10)
+
+    # 无论先后，只进入一次、恢复一次，恢复为导入前的原始settings
+    assert len(indices.put_calls) == 2
+    assert indices.put_calls[0]["index.refresh_interval"] == "-1"
+    assert indices.put_calls[1] == {"index.refresh_interval": "1s", "index.number_of_replicas": "1"}
+    assert indices.settings["index.refresh_interval"] == "1s"
+    assert client.refreshed == ['kb_x']
+    assert client._bulk_load_states == {}
+
+
+def test_bulk_load_after_exit_saves_restored_settings(client):
+    indices = _bulk_load_client(client)
+    with client.bulk_load('kb_x'):
+        pass
+    with client.bulk_load('kb_x'):
+        pass
+    assert indices.put_calls[-1] == {"index.refresh_interval": "1s", "index.number_of_replicas": "1"}
+    assert indices.settings["index.refresh_interval"] == "1s"
@@ -0,0 +1,61 @@
+"""向量磁盘缓存：键组成和淘汰"""
+import pytest
+
+pytest.importorskip('numpy')
+pytest.importorskip('langchain_community')
+
+import utils.embedding_utils as embedding_module  # noqa: E402
+from utils.embedding_utils import EmbeddingCache  # noqa: E402
+
+MODEL = 'text-embedding-v3'
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        self.now += 1
+        return self.now
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(embedding_module.time, 'time', FakeClock())
+    return EmbeddingCache(str(tmp_path / 'cache' / 'embeddings.db'), max_entries=10)
+
+
+def test_hit_and_miss_by_key(cache):
+    cache.put_many(MODEL, 3, 'document', ['a', 'b'], [[0.5, -0.25, 1.0], None])
+
+    assert cache.get_many(MODEL, 3, 'document', ['a', 'b', 'a']) == [[0.5, -0.25, 1.0], None, [0.5, -0.25, 1.0]]
+    # 文本类型、维度、模型不同的键不命中
+    assert cache.get_many(MODEL, 3, 'query', ['a']) == [None]
+    assert cache.get_many(MODEL, 4, 'document', ['a']) == [None]
+    assert cache.get_many('other-model', 3, 'document', ['a']) == [None]
+
+    stats = cache.stats()
+    assert stats['hits'] == 2
+    assert stats['misses'] == 4
+
+
+def test_key_uses_sha256_of_text(cache):
+    cache.put_many(MODEL, 3, 'query', ['文本'], [[1.0, 2.0, 3.0]])
+    rows = cache._conn.execute("SELECT model_name, dimensions, text_type, text_hash FROM embedding_cache").fetchall()
+    assert rows == [(MODEL, 3, 'query', EmbeddingCache.text_hash('文本'))]
+    assert len(EmbeddingCache.text_hash('文本')) == 64
+
+
+def test_evicts_least_recently_accessed_to_ninety_percent(cache):
+    texts = [f"text-{i}" for i in range(10)]
+    cache.put_many(MODEL, 3, 'document', texts, [[float(i), 0.0, 0.0] for i in range(10)])
+    # 读取 text-0 后它成为最近访问的条目
+    assert cache.get_many(MODEL, 3, 'document', ['text-0'])[0] == [0.0, 0.0, 0.0]
+
+    cache.put_many(MODEL, 3, 'document', ['text-10'], [[10.0, 0.0, 0.0]])
+
+    count = cache._conn.execute("SELECT COUNT(*) FROM embedding_cache").fetchone()[0]
+    assert count == 9
+    results = cache.get_many(MODEL, 3, 'document', texts + ['text-10'])
+    missing = [text for text, vector in zip(texts + ['text-10'], results) if vector is None]
+    assert missing == ['text-1', 'text-2']
@@ -0,0 +1,59 @@
+"""存储检索模板与内联请求体一致：同一组参数渲染模板得到的请求体应与 _build_inline_body 相同"""
+import json
+import re
+
+import pytest
+
+pytest.importorskip('elasticsearch')
+
+from core.elasticsearch_client import ElasticsearchClient  # noqa: E402
+from core.es_scripts import SEARCH_TEMPLATES  # noqa: E402
+
+INDEX = 'kb_test'
+VECTOR = [0.12, -0.5, 0.33]
+QUERY_TEXT = '向量 "检索" \\ 测试'
+
+
+def render_template(source, params):
+    """按ES的Mustache语义渲染模板中用到的语法：toJson、条件段落、变量"""
+    source = re.sub(r'{{#toJson}}(\w+){{/toJson}}',
+                    lambda m: json.dumps(params[m.group(1)], ensure_ascii=False), source)
+    source = re.sub(r'{{#(\w+)}}(.*?){{/\1}}',
+                    lambda m: m.group(2) if params.get(m.group(1)) else '', source, flags=re.S)
+    source = re.sub(r'{{(\w+)}}', lambda m: json.dumps(params[m.group(1)]), source)
+    return json.loads(source)
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(ElasticsearchClient, '_initialize_client', lambda self: None)
+    client = ElasticsearchClient()
+    # 模板中的脚本按id引用，对比时内联请求体也按id引用
+    client._stored_scripts_ready = True
+    return client
+
+
+def _specs(client):
+    filters = client.build_filters(document_ids=['d1', 'd2'], created_from='2024-01-01')
+    fields = ['chunk_content', 'document_id']
+    return [
+        client.text_search_spec(INDEX, QUERY_TEXT, size=5, min_score=0.2, fields=fields, filters=filters),
+        client.hybrid_search_spec(INDEX, QUERY_TEXT, VECTOR, 0.3, 0.7, size=5, filters=filters),
+        client.hybrid_rescore_search_spec(INDEX, QUERY_TEXT, VECTOR, 0.4, 0.6, size=5, window_size=50),
+        client.vector_search_spec(INDEX, VECTOR, size=5, mode='exact', filters=filters),
+        client.vector_search_spec(INDEX, VECTOR, size=5, mode='knn', min_score=0.6, filters=filters),
+        client.vector_search_spec(INDEX, VECTOR, size=5, mode='knn', min_score=None),
+        client.hybrid_rrf_search_spec(INDEX, QUERY_TEXT, VECTOR, size=5, fields=fields, filters=filters),
+    ]
+
+
+def test_every_template_is_covered(client):
+    covered = {template_id for spec in _specs(client) for template_id, _ in spec['requests']}
+    assert covered == set(SEARCH_TEMPLATES)
+
+
+def test_template_matches_inline_body(client):
+    for spec in _specs(client):
+        for template_id, params in spec['requests']:
+            rendered = render_template(SEARCH_TEMPLATES[template_id], params)
+            assert rendered == client._build_inline_body(template_id, params), template_id
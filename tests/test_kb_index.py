@@ -0,0 +1,79 @@
+"""知识库索引管理：批量导入模式"""
+from contextlib import contextmanager
+
+import pytest
+
+pytest.importorskip('elasticsearch')
+
+import core.kb_index as kb_index_module  # noqa: E402
+from core.kb_index import KbIndexManager  # noqa: E402
+from utils.cache_utils import KbGenerations  # noqa: E402
+
+
+class FakeEs:
+    bulk_load_min_file_size = 100
+
+    def __init__(self):
+        self.loading = []
+
+    @contextmanager
+    def bulk_load(self, index_name):
+        self.loading.append(index_name)
+        yield
+
+
+@pytest.fixture
+def manager(monkeypatch):
+    es = FakeEs()
+    monkeypatch.setattr(kb_index_module, 'es_client', es)
+    monkeypatch.setattr(kb_index_module, 'kb_generations', KbGenerations())
+    manager = KbIndexManager()
+    monkeypatch.setattr(manager, 'current_indices', lambda kb_id: [f"kb_{kb_id}_v1"])
+    return manager
+
+
+def test_bulk_load_marks_kb_pending(manager):
+    with manager.bulk_load('kb1', file_size=1000):
+        assert kb_index_module.es_client.loading == ['kb_kb1_v1']
+        assert not kb_index_module.kb_generations.is_settled('kb1', 0)
+    assert kb_index_module.kb_generations.is_settled('kb1', 0)
+
+
+def test_bulk_load_skipped_for_small_files(manager):
+    with manager.bulk_load('kb1', file_size=10):
+        assert kb_index_module.es_client.loading == []
+        assert kb_index_module.kb_generations.is_settled('kb1', 0)
+
+
+class FakeTemplateEs:
+    def __init__(self):
+        self.index_templates = {}
+
+    def build_default_mapping(self):
+        return {}
+
+    def build_default_settings(self):
+        return {}
+
+    def put_component_template(self, name, template):
+        return True
+
+    def put_index_template(self, name, index_patterns, composed_of, template=None, priority=None):
+        self.index_templates[name] = (index_patterns, priority)
+        return True
+
+
+def test_install_templates_uses_distinct_priorities(monkeypatch):
+    es = FakeTemplateEs()
+    monkeypatch.setattr(kb_index_module, 'es_client', es)
+    assert KbIndexManager().install_templates()
+    priorities = [priority for _, priority in es.index_templates.values()]
+    assert len(priorities) == 2 and len(set(priorities)) == 2
+
+
+@pytest.mark.parametrize('prefix', ['kb_shared', 'kb', 'k', ''])
+def test_shared_prefix_overlapping_kb_pattern_rejected(monkeypatch, prefix):
+    section = {'layout': 'shared', 'shared_index_prefix': prefix}
+    monkeypatch.setattr(kb_index_module.config, 'get_section', lambda name: section)
+    with pytest.raises(ValueError):
+        KbIndexManager()
@@ -0,0 +1,217 @@
+"""重建索引：全量复制、切换别名、追平的完整流程"""
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip('sqlalchemy')
+pytest.importorskip('langchain_community')
+
+import services.kb_index_service as kb_index_module  # noqa: E402
+from services.kb_index_service import KbIndexService, REINDEX_STATUS_SUCCESS  # noqa: E402
+
+KB_ID = 'kb1'
+SOURCE_INDEX = 'rag_kb1_v1'
+TARGET_INDEX = 'rag_kb1_v2'
+
+
+class FakeEs:
+    """内存中的ES：索引名 -> {文档id: _source}"""
+
+    def __init__(self):
+        self.indices = {SOURCE_INDEX: {}}
+        self.refreshed = []
+
+    @contextmanager
+    def bulk_load(self, index_name):
+        yield
+
+    def get_documents(self, index_name, doc_ids, fields=None):
+        docs = self.indices.get(index_name, {})
+        return {doc_id: docs[doc_id] for doc_id in doc_ids if doc_id in docs}
+
+    def bulk_index_documents(self, index_name, documents):
+        for doc in documents:
+            self.indices[index_name][doc['id']] = doc
+        return [{'id': doc['id'], 'ok': True, 'error': None} for doc in documents]
+
+    def iter_document_ids(self, index_name, batch_size=1000):
+        ids = list(self.indices.get(index_name, {}))
+        for start in range(0, len(ids), batch_size):
+            yield ids[start:start + batch_size]
+
+    def delete_by_query(self, index_name, query, wait_for_completion=True):
+        docs = self.indices[index_name]
+        if 'ids' in query:
+            targets = [doc_id for doc_id in query['ids']['values'] if doc_id in docs]
+        else:
+            alive = set(query['bool']['must_not']['terms']['document_id'])
+            targets = [doc_id for doc_id, doc in docs.items() if doc['document_id'] not in alive]
+        for doc_id in targets:
+            del docs[doc_id]
+        return {'deleted': len(targets), 'failures': []}
+
+    def refresh_index(self, index_name):
+        self.refreshed.append(index_name)
+        return True
+
+    def delete_index(self, index_name):
+        return self.indices.pop(index_name, None) is not None
+
+
+class FakeKbIndexManager:
+    """别名只指向一个实际索引；切换前执行 before_switch 模拟复制期间的写入"""
+
+    def __init__(self, es):
+        self.es = es
+        self.alias_target = SOURCE_INDEX
+        self.before_switch = None
+
+    def index_name(self, kb_id):
+        return f"rag_{kb_id}"
+
+    def current_indices(self, kb_id):
+        return [self.alias_target]
+
+    def create_next_version(self, kb_id, vector_options=None):
+        self.es.indices[TARGET_INDEX] = {}
+        return TARGET_INDEX
+
+    def switch_alias(self, kb_id, new_index):
+        if self.before_switch:
+            self.before_switch()
+        self.alias_target = new_index
+        return True
+
+    def gc_versions(self, kb_id, keep=0):
+        deleted = [index for index in list(self.es.indices) if index != self.alias_target]
+        for index in deleted:
+            self.es.delete_index(index)
+        return deleted
+
+
+class SyncExecutor:
+    def submit(self, fn, *args, **kwargs):
+        fn(*args, **kwargs)
+        return True
+
+
+class FakeTables:
+    """内存中的tb_document和tb_chunk，实现KbIndexService的数据读取方法"""
+
+    def __init__(self, batch_size):
+        self.batch_size = batch_size
+        self.documents = {}
+        self.chunks = {}
+
+    def add_document(self, document_id, document_status=1, updated_time=None):
+        self.documents[document_id] = SimpleNamespace(
+            document_id=document_id, document_status=document_status,
+            updated_time=updated_time or datetime.now() - timedelta(days=1))
+
+    def add_chunk(self, chunk_id, document_id, content, updated_time=None):
+        self.chunks[chunk_id] = SimpleNamespace(
+            chunk_id=chunk_id, document_id=document_id, kb_id=KB_ID, chunk_content=content,
+            chunk_status=1, created_time=datetime.now() - timedelta(days=1),
+            updated_time=updated_time or datetime.now() - timedelta(days=1))
+
+    def load_chunk_batch(self, kb_id, last_chunk_id, updated_since=None):
+        rows = []
+        for chunk in sorted(self.chunks.values(), key=lambda c: c.chunk_id):
+            document = self.documents[chunk.document_id]
+            if chunk.kb_id != kb_id or document.document_status == 3 or chunk.chunk_id <= last_chunk_id:
+                continue
+            if updated_since is not None and chunk.updated_time < updated_since \
+                    and document.updated_time < updated_since:
+                continue
+            rows.append((chunk, document.document_status))
+        return rows[:self.batch_size]
+
+    def existing_chunk_ids(self, kb_id, chunk_ids):
+        return {chunk_id for chunk_id in chunk_ids
+                if chunk_id in self.chunks and self.chunks[chunk_id].kb_id == kb_id}
+
+    def alive_document_ids(self, kb_id):
+        return [document_id for document_id, document in self.documents.items() if document.document_status != 3]
+
+
+@pytest.fixture
+def env(monkeypatch):
+    es = FakeEs()
+    manager = FakeKbIndexManager(es)
+    monkeypatch.setattr(kb_index_module, 'es_client', es)
+    monkeypatch.setattr(kb_index_module, 'kb_index_manager', manager)
+    monkeypatch.setattr(kb_index_module, 'job_executor', SyncExecutor())
+    monkeypatch.setattr(kb_index_module.embedding_utils, 'get_embeddings',
+                        lambda texts, *args, **kwargs: [[0.5, 0.5] for _ in texts])
+
+    service = KbIndexService()
+    service.reindex_batch_size = 2
+    tables = FakeTables(service.reindex_batch_size)
+    service._load_chunk_batch = tables.load_chunk_batch
+    service._existing_chunk_ids = tables.existing_chunk_ids
+    service._alive_document_ids = tables.alive_document_ids
+    return SimpleNamespace(es=es, manager=manager, service=service, tables=tables)
+
+
+def _write_through_alias(env, chunk_id, document_id, content, vector):
+    """模拟写入：MySQL 和别名当前指向的索引"""
+    env.tables.add_chunk(chunk_id, document_id, content, updated_time=datetime.now())
+    env.es.indices[env.manager.alias_target][chunk_id] = {
+        'id': chunk_id, 'document_id': document_id, 'chunk_content': content, 'chunk_embedding': vector}
+
+
+def test_reindex_copy_switch_catch_up(env):
+    env.tables.add_document('d1')
+    env.tables.add_document('d2')
+    for chunk_id, document_id in [('c1', 'd1'), ('c2', 'd1'), ('c3', 'd1'), ('c5', 'd2')]:
+        env.tables.add_chunk(chunk_id, document_id, f"{chunk_id} 内容")
+        env.es.indices[SOURCE_INDEX][chunk_id] = {
+            'id': chunk_id, 'document_id': document_id, 'chunk_embedding': [0.1, 0.2]}
+
+    def during_copy():
+        # 单独删除的分块：只从别名当前指向的旧索引中删除
+        del env.tables.chunks['c2']
+        del env.es.indices[SOURCE_INDEX]['c2']
+        # 修改和新增的分块
+        _write_through_alias(env, 'c3', 'd1', 'c3 新内容', [0.3, 0.4])
+        _write_through_alias(env, 'c4', 'd1', 'c4 内容', [0.7, 0.8])
+        # 删除中的文档
+        env.tables.documents['d2'].document_status = 3
+
+    env.manager.before_switch = during_copy
+    task_id = env.service.start_reindex(KB_ID)
+    task = env.service.get_reindex_task(task_id)
+
+    assert task['status'] == REINDEX_STATUS_SUCCESS, task['error']
+    assert env.manager.alias_target == TARGET_INDEX
+    assert task['copied'] == 4
+    assert task['caught_up'] == 2
+    assert task['removed'] == 1
+    assert task['removed_chunks'] == 1
+    assert task['deleted_indices'] == [SOURCE_INDEX]
+
+    target = env.es.indices[TARGET_INDEX]
+    assert sorted(target) == ['c1', 'c3', 'c4']
+    assert target['c3']['chunk_content'] == 'c3 新内容'
+    assert target['c3']['chunk_embedding'] == [0.3, 0.4]
+    assert target['c4']['chunk_embedding'] == [0.7, 0.8]
+    assert target['c1']['metadata']['enabled'] is True
+    assert task['reembedded'] == 0
+    assert TARGET_INDEX in env.es.refreshed
+    # 追平结束后知识库不再有进行中的变更
+    assert kb_index_module.kb_generations.is_settled(KB_ID, 0)
+
+
+def test_reindex_failure_before_switch_drops_target(env, monkeypatch):
+    env.tables.add_document('d1')
+    env.tables.add_chunk('c1', 'd1', 'c1 内容')
+    env.es.indices[SOURCE_INDEX]['c1'] = {'id': 'c1', 'document_id': 'd1', 'chunk_embedding': [0.1, 0.2]}
+    monkeypatch.setattr(env.manager, 'switch_alias', lambda kb_id, new_index: False)
+
+    task = env.service.get_reindex_task(env.service.start_reindex(KB_ID))
+
+    assert task['status'] == 'failed'
+    assert env.manager.alias_target == SOURCE_INDEX
+    assert TARGET_INDEX not in env.es.indices
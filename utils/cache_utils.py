@@ -0,0 +1,197 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class TTLCache:
+    """线程安全的LRU缓存，支持过期时间（秒），ttl<=0 表示不过期"""
+
+    def __init__(self, max_size: int = 1000, ttl: float = 300):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """读取缓存，未命中或已过期返回None"""
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return None
+
+            value, expire_at = item
+            if expire_at is not None and expire_at <= time.monotonic():
+                del self._data[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value: Any):
+        """写入缓存，超出容量时淘汰最久未使用的条目"""
+        expire_at = time.monotonic() + self.ttl if self.ttl and self.ttl > 0 else None
+        with self._lock:
+            self._data[key] = (value, expire_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key: Hashable):
+        """删除缓存"""
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """缓存命中统计"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'size': len(self._data),
+                'max_size': self.max_size,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / total, 4) if total else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations
+            }
+
+
+class _Call:
+    """进行中的调用"""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """合并并发的相同请求：同一个key同时只执行一次，其余调用方等待并共享结果"""
+
+    def __init__(self):
+        self._calls: Dict[Hashable, _Call] = {}
+        self._lock = threading.Lock()
+        self.executions = 0
+        self.coalesced = 0
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                self.coalesced += 1
+                leader = False
+            else:
+                call = _Call()
+                self._calls[key] = call
+                self.executions += 1
+                leader = True
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.event.set()
+
+    def stats(self) -> Dict[str, Any]:
+        """请求合并统计"""
+        return {
+            'executions': self.executions,
+            'coalesced': self.coalesced,
+            'in_flight': len(self._calls)
+        }
+
+
+class KbGenerations:
+    """
+    知识库数据版本号
+    知识库内容发生变化（分块新增、修改、删除、状态变更）时递增，检索结果缓存的key包含版本号，旧结果不会再被命中
+    进行中的变更（异步按查询更新、批量导入模式）期间ES的结果随时可能变化，记为未完成，结束时再递增版本号
+    """
+
+    def __init__(self):
+        self._generations: Dict[str, int] = {}
+        self._changed_at: Dict[str, float] = {}
+        self._pending: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def get(self, kb_id: str) -> int:
+        with self._lock:
+            return self._generations.get(kb_id, 0)
+
+    def bump(self, kb_id: str) -> int:
+        """递增知识库版本号"""
+        if not kb_id:
+            return 0
+        with self._lock:
+            generation = self._generations.get(kb_id, 0) + 1
+            self._generations[kb_id] = generation
+            self._changed_at[kb_id] = time.monotonic()
+        logger.debug(f"知识库版本号更新: {kb_id} -> {generation}")
+        return generation
+
+    def changed_within(self, kb_id: str, seconds: float) -> bool:
+        """知识库是否在最近 seconds 秒内发生过变化（ES写入要等refresh后才可见）"""
+        with self._lock:
+            changed_at = self._changed_at.get(kb_id)
+        return changed_at is not None and time.monotonic() - changed_at < seconds
+
+    def begin_pending(self, kb_id: str):
+        """开始一个进行中的变更，结束前知识库不稳定"""
+        if not kb_id:
+            return
+        with self._lock:
+            self._pending[kb_id] = self._pending.get(kb_id, 0) + 1
+        self.bump(kb_id)
+
+    def end_pending(self, kb_id: str):
+        """结束一个进行中的变更，递增版本号使变更期间的结果失效"""
+        if not kb_id:
+            return
+        with self._lock:
+            count = self._pending.get(kb_id, 0) - 1
+            if count > 0:
+                self._pending[kb_id] = count
+            else:
+                self._pending.pop(kb_id, None)
+        self.bump(kb_id)
+
+    def is_settled(self, kb_id: str, seconds: float) -> bool:
+        """知识库是否稳定：没有进行中的变更，且最近 seconds 秒内没有变化，此时的检索结果可以缓存"""
+        with self._lock:
+            if self._pending.get(kb_id):
+                return False
+        return not self.changed_within(kb_id, seconds)
+
+
+# 全局知识库版本号实例
+kb_generations = KbGenerations()
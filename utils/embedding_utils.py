@@ -1,16 +1,154 @@
-from typing import List, Optional
+from typing import List, Optional, Callable, Dict, Any
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import hashlib
+import random
+import sqlite3
+import threading
+import time
 import openai
 import numpy as np
 # 使用千问的Embedding模型
 # from langchain_openai import OpenAIEmbeddings
 from langchain_community.embeddings import DashScopeEmbeddings
+from langchain_community.embeddings.dashscope import embed_with_retry
 import logging
-from utils.config import config
+from utils.config import config, _project_root
 import os
 
 logger = logging.getLogger(__name__)
 
 
+class EmbeddingCache:
+    """
+    向量磁盘缓存（SQLite）
+    以 (模型, 维度, 文本类型, sha256(文本)) 为键，超过 max_entries 时按最近访问时间淘汰
+    """
+
+    def __init__(self, path: str, max_entries: int = 200000):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        cache_dir = os.path.dirname(path)
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS embedding_cache (
+                model_name TEXT NOT NULL,
+                dimensions INTEGER NOT NULL,
+                text_type TEXT NOT NULL,
+                text_hash TEXT NOT NULL,
+                vector BLOB NOT NULL,
+                last_access REAL NOT NULL,
+                PRIMARY KEY (model_name, dimensions, text_type, text_hash)
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_last_access ON embedding_cache (last_access)")
+        self._conn.commit()
+        self._entries = self._conn.execute("SELECT COUNT(*) FROM embedding_cache").fetchone()[0]
+
+        logger.info(f"向量缓存初始化完成: {path}, 已缓存{self._entries}条")
+
+    @staticmethod
+    def text_hash(text: str) -> str:
+        return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+    def get_many(self, model_name: str, dimensions: int, text_type: str,
+                 texts: List[str]) -> List[Optional[List[float]]]:
+        """批量读取缓存，未命中的位置为None"""
+        hashes = [self.text_hash(text) for text in texts]
+        found: Dict[str, List[float]] = {}
+        now = time.time()
+
+        with self._lock:
+            unique_hashes = list(dict.fromkeys(hashes))
+            # SQLite 单条语句的参数个数有限，分段查询
+            for i in range(0, len(unique_hashes), 500):
+                part = unique_hashes[i:i + 500]
+                placeholders = ','.join('?' * len(part))
+                rows = self._conn.execute(
+                    f"SELECT text_hash, vector FROM embedding_cache "
+                    f"WHERE model_name = ? AND dimensions = ? AND text_type = ? AND text_hash IN ({placeholders})",
+                    [model_name, dimensions, text_type, *part]
+                ).fetchall()
+                for text_hash, blob in rows:
+                    found[text_hash] = np.frombuffer(blob, dtype=np.float32).tolist()
+
+            if found:
+                self._conn.executemany(
+                    "UPDATE embedding_cache SET last_access = ? "
+                    "WHERE model_name = ? AND dimensions = ? AND text_type = ? AND text_hash = ?",
+                    [(now, model_name, dimensions, text_type, h) for h in found]
+                )
+                self._conn.commit()
+
+            results = [found.get(h) for h in hashes]
+            hit_count = sum(1 for r in results if r is not None)
+            self.hits += hit_count
+            self.misses += len(results) - hit_count
+
+        return results
+
+    def put_many(self, model_name: str, dimensions: int, text_type: str,
+                 texts: List[str], vectors: List[Optional[List[float]]]):
+        """批量写入缓存，跳过为None的向量"""
+        now = time.time()
+        rows = [
+            (model_name, dimensions, text_type, self.text_hash(text),
+             np.asarray(vector, dtype=np.float32).tobytes(), now)
+            for text, vector in zip(texts, vectors) if vector
+        ]
+        if not rows:
+            return
+
+        with self._lock:
+            before = self._conn.total_changes
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embedding_cache "
+                "(model_name, dimensions, text_type, text_hash, vector, last_access) VALUES (?, ?, ?, ?, ?, ?)",
+                rows
+            )
+            self._conn.commit()
+            # INSERT OR REPLACE 对已存在的键也会计数，这里只作为近似值，淘汰时再精确统计
+            self._entries += self._conn.total_changes - before
+            if self._entries > self.max_entries:
+                self._evict()
+
+    def _evict(self):
+        """按最近访问时间淘汰，淘汰到容量的90%，避免每次写入都触发淘汰"""
+        self._entries = self._conn.execute("SELECT COUNT(*) FROM embedding_cache").fetchone()[0]
+        target = int(self.max_entries * 0.9)
+        if self._entries <= self.max_entries:
+            return
+
+        evict_count = self._entries - target
+        self._conn.execute(
+            "DELETE FROM embedding_cache WHERE rowid IN "
+            "(SELECT rowid FROM embedding_cache ORDER BY last_access ASC LIMIT ?)",
+            (evict_count,)
+        )
+        self._conn.commit()
+        self._entries = target
+        logger.info(f"向量缓存淘汰{evict_count}条")
+
+    def stats(self) -> Dict[str, Any]:
+        """缓存命中统计"""
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / total, 4) if total else 0.0,
+            'entries': self._entries,
+            'max_entries': self.max_entries
+        }
+
+
 class EmbeddingUtils:
     """向量化工具"""
 
@@ -18,6 +156,27 @@ class EmbeddingUtils:
         self.api_key = config.get('embedding.api_key')
         self.model_name = config.get('embedding.model_name', 'text-embedding-v3')
         self.dimensions = config.get('embedding.dimensions', 1024)
+        # 批量向量化参数：每次请求的文本数、并发请求数、单批重试次数及退避基数（秒）
+        self.batch_size = config.get('embedding.batch_size', 10)
+        self.max_workers = config.get('embedding.max_workers', 4)
+        self.max_retries = config.get('embedding.max_retries', 3)
+        self.retry_backoff = config.get('embedding.retry_backoff', 1.0)
+        self.max_backoff = config.get('embedding.max_backoff', 30.0)
+
+        # 所有调用方共享同一个线程池，整体并发受 max_workers 限制
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='embedding')
+
+        # 向量磁盘缓存，重复入库、重复查询的文本不再请求接口
+        self.cache: Optional[EmbeddingCache] = None
+        cache_config = config.get_section('embedding.cache')
+        if cache_config.get('enabled', False):
+            try:
+                cache_path = cache_config.get('path', 'data/embedding_cache.db')
+                if not os.path.isabs(cache_path):
+                    cache_path = os.path.join(_project_root, cache_path)
+                self.cache = EmbeddingCache(cache_path, cache_config.get('max_entries', 200000))
+            except Exception as e:
+                logger.error(f"向量缓存初始化失败，不使用缓存: {e}")
 
         # 初始化OpenAI客户端
         openai.api_key = self.api_key
@@ -37,22 +196,121 @@ class EmbeddingUtils:
 
     def get_embedding(self, text: str) -> Optional[List[float]]:
         """获取单个文本的向量"""
+        if self.cache:
+            cached = self.cache.get_many(self.model_name, self.dimensions, 'query', [text])[0]
+            if cached is not None:
+                return cached
+
         try:
             embedding = self.embeddings.embed_query(text)
-            return embedding
         except Exception as e:
             logger.error(f"获取向量失败: {e}")
             return None
 
-    def get_embeddings(self, texts: List[str]) -> List[List[float]]:
-        """获取多个文本的向量"""
-        try:
-            ems = self.embeddings.embed_documents(texts)
-            return ems
-        except Exception as e:
-            logger.error(f"批量获取向量失败: {e}")
+        if self.cache:
+            self.cache.put_many(self.model_name, self.dimensions, 'query', [text], [embedding])
+        return embedding
+
+    def get_embeddings(self, texts: List[str],
+                       progress_callback: Callable[[int, int], None] = None,
+                       text_type: str = 'document') -> List[Optional[List[float]]]:
+        """
+        获取多个文本的向量
+        先查缓存，未命中的文本去重后按 batch_size 分批并发请求，结果与输入顺序一致；
+        重试后仍失败的批次对应位置为None，其余批次结果保留；
+        text_type=query 时按查询向量化（与 get_embedding 一致），用于批量检索
+        """
+        if not texts:
             return []
 
+        results: List[Optional[List[float]]] = [None] * len(texts)
+        if self.cache:
+            results = self.cache.get_many(self.model_name, self.dimensions, text_type, texts)
+
+        # 未命中的文本去重，同一文档中重复的段落只请求一次
+        pending: Dict[str, List[int]] = {}
+        for i, text in enumerate(texts):
+            if results[i] is None:
+                pending.setdefault(text, []).append(i)
+        if not pending:
+            if progress_callback:
+                progress_callback(len(texts), len(texts))
+            return results
+
+        cached_count = len(texts) - sum(len(positions) for positions in pending.values())
+        pending_texts = list(pending.keys())
+        vectors = self._embed_concurrently(
+            pending_texts,
+            text_type=text_type,
+            progress_callback=(lambda done, total: progress_callback(cached_count + done, cached_count + total))
+            if progress_callback else None
+        )
+
+        for text, vector in zip(pending_texts, vectors):
+            for i in pending[text]:
+                results[i] = vector
+
+        if self.cache:
+            self.cache.put_many(self.model_name, self.dimensions, text_type, pending_texts, vectors)
+        return results
+
+    def _embed_concurrently(self, texts: List[str], text_type: str = 'document',
+                            progress_callback: Callable[[int, int], None] = None) -> List[Optional[List[float]]]:
+        """按 batch_size 分批并发请求接口，结果与输入顺序一致"""
+        batches = [texts[i:i + self.batch_size] for i in range(0, len(texts), self.batch_size)]
+        results: List[Optional[List[float]]] = [None] * len(texts)
+
+        futures = {
+            self._executor.submit(self._embed_batch_with_retry, batch, text_type): index * self.batch_size
+            for index, batch in enumerate(batches)
+        }
+
+        done = 0
+        failed = 0
+        for future in as_completed(futures):
+            offset = futures[future]
+            vectors = future.result()
+            if vectors is None:
+                failed += 1
+            else:
+                results[offset:offset + len(vectors)] = vectors
+            done += 1
+            if progress_callback:
+                progress_callback(min(done * self.batch_size, len(texts)), len(texts))
+
+        if failed:
+            logger.error(f"批量获取向量部分失败: 失败批次{failed}/{len(batches)}")
+        return results
+
+    def get_cache_stats(self) -> Dict[str, Any]:
+        """向量缓存命中统计"""
+        if not self.cache:
+            return {'enabled': False}
+        return {'enabled': True, **self.cache.stats()}
+
+    def _embed_batch_with_retry(self, batch: List[str], text_type: str = 'document') -> Optional[List[List[float]]]:
+        """单批向量化，失败时指数退避重试"""
+        for attempt in range(self.max_retries + 1):
+            try:
+                if text_type == 'query':
+                    # embed_query 一次只能向量化一个文本，批量查询直接按 query 类型调用接口
+                    vectors = [item['embedding'] for item in embed_with_retry(
+                        self.embeddings, input=batch, text_type='query', model=self.model_name)]
+                else:
+                    vectors = self.embeddings.embed_documents(batch)
+                if len(vectors) != len(batch):
+                    raise ValueError(f"向量数量不匹配: 期望{len(batch)}, 实际{len(vectors)}")
+                return vectors
+            except Exception as e:
+                if attempt >= self.max_retries:
+                    logger.error(f"批量获取向量失败，已重试{attempt}次: {e}")
+                    return None
+                delay = min(self.retry_backoff * (2 ** attempt), self.max_backoff)
+                delay += random.uniform(0, delay / 2)
+                logger.warning(f"批量获取向量失败，{delay:.1f}秒后重试({attempt + 1}/{self.max_retries}): {e}")
+                time.sleep(delay)
+        return None
+
     def cosine_similarity(self, vec1: List[float], vec2: List[float]) -> float:
         """计算余弦相似度"""
         try:
@@ -1,5 +1,10 @@
 import logging
-from typing import List, Dict, Any
+import multiprocessing
+import os
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Dict, Any, Iterable, Iterator, Optional
 import re
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_community.document_loaders import TextLoader, PyPDFLoader
@@ -12,6 +17,42 @@ from utils.config import config
 
 logger = logging.getLogger(__name__)
 
+# 解析进程池，进程内共享，首次使用时创建
+_parse_pool: Optional[ProcessPoolExecutor] = None
+_parse_pool_lock = threading.Lock()
+
+
+def _get_parse_pool(max_workers: int, start_method: str) -> ProcessPoolExecutor:
+    """
+    获取解析进程池
+    进程池在入库任务线程中创建，fork方式下子进程会复制其他线程持有的锁（日志、连接池等）而死锁，
+    因此默认使用forkserver：服务进程单线程，只预先导入解析函数所在模块，解析进程由其fork，
+    不复制应用中的各客户端单例（子进程以 __mp_main__ 导入app.py时只定义create_app，不初始化应用）
+    """
+    global _parse_pool
+    with _parse_pool_lock:
+        if _parse_pool is None:
+            mp_context = multiprocessing.get_context(start_method)
+            if start_method == 'forkserver':
+                mp_context.set_forkserver_preload([__name__])
+            _parse_pool = ProcessPoolExecutor(max_workers=max_workers, mp_context=mp_context)
+            logger.info(f"文档解析进程池初始化完成: workers={max_workers}, start_method={start_method}")
+        return _parse_pool
+
+
+def _extract_pdf_pages(file_path: str, start: int, end: int) -> List[str]:
+    """提取pdf指定页范围的文本（在子进程中执行）"""
+    from pypdf import PdfReader
+
+    reader = PdfReader(file_path)
+    return [reader.pages[i].extract_text() for i in range(start, end)]
+
+
+def _extract_docx_text(file_path: str) -> str:
+    """提取docx文本（在子进程中执行）"""
+    return '\n'.join(doc.page_content for doc in Docx2txtLoader(file_path).load())
+
+
 class TextSplitter:
     """文本分割工具"""
 
@@ -19,6 +60,16 @@ class TextSplitter:
         self.chunk_size = config.get('text_splitter.chunk_size', 1000)
         self.chunk_overlap = config.get('text_splitter.chunk_overlap', 200)
         self.separator = config.get('text_splitter.separator', '\n\n')
+        # 流式分割时缓冲区达到该长度（字符）就切分一次，只保留最后一个分块与后续内容拼接
+        self.stream_buffer_size = config.get('text_splitter.stream_buffer_size', self.chunk_size * 20)
+        # 流式读取txt文件时每段的最大长度（字符）
+        self.text_section_size = config.get('text_splitter.text_section_size', 1024 * 1024)
+        # 多进程解析：进程数为0时不启用；pdf页数达到阈值才拆分页范围并行解析
+        self.parse_workers = config.get('text_splitter.parse_workers', 0)
+        self.parse_page_threshold = config.get('text_splitter.parse_page_threshold', 50)
+        self.parse_pages_per_task = config.get('text_splitter.parse_pages_per_task', 20)
+        self.parse_start_method = config.get('text_splitter.parse_start_method') or \
+            ('forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn')
 
         self.splitter = RecursiveCharacterTextSplitter(
             chunk_size=self.chunk_size,
@@ -32,37 +83,133 @@ class TextSplitter:
 
         chunk_list = []
         for i, chunk in enumerate(chunks):
-            chunk_data = {
-                'chunk_id': str(uuid.uuid4()),
-                'document_id': document_id,
-                'chunk_content': chunk.strip(),
-                'chunk_order': i + 1,
-                'kb_id': kb_id,
-                'chunk_status': 1,
-                'index_status': '00'
-            }
-            chunk_list.append(chunk_data)
+            chunk_list.append(self._make_chunk_data(chunk, i + 1, document_id, kb_id))
 
         return chunk_list
 
+    def _make_chunk_data(self, chunk: str, chunk_order: int, document_id: str, kb_id: str) -> Dict[str, Any]:
+        """构建分块数据"""
+        return {
+            'chunk_id': str(uuid.uuid4()),
+            'document_id': document_id,
+            'chunk_content': chunk.strip(),
+            'chunk_order': chunk_order,
+            'kb_id': kb_id,
+            'chunk_status': 1,
+            'index_status': '00'
+        }
+
+    def iter_file_sections(self, file_path: str) -> Iterator[str]:
+        """逐段读取文件内容（pdf按页，txt按固定长度），不把整个文件加载到内存"""
+        if file_path.endswith('.pdf'):
+            page_count = self._pdf_page_count(file_path) if self.parse_workers > 0 else 0
+            if page_count >= self.parse_page_threshold > 0:
+                yield from self._iter_pdf_pages_parallel(file_path, page_count)
+            else:
+                for doc in PyPDFLoader(file_path).lazy_load():
+                    yield doc.page_content
+        elif file_path.endswith('.docx'):
+            # docx需要整体解压解析，无法按页读取；启用进程池时放到子进程解析，避免占用GIL
+            if self.parse_workers > 0:
+                pool = _get_parse_pool(self.parse_workers, self.parse_start_method)
+                yield pool.submit(_extract_docx_text, file_path).result()
+            else:
+                for doc in Docx2txtLoader(file_path).lazy_load():
+                    yield doc.page_content
+        elif file_path.endswith('.txt'):
+            with open(file_path, 'r', encoding='utf-8') as f:
+                section = []
+                section_len = 0
+                for line in f:
+                    section.append(line)
+                    section_len += len(line)
+                    if section_len >= self.text_section_size:
+                        yield ''.join(section)
+                        section = []
+                        section_len = 0
+                if section:
+                    yield ''.join(section)
+        else:
+            raise ValueError(f"不支持的文件格式: {file_path}")
+
+    def _pdf_page_count(self, file_path: str) -> int:
+        """获取pdf页数"""
+        try:
+            from pypdf import PdfReader
+            return len(PdfReader(file_path).pages)
+        except Exception as e:
+            logger.warning(f"获取pdf页数失败，使用单进程解析: {e}")
+            return 0
+
+    def _iter_pdf_pages_parallel(self, file_path: str, page_count: int) -> Iterator[str]:
+        """按页范围分发到进程池并行解析，按页序输出；同时在途的任务数有上限，避免结果堆积在内存中"""
+        pool = _get_parse_pool(self.parse_workers, self.parse_start_method)
+        page_ranges = iter([(start, min(start + self.parse_pages_per_task, page_count))
+                            for start in range(0, page_count, self.parse_pages_per_task)])
+        logger.info(f"pdf多进程解析: {os.path.basename(file_path)}, 页数: {page_count}")
+
+        pending = deque()
+        for _ in range(self.parse_workers * 2):
+            page_range = next(page_ranges, None)
+            if page_range is None:
+                break
+            pending.append(pool.submit(_extract_pdf_pages, file_path, *page_range))
+
+        while pending:
+            pages = pending.popleft().result()
+            page_range = next(page_ranges, None)
+            if page_range is not None:
+                pending.append(pool.submit(_extract_pdf_pages, file_path, *page_range))
+            yield from pages
+
+    def iter_split_sections(self, sections: Iterable[str], document_id: str, kb_id: str) -> Iterator[Dict[str, Any]]:
+        """增量分割：按段累积文本，缓冲区满时切分并输出分块，最后一个分块留在缓冲区与后续内容拼接"""
+        buffer = ''
+        chunk_order = 0
+        for section in sections:
+            buffer = f"{buffer}\n{section}" if buffer else section
+            if len(buffer) < self.stream_buffer_size:
+                continue
+
+            chunks = self.splitter.split_text(buffer)
+            if len(chunks) <= 1:
+                continue
+            for chunk in chunks[:-1]:
+                chunk_order += 1
+                yield self._make_chunk_data(chunk, chunk_order, document_id, kb_id)
+            buffer = chunks[-1]
+
+        if buffer:
+            for chunk in self.splitter.split_text(buffer):
+                chunk_order += 1
+                yield self._make_chunk_data(chunk, chunk_order, document_id, kb_id)
+
+    def iter_split_file(self, file_path: str, document_id: str, kb_id: str) -> Iterator[Dict[str, Any]]:
+        """流式加载并分割文件，逐个输出分块"""
+        return self.iter_split_sections(self.iter_file_sections(file_path), document_id, kb_id)
+
+    def load_file_text(self, file_path: str) -> str:
+        """加载文件并提取文本内容"""
+        # 根据文件扩展名选择加载器
+        if file_path.endswith('.pdf'):
+            loader = PyPDFLoader(file_path)
+        elif file_path.endswith('.docx'):
+            loader = Docx2txtLoader(file_path)
+        elif file_path.endswith('.txt'):
+            loader = TextLoader(file_path, encoding='utf-8')
+        else:
+            raise ValueError(f"不支持的文件格式: {file_path}")
+
+        # 加载文档
+        documents = loader.load()
+
+        return '\n'.join([doc.page_content for doc in documents])
+
     def load_and_split_file(self, file_path: str, document_id: str, kb_id: str) -> List[Dict[str, Any]]:
         """加载并分割文件"""
         try:
-            # 根据文件扩展名选择加载器
-            if file_path.endswith('.pdf'):
-                loader = PyPDFLoader(file_path)
-            elif file_path.endswith('.docx'):
-                loader = Docx2txtLoader(file_path)
-            elif file_path.endswith('.txt'):
-                loader = TextLoader(file_path, encoding='utf-8')
-            else:
-                raise ValueError(f"不支持的文件格式: {file_path}")
-
-            # 加载文档
-            documents = loader.load()
-
-            # 提取文本内容
-            text_content = '\n'.join([doc.page_content for doc in documents])
+            # 加载文档并提取文本内容
+            text_content = self.load_file_text(file_path)
 
             # 分割文本
             return self.split_text(text_content, document_id, kb_id)
@@ -74,21 +221,8 @@ class TextSplitter:
     def load_and_split_documents(self, file_path: str, document_id: str, kb_id: str) -> List[Document]:
         """加载并分割文件，返回List<Documnet>"""
         try:
-            # 根据文件扩展名选择加载器
-            if file_path.endswith('.pdf'):
-                loader = PyPDFLoader(file_path)
-            elif file_path.endswith('.docx'):
-                loader = Docx2txtLoader(file_path)
-            elif file_path.endswith('.txt'):
-                loader = TextLoader(file_path, encoding='utf-8')
-            else:
-                raise ValueError(f"不支持的文件格式: {file_path}")
-
-            # 加载文档
-            documents = loader.load()
-
-            # 提取文本内容
-            text_content = '\n'.join([doc.page_content for doc in documents])
+            # 加载文档并提取文本内容
+            text_content = self.load_file_text(file_path)
 
             chunks = self.splitter.split_text(text_content)
 